@@ -0,0 +1,111 @@
+"""
+Compare benchmark results with the stored baseline
+
+Exits with status 1 if any benchmark got slower than the baseline by more
+than ``--threshold`` (a fraction, 0.25 = 25%), so it can gate CI.
+
+    pytest tests/test_performance.py --latency-json .benchmarks.json
+    python benchmarks/compare.py benchmarks/baseline.json .benchmarks.json
+
+Timings only compare on similar machines: a warning is printed when the
+two results were recorded with a different Python, CPU count or set of
+optional speedups. To update the baseline, run the benchmarks with
+``--latency-json benchmarks/baseline.json`` and commit the file.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List
+
+# Machine details that change timings
+MACHINE_KEYS = ("python", "cpus", "optional")
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.25,
+    metric: str = "median_us"
+) -> List[Dict[str, Any]]:
+    """One row per benchmark with its change and status
+
+    The status is ``regressed``, ``improved`` (faster by more than the
+    threshold), ``ok``, ``new`` (not in the baseline) or ``missing`` (not
+    in the current results).
+    """
+    rows = []
+    names = sorted(set(baseline["benchmarks"]) | set(current["benchmarks"]))
+    for name in names:
+        before = baseline["benchmarks"].get(name, {}).get(metric)
+        after = current["benchmarks"].get(name, {}).get(metric)
+        row: Dict[str, Any] = {"name": name, "baseline": before, "current": after, "change": None}
+        if before is None:
+            row["status"] = "new"
+        elif after is None:
+            row["status"] = "missing"
+        else:
+            row["change"] = after / before - 1
+            if row["change"] > threshold:
+                row["status"] = "regressed"
+            elif row["change"] < -threshold:
+                row["status"] = "improved"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return rows
+
+
+def machine_differences(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    before = baseline.get("machine", {})
+    after = current.get("machine", {})
+    return [
+        f"{key}: {before.get(key)} -> {after.get(key)}"
+        for key in MACHINE_KEYS
+        if before.get(key) != after.get(key)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline", help="stored baseline JSON")
+    parser.add_argument("current", help="results JSON of this run")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25,
+        help="allowed slowdown as a fraction (default 0.25)"
+    )
+    parser.add_argument("--metric", default="median_us", help="median_us, min_us or mean_us")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold, args.metric)
+    regressed = [row["name"] for row in rows if row["status"] == "regressed"]
+
+    if args.json:
+        print(json.dumps({"regressed": regressed, "benchmarks": rows}, indent=2))
+    else:
+        for difference in machine_differences(baseline, current):
+            print(f"warning: machine differs from the baseline ({difference})", file=sys.stderr)
+        print(f"{'benchmark':<24} {'baseline us':>12} {'current us':>12} {'change':>8}  status")
+        for row in rows:
+            before = f"{row['baseline']:.2f}" if row["baseline"] is not None else "-"
+            after = f"{row['current']:.2f}" if row["current"] is not None else "-"
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+            print(f"{row['name']:<24} {before:>12} {after:>12} {change:>8}  {row['status']}")
+
+    if regressed:
+        if not args.json:
+            print(
+                f"\n{len(regressed)} benchmark(s) regressed by more than {args.threshold:.0%}: "
+                + ", ".join(regressed),
+                file=sys.stderr
+            )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
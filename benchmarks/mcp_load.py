@@ -0,0 +1,217 @@
+"""
+Load test the MCP adapter with thousands of websocket connections
+
+Starts the fake Ollama server and one adapter process, then opens
+``--connections`` websockets from ``--clients`` processes. Once all are
+connected it reports the adapter's memory per connection, then
+``--active`` of the connections send requests back to back for
+``--duration`` seconds while the rest stay idle.
+
+    ulimit -n 65536
+    python benchmarks/mcp_load.py --connections 10000 --active 200 --duration 20
+
+Adapter settings are taken from the environment (``MCP_PING_INTERVAL``,
+``MCP_COMPRESSION``, ...), so configurations can be compared.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import websockets
+
+from rest_modes import wait_until
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS not found")
+
+
+async def probe(url: str) -> None:
+    async with websockets.connect(url) as ws:
+        await ws.recv()
+
+
+async def connect_all(url: str, count: int, parallel: int) -> Tuple[List[Any], int]:
+    connections = []
+    failures = 0
+    gate = asyncio.Semaphore(parallel)
+
+    async def connect() -> None:
+        nonlocal failures
+        async with gate:
+            try:
+                ws = await websockets.connect(url, open_timeout=60, max_size=None)
+                await ws.recv()
+                connections.append(ws)
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+                failures += 1
+
+    await asyncio.gather(*(connect() for _ in range(count)))
+    return connections, failures
+
+
+async def drive(connections: List[Any], method: str, duration: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    if method == "generate":
+        params = {"prompt": "Hi", "model": "llama3", "max_tokens": 16}
+    else:
+        params = {}
+
+    async def user(ws) -> None:
+        nonlocal errors
+        request_id = 0
+        while time.monotonic() < deadline:
+            request_id += 1
+            started = time.perf_counter()
+            try:
+                await ws.send(json.dumps({"id": request_id, "action": method, **params}))
+                reply = json.loads(await ws.recv())
+            except websockets.WebSocketException:
+                errors += 1
+                return
+            if reply.get("error") or reply.get("result", {}).get("status") != "success":
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(user(ws) for ws in connections))
+    return {"latencies": latencies, "errors": errors}
+
+
+async def run_client(args: tuple) -> Dict[str, Any]:
+    url, count, active, method, duration, parallel, barrier = args
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    connections, failures = await connect_all(url, count, parallel)
+    connect_time = time.perf_counter() - started
+
+    # Parent samples memory between the two barriers
+    await loop.run_in_executor(None, barrier.wait)
+    await loop.run_in_executor(None, barrier.wait)
+
+    result = await drive(connections[:active], method, duration)
+    result.update(connected=len(connections), failures=failures, connect_time=connect_time)
+    await asyncio.gather(*(ws.close() for ws in connections), return_exceptions=True)
+    return result
+
+
+def client_process(args: tuple, results: multiprocessing.Queue) -> None:
+    results.put(asyncio.run(run_client(args)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--active", type=int, default=100, help="connections sending requests")
+    parser.add_argument("--method", default="generate", help="generate, list_models or list_tools")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--parallel-connects", type=int, default=200, help="per client process")
+    parser.add_argument("--mcp-port", type=int, default=8180)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    ollama_url = f"http://127.0.0.1:{args.ollama_port}"
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "ollama_client.utils.fake_ollama",
+            "--port", str(args.ollama_port), "--tokens", "3",
+        ],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    adapter = subprocess.Popen(
+        [
+            sys.executable, "-m", "ollama_client.main", "mcp",
+            "--host", "127.0.0.1", "--port", str(args.mcp_port), "--ollama-host", ollama_url,
+        ],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT, "MCP_METRICS_PORT": "0"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"ws://127.0.0.1:{args.mcp_port}"
+    processes = []
+    try:
+        wait_until(f"{ollama_url}/api/tags")
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                asyncio.run(probe(url))
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+        baseline = rss_kib(adapter.pid)
+
+        barrier = multiprocessing.Barrier(args.clients + 1)
+        results_queue: multiprocessing.Queue = multiprocessing.Queue()
+        per_client = args.connections // args.clients
+        active = args.active // args.clients
+        for _ in range(args.clients):
+            job = (url, per_client, active, args.method, args.duration, args.parallel_connects, barrier)
+            process = multiprocessing.Process(target=client_process, args=(job, results_queue))
+            process.start()
+            processes.append(process)
+
+        barrier.wait()
+        time.sleep(1.0)
+        connected_rss = rss_kib(adapter.pid)
+        started = time.perf_counter()
+        barrier.wait()
+        results = [results_queue.get(timeout=args.duration + 120) for _ in processes]
+        elapsed = time.perf_counter() - started
+        loaded_rss = rss_kib(adapter.pid)
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+        adapter.terminate()
+        adapter.wait(timeout=30)
+        fake.terminate()
+        fake.wait(timeout=30)
+
+    connected = sum(r["connected"] for r in results)
+    latencies = sorted(l for r in results for l in r["latencies"])
+    summary = {
+        "connections": connected,
+        "connect_failures": sum(r["failures"] for r in results),
+        "connect_seconds": max(r["connect_time"] for r in results),
+        "adapter_rss_mib": connected_rss / 1024,
+        "kib_per_connection": (connected_rss - baseline) / max(connected, 1),
+        "rss_under_load_mib": loaded_rss / 1024,
+        "requests": len(latencies),
+        "errors": sum(r["errors"] for r in results),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p90_ms": latencies[int(len(latencies) * 0.9)] * 1000 if latencies else None,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+    }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    for key, value in summary.items():
+        print(f"{key:<20} {value:.1f}" if isinstance(value, float) else f"{key:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
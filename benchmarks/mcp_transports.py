@@ -0,0 +1,190 @@
+"""
+Measure MCP adapter round-trip overhead per transport and framing
+
+Starts the fake Ollama server and the adapter (``python -m
+ollama_client.main mcp``) once over a websocket and once over stdio, then
+sends sequential requests with the original framing, with JSON-RPC and as
+JSON-RPC batches. ``list_tools`` never reaches Ollama, so its timings are
+the adapter and transport alone.
+
+    python benchmarks/mcp_transports.py --requests 2000 --batch 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import websockets
+
+from rest_modes import wait_until
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Call = Callable[[str], Awaitable[str]]
+
+
+def adapter_command(ollama_url: str, *extra: str) -> List[str]:
+    return [
+        sys.executable, "-m", "ollama_client.main", "mcp",
+        "--host", "127.0.0.1", "--ollama-host", ollama_url, *extra,
+    ]
+
+
+def adapter_env() -> Dict[str, str]:
+    return {**os.environ, "PYTHONPATH": ROOT, "MCP_METRICS_PORT": "0"}
+
+
+def summarize(name: str, latencies: List[float], calls_per_round_trip: int = 1) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "scenario": name,
+        "round_trips": len(latencies),
+        "us_per_call": statistics.mean(latencies) / calls_per_round_trip * 1e6,
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+async def measure(call: Call, messages: List[str], rounds: int) -> List[float]:
+    latencies = []
+    for i in range(rounds):
+        message = messages[i % len(messages)]
+        started = time.perf_counter()
+        await call(message)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def scenarios(method: str, batch: int) -> Dict[str, List[str]]:
+    rpc = [json.dumps({"jsonrpc": "2.0", "id": i, "method": method}) for i in range(100)]
+    return {
+        "legacy": [json.dumps({"id": i, "action": method}) for i in range(100)],
+        "jsonrpc": rpc,
+        f"batch{batch}": [
+            json.dumps([{"jsonrpc": "2.0", "id": j, "method": method} for j in range(batch)])
+        ],
+    }
+
+
+async def run_websocket(args: argparse.Namespace, ollama_url: str) -> List[Dict[str, Any]]:
+    server = subprocess.Popen(
+        adapter_command(ollama_url, "--port", str(args.mcp_port)),
+        cwd=ROOT, env=adapter_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"ws://127.0.0.1:{args.mcp_port}"
+    results = []
+    try:
+        for _ in range(100):
+            try:
+                async with websockets.connect(url):
+                    break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        handshakes = []
+        for _ in range(50):
+            started = time.perf_counter()
+            async with websockets.connect(url) as ws:
+                await ws.recv()
+                handshakes.append(time.perf_counter() - started)
+        results.append(summarize("websocket connect+tools", handshakes))
+
+        async with websockets.connect(url) as ws:
+            await ws.recv()
+
+            async def call(message: str) -> str:
+                await ws.send(message)
+                return await ws.recv()
+
+            for method in args.methods.split(","):
+                for name, messages in scenarios(method, args.batch).items():
+                    calls = args.batch if name.startswith("batch") else 1
+                    await measure(call, messages, 50)
+                    latencies = await measure(call, messages, max(1, args.requests // calls))
+                    results.append(summarize(f"websocket {name} {method}", latencies, calls))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return results
+
+
+async def run_stdio(args: argparse.Namespace, ollama_url: str) -> List[Dict[str, Any]]:
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *adapter_command(ollama_url, "--stdio"),
+        cwd=ROOT, env=adapter_env(),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        limit=16 * 1024 * 1024
+    )
+
+    async def call(message: str) -> str:
+        process.stdin.write(message.encode() + b"\n")
+        await process.stdin.drain()
+        return (await process.stdout.readline()).decode()
+
+    await call(json.dumps({"jsonrpc": "2.0", "id": 0, "method": "list_tools"}))
+    results = [summarize("stdio spawn+tools", [time.perf_counter() - started])]
+    try:
+        for method in args.methods.split(","):
+            # The original framing works over stdio too, but JSON-RPC is what it is for
+            for name, messages in scenarios(method, args.batch).items():
+                if name == "legacy":
+                    continue
+                calls = args.batch if name.startswith("batch") else 1
+                await measure(call, messages, 50)
+                latencies = await measure(call, messages, max(1, args.requests // calls))
+                results.append(summarize(f"stdio {name} {method}", latencies, calls))
+    finally:
+        process.stdin.close()
+        await process.wait()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000, help="calls per scenario")
+    parser.add_argument("--batch", type=int, default=10, help="calls per JSON-RPC batch")
+    parser.add_argument("--methods", default="list_tools,list_models")
+    parser.add_argument("--mcp-port", type=int, default=8180)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    ollama_url = f"http://127.0.0.1:{args.ollama_port}"
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "ollama_client.utils.fake_ollama",
+            "--port", str(args.ollama_port), "--tokens", "3",
+        ],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until(f"{ollama_url}/api/tags")
+        results = asyncio.run(run_websocket(args, ollama_url))
+        results += asyncio.run(run_stdio(args, ollama_url))
+    finally:
+        fake.terminate()
+        fake.wait(timeout=30)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'scenario':<32} {'round trips':>11} {'us/call':>9} {'p50 us':>9} {'p99 us':>9}")
+    for r in results:
+        print(
+            f"{r['scenario']:<32} {r['round_trips']:>11} {r['us_per_call']:>9.0f} "
+            f"{r['p50_us']:>9.0f} {r['p99_us']:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
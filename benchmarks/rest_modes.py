@@ -0,0 +1,150 @@
+"""
+Compare REST API throughput in dev and prod serving modes
+
+Starts the fake Ollama server, then for each mode starts the API via
+``python -m ollama_client.main api``, waits for ``/ready`` and drives
+``POST /generate`` from several load processes for a fixed duration.
+
+    python benchmarks/rest_modes.py --duration 10 --concurrency 64 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+async def drive(url: str, concurrency: int, duration: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as http:
+        async def user() -> None:
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await http.post(url, json={"prompt": "Hi", "model": "llama3"})
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+
+    return {"latencies": latencies, "errors": errors}
+
+
+def load_process(args: tuple) -> Dict[str, Any]:
+    return asyncio.run(drive(*args))
+
+
+def run_mode(mode: str, args: argparse.Namespace, ollama_url: str) -> Dict[str, Any]:
+    command = [
+        sys.executable, "-m", "ollama_client.main", "api",
+        "--host", "127.0.0.1", "--port", str(args.api_port),
+        "--ollama-host", ollama_url, f"--{mode}",
+    ]
+    if mode == "prod":
+        command += ["--workers", str(args.workers)]
+
+    env = {**os.environ, "LOG_LEVEL": "WARNING", "PYTHONPATH": ROOT}
+    server = subprocess.Popen(
+        command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    try:
+        wait_until(f"{base_url}/ready")
+
+        per_process = max(1, args.concurrency // args.clients)
+        jobs = [(f"{base_url}/generate", per_process, args.duration)] * args.clients
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(load_process, jobs)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    latencies = sorted(l for r in results for l in r["latencies"])
+    errors = sum(r["errors"] for r in results)
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--modes", default="dev,prod")
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    ollama_url = f"http://127.0.0.1:{args.ollama_port}"
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "ollama_client.utils.fake_ollama", "--tokens", "3",
+            "--port", str(args.ollama_port), "--workers", str(args.workers),
+        ],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until(f"{ollama_url}/api/tags")
+        results = [run_mode(mode, args, ollama_url) for mode in args.modes.split(",")]
+    finally:
+        fake.terminate()
+        fake.wait(timeout=30)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<6} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(
+            f"{r['mode']:<6} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.1f} "
+            f"{r['p50_ms'] or 0:>8.1f} {r['p99_ms'] or 0:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure the wall-clock startup time of the command-line entry points
+
+Each command runs in a fresh interpreter ``--runs`` times and the median
+is reported, next to a bare ``python -c pass`` for reference. Commands
+that talk to Ollama point at a closed port, so they measure startup and
+fail fast. ``--budget-ms`` exits non-zero if any command is slower.
+
+    python benchmarks/startup.py --runs 11 --budget-ms 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLOSED = "http://127.0.0.1:9"
+
+COMMANDS = {
+    "python -c pass": ["-c", "pass"],
+    "main --help": ["-m", "ollama_client.main", "--help"],
+    "main health": ["-m", "ollama_client.main", "health", "--host", CLOSED],
+    "cli health": ["-m", "ollama_client.interfaces.shell.cli", "health", "--host", CLOSED],
+    "shell prompt + exit": ["-m", "ollama_client.main", "shell", "--host", CLOSED],
+}
+
+
+def measure(args: List[str], runs: int) -> List[float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            input=b"exit\n",
+            cwd=ROOT,
+            env={**os.environ, "PYTHONPATH": ROOT},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail above this median")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    for name, command in COMMANDS.items():
+        timings = sorted(measure(command, args.runs))
+        results.append({
+            "command": name,
+            "median_ms": statistics.median(timings) * 1000,
+            "min_ms": timings[0] * 1000,
+            "max_ms": timings[-1] * 1000,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'command':<22} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+        for r in results:
+            print(f"{r['command']:<22} {r['median_ms']:>10.0f} {r['min_ms']:>8.0f} {r['max_ms']:>8.0f}")
+
+    if args.budget_ms is not None:
+        over = [r["command"] for r in results if r["median_ms"] > args.budget_ms]
+        if over:
+            print(f"Over the {args.budget_ms:.0f} ms budget: {', '.join(over)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Concurrent execution of JSONL batches of generate/chat requests
+"""
+
+import asyncio
+import json
+from collections import OrderedDict
+from contextlib import aclosing, nullcontext
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from pydantic import BaseModel, Field, ValidationError
+
+from ollama_client.core.client import AsyncOllamaClient
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Context manager factory held around each upstream call, e.g. an admission slot
+Slot = Callable[[], AsyncContextManager[Any]]
+
+
+class BatchRequest(BaseModel):
+    """A single line of a batch
+
+    ``type`` may be omitted; it is inferred from whether the line carries a
+    ``prompt`` (generate) or ``messages`` (chat).
+    """
+
+    id: Optional[Union[str, int]] = None
+    type: Optional[Literal["generate", "chat"]] = None
+    prompt: Optional[str] = None
+    messages: Optional[List[Dict[str, str]]] = None
+    model: str = "llama3"
+    temperature: float = Field(0.7, ge=0.0, le=1.0)
+    max_tokens: int = Field(512, gt=0)
+
+
+async def split_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without reading it all into memory"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+
+    if buffer.strip():
+        yield buffer
+
+
+async def execute(client: AsyncOllamaClient, request: BatchRequest) -> Dict[str, Any]:
+    """Run one batch request and return its result line"""
+    kind = request.type or ("chat" if request.messages is not None else "generate")
+
+    if kind == "chat":
+        if not request.messages:
+            raise ValueError("Messages are required")
+        response = await client.chat(
+            messages=request.messages,
+            model=request.model,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+        )
+        result: Dict[str, Any] = {
+            "message": {"role": "assistant", "content": response.text}
+        }
+    else:
+        if not request.prompt:
+            raise ValueError("Prompt is required")
+        response = await client.generate(
+            prompt=request.prompt,
+            model=request.model,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+        )
+        result = {"text": response.text}
+
+    return {
+        "id": request.id,
+        "status": "success",
+        **result,
+        "model": request.model,
+        "eval_count": response.eval_count,
+        "eval_duration": response.eval_duration,
+    }
+
+
+class Deduplicator:
+    """Runs identical requests once and shares the result
+
+    Requests are identical when everything but their ``id`` matches. A
+    duplicate of a running request waits for it; a duplicate of a finished
+    one reuses its result, for the ``size`` most recent successes. Failures
+    are shared with waiters but not kept, so a later duplicate retries.
+    """
+
+    def __init__(self, size: int = 10000):
+        self.size = size
+        self.hits = 0
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._running: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(request: BatchRequest) -> str:
+        return json.dumps(request.model_dump(exclude={"id"}), sort_keys=True)
+
+    async def run(
+        self, request: BatchRequest, work: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        key = self.key(request)
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+        if key in self._running:
+            self.hits += 1
+            return await asyncio.shield(self._running[key])
+
+        future = asyncio.ensure_future(work())
+        # Shielded from its first caller's cancellation, so it may fail unobserved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._running[key] = future
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            del self._running[key]
+        self._results[key] = result
+        if len(self._results) > self.size:
+            self._results.popitem(last=False)
+        return result
+
+
+async def execute_line(
+    client: AsyncOllamaClient,
+    line_no: int,
+    line: Union[str, bytes],
+    dedupe: Optional[Deduplicator] = None,
+    slot: Optional[Slot] = None,
+) -> Dict[str, Any]:
+    """Parse and run one JSONL line, turning any failure into an error result
+
+    Lines without an ``id`` are tagged with their 1-based line number. If
+    given, ``slot()`` is held while the request runs upstream.
+    """
+
+    async def run(request: BatchRequest) -> Dict[str, Any]:
+        async with slot() if slot is not None else nullcontext():
+            return await execute(client, request)
+
+    request_id: Any = line_no
+    try:
+        data = json.loads(line)
+        if isinstance(data, dict) and data.get("id") is not None:
+            request_id = data["id"]
+        request = BatchRequest.model_validate(data)
+        request.id = request_id
+        if dedupe is None:
+            return await run(request)
+        result = await dedupe.run(request, lambda: run(request))
+        return {**result, "id": request_id}
+    except json.JSONDecodeError as e:
+        return {"id": request_id, "status": "error", "error": f"Invalid JSON: {e}"}
+    except ValidationError as e:
+        return {"id": request_id, "status": "error", "error": f"Invalid request: {e}"}
+    except Exception as e:
+        return {"id": request_id, "status": "error", "error": str(e)}
+
+
+async def as_completed_bounded(
+    items: AsyncIterable[T], worker: Callable[[T], Awaitable[R]], concurrency: int
+) -> AsyncGenerator[R, None]:
+    """Run ``worker`` over ``items`` with at most ``concurrency`` in flight
+
+    Items are pulled only when a slot is free, so memory stays bounded by
+    ``concurrency`` however long the input is. Results are yielded in
+    completion order. Closing the generator cancels any work in flight.
+    """
+    iterator = items.__aiter__()
+    pending: "set[asyncio.Future[R]]" = set()
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(worker(item)))
+
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def run_batch(
+    client: AsyncOllamaClient,
+    lines: AsyncIterable[Union[str, bytes]],
+    concurrency: int = 8,
+    slot: Optional[Slot] = None,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Run JSONL request lines concurrently, yielding results as they finish
+
+    ``slot`` is passed to ``execute_line`` for each line.
+    """
+
+    async def numbered() -> AsyncIterator[Tuple[int, Union[str, bytes]]]:
+        line_no = 0
+        async for line in lines:
+            line_no += 1
+            yield line_no, line
+
+    async def worker(item: Tuple[int, Union[str, bytes]]) -> Dict[str, Any]:
+        line_no, line = item
+        return await execute_line(client, line_no, line, slot=slot)
+
+    results = as_completed_bounded(numbered(), worker, concurrency)
+    async with aclosing(results):
+        async for result in results:
+            yield result
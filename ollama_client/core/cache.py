@@ -0,0 +1,385 @@
+"""
+Semantic response cache keyed by prompt embeddings
+
+A lookup embeds the prompt (done by the client) and searches the stored
+prompt vectors of the same call type, model and generation options for the
+most similar one. If its cosine similarity reaches the model's threshold,
+the stored response is returned instead of generating a new one.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from ollama_client.utils.metrics import CACHE_ENTRIES, CACHE_LOOKUPS, CACHE_SIMILARITY
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+Vector = Sequence[float]
+
+
+def normalize(vector: Vector) -> List[float]:
+    """Scale a vector to unit length so a dot product is cosine similarity"""
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def namespace(kind: str, model: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """Cache partition of a call: its type, model and generation options"""
+    if not options:
+        return f"{kind}:{model}"
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()
+    return f"{kind}:{model}:{digest[:16]}"
+
+
+def parse_thresholds(value: str) -> Dict[str, float]:
+    """Parse per-model thresholds written as ``model=0.9,other=0.95``"""
+    thresholds = {}
+    for item in value.split(","):
+        model, _, threshold = item.strip().rpartition("=")
+        if model:
+            thresholds[model] = float(threshold)
+    return thresholds
+
+
+class BruteForceIndex:
+    """Exact search comparing the query with every stored vector
+
+    Uses a NumPy matrix when NumPy is installed and plain lists otherwise.
+    Vectors must already be normalized.
+    """
+
+    def __init__(self) -> None:
+        self._keys: List[int] = []
+        self._rows: Dict[int, int] = {}
+        self._vectors: Any = [] if np is None else None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: int, vector: Vector) -> None:
+        row = len(self._keys)
+        if np is None:
+            self._vectors.append(list(vector))
+        else:
+            if self._vectors is None:
+                self._vectors = np.empty((16, len(vector)), dtype=np.float32)
+            elif row == len(self._vectors):
+                grown = np.empty((row * 2, self._vectors.shape[1]), dtype=np.float32)
+                grown[:row] = self._vectors
+                self._vectors = grown
+            self._vectors[row] = vector
+        self._keys.append(key)
+        self._rows[key] = row
+
+    def remove(self, key: int) -> None:
+        # Move the last row into the gap so storage stays contiguous
+        row = self._rows.pop(key)
+        last = len(self._keys) - 1
+        if row != last:
+            moved = self._keys[last]
+            self._keys[row] = moved
+            self._rows[moved] = row
+            self._vectors[row] = self._vectors[last]
+        self._keys.pop()
+        if np is None:
+            self._vectors.pop()
+
+    def search(self, vector: Vector) -> Optional[Tuple[int, float]]:
+        """Return the most similar key and its similarity"""
+        if not self._keys:
+            return None
+        if np is None:
+            scores = [
+                sum(a * b for a, b in zip(row, vector, strict=True))
+                for row in self._vectors
+            ]
+            best = max(range(len(scores)), key=scores.__getitem__)
+            return self._keys[best], scores[best]
+        scores = self._vectors[: len(self._keys)] @ np.asarray(vector, dtype=np.float32)
+        best = int(np.argmax(scores))
+        return self._keys[best], float(scores[best])
+
+
+class LSHIndex(BruteForceIndex):
+    """Approximate search using random-hyperplane locality sensitive hashing
+
+    Each vector is hashed into one bucket per table by the signs of its
+    projections onto ``bits`` random hyperplanes. A query is only compared
+    exactly with the vectors sharing at least one bucket, so search cost
+    grows with bucket size rather than with the number of entries. Requires
+    NumPy.
+    """
+
+    def __init__(self, dimensions: int, tables: int = 8, bits: int = 10, seed: int = 0):
+        if np is None:
+            raise ImportError("LSHIndex requires numpy")
+        super().__init__()
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((tables, bits, dimensions)).astype(
+            np.float32
+        )
+        self._powers = 1 << np.arange(bits)
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(tables)]
+        self._signatures: Dict[int, List[int]] = {}
+
+    def _signature(self, vector: Vector) -> List[int]:
+        signs = (self._planes @ np.asarray(vector, dtype=np.float32)) > 0
+        signature: List[int] = (signs @ self._powers).tolist()
+        return signature
+
+    def add(self, key: int, vector: Vector) -> None:
+        super().add(key, vector)
+        signature = self._signature(vector)
+        self._signatures[key] = signature
+        for table, bucket in zip(self._buckets, signature, strict=True):
+            table.setdefault(bucket, set()).add(key)
+
+    def remove(self, key: int) -> None:
+        super().remove(key)
+        for table, bucket in zip(self._buckets, self._signatures.pop(key), strict=True):
+            members = table[bucket]
+            members.discard(key)
+            if not members:
+                del table[bucket]
+
+    def search(self, vector: Vector) -> Optional[Tuple[int, float]]:
+        candidates: Set[int] = set()
+        for table, bucket in zip(self._buckets, self._signature(vector), strict=True):
+            candidates.update(table.get(bucket, ()))
+        if not candidates:
+            return None
+        rows = np.fromiter((self._rows[key] for key in candidates), dtype=np.int64)
+        scores = self._vectors[rows] @ np.asarray(vector, dtype=np.float32)
+        best = int(np.argmax(scores))
+        return self._keys[int(rows[best])], float(scores[best])
+
+
+class _Entry:
+    __slots__ = ("namespace", "vector", "response", "created_at")
+
+    def __init__(
+        self,
+        namespace: str,
+        vector: List[float],
+        response: Dict[str, Any],
+        created_at: float,
+    ):
+        self.namespace = namespace
+        self.vector = vector
+        self.response = response
+        self.created_at = created_at
+
+
+class SemanticCache:
+    """Cache of generated responses looked up by prompt similarity
+
+    Entries are partitioned by call type, model and generation options
+    (such as ``max_tokens``), so an answer is only reused for the same
+    model asked the same way. The least
+    recently used entries are evicted beyond ``max_entries``, and entries
+    older than ``ttl`` seconds are ignored. A model's partition switches
+    from exact to approximate (LSH) search once it holds more than
+    ``approximate_above`` entries, if NumPy is installed.
+    """
+
+    def __init__(
+        self,
+        embed_model: str = "nomic-embed-text",
+        threshold: float = 0.95,
+        thresholds: Optional[Dict[str, float]] = None,
+        max_entries: int = 10000,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+        approximate_above: int = 5000,
+    ):
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.thresholds = thresholds or {}
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.approximate_above = approximate_above
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._indexes: Dict[str, BruteForceIndex] = {}
+        self._next_key = 0
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def threshold_for(self, model: str) -> float:
+        return self.thresholds.get(model, self.threshold)
+
+    def lookup(
+        self,
+        kind: str,
+        model: str,
+        vector: Vector,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Return the cached response for the most similar prompt, if close enough
+
+        Searching is CPU-bound (a full scan without NumPy), so async callers
+        should run it in a thread.
+        """
+        vector = normalize(vector)
+        with self._lock:
+            index = self._indexes.get(namespace(kind, model, options))
+            found = index.search(vector) if index is not None else None
+
+            if found is not None:
+                key, similarity = found
+                CACHE_SIMILARITY.labels(model).observe(similarity)
+                entry = self._entries[key]
+                if self.ttl is not None and time.time() - entry.created_at > self.ttl:
+                    self._remove(key)
+                elif similarity >= self.threshold_for(model):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    CACHE_LOOKUPS.labels(model, "hit").inc()
+                    return entry.response
+
+            self.misses += 1
+            CACHE_LOOKUPS.labels(model, "miss").inc()
+            return None
+
+    def store(
+        self,
+        kind: str,
+        model: str,
+        vector: Vector,
+        response: Dict[str, Any],
+        options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Add a response for the prompt embedded as ``vector``"""
+        with self._lock:
+            self._add(
+                namespace(kind, model, options),
+                normalize(vector),
+                response,
+                time.time(),
+            )
+
+    def _add(
+        self,
+        namespace: str,
+        vector: List[float],
+        response: Dict[str, Any],
+        created_at: float,
+    ) -> None:
+        key = self._next_key
+        self._next_key += 1
+
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = self._indexes[namespace] = BruteForceIndex()
+        elif (
+            np is not None
+            and not isinstance(index, LSHIndex)
+            and len(index) >= self.approximate_above
+        ):
+            index = self._indexes[namespace] = self._rebuild(namespace, len(vector))
+        index.add(key, vector)
+        self._entries[key] = _Entry(namespace, vector, response, created_at)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        CACHE_ENTRIES.set(len(self._entries))
+
+    def _rebuild(self, namespace: str, dimensions: int) -> LSHIndex:
+        index = LSHIndex(dimensions)
+        for key, entry in self._entries.items():
+            if entry.namespace == namespace:
+                index.add(key, entry.vector)
+        return index
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        self._indexes[entry.namespace].remove(key)
+        CACHE_ENTRIES.set(len(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+            CACHE_ENTRIES.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write all entries to a JSON file, replacing it atomically"""
+        path = path or self.path
+        if not path:
+            return
+
+        with self._lock:
+            entries = [
+                {
+                    "namespace": entry.namespace,
+                    "vector": base64.b64encode(
+                        array("f", entry.vector).tobytes()
+                    ).decode(),
+                    "response": entry.response,
+                    "created_at": entry.created_at,
+                }
+                for entry in self._entries.values()
+            ]
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"embed_model": self.embed_model, "entries": entries}, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        """Add the entries saved in ``path``, oldest first"""
+        with open(path) as f:
+            data = json.load(f)
+
+        if data.get("embed_model") != self.embed_model:
+            logger.warning(
+                f"Ignoring semantic cache {path}: built with "
+                f"{data.get('embed_model')}, not {self.embed_model}"
+            )
+            return
+
+        with self._lock:
+            for item in data.get("entries", []):
+                vector = array("f")
+                vector.frombytes(base64.b64decode(item["vector"]))
+                self._add(
+                    item["namespace"],
+                    vector.tolist(),
+                    item["response"],
+                    item["created_at"],
+                )
+
+
+def chat_text(messages: Iterable[Dict[str, str]]) -> str:
+    """Text embedded for a chat cache lookup: the whole conversation"""
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
@@ -1,9 +1,36 @@
-import httpx
-import json
 import asyncio
-from typing import List, Dict, Any, Optional
+import json
+import logging
+import time
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Type,
+    Union,
+)
+
+import httpx
 from pydantic import BaseModel
 
+from ollama_client.core.cache import SemanticCache, chat_text
+from ollama_client.core.exceptions import OllamaAPIError
+from ollama_client.core.structured import M, json_schema, parse_chunks, parse_stream
+from ollama_client.utils.metrics import (
+    TIME_TO_FIRST_TOKEN,
+    UPSTREAM_ERRORS,
+    UPSTREAM_REQUESTS,
+    error_type,
+    observe_usage,
+)
+
+logger = logging.getLogger(__name__)
+
+
 class ModelInfo(BaseModel):
     name: str
     size: int
@@ -11,6 +38,7 @@ class ModelInfo(BaseModel):
     digest: Optional[str] = None
     details: Optional[Dict[str, Any]] = None
 
+
 class GenerationResponse(BaseModel):
     text: str
     model: str
@@ -22,39 +50,59 @@ class GenerationResponse(BaseModel):
     eval_count: Optional[int] = None
     eval_duration: Optional[int] = None
 
+
 class OllamaClient:
-    def __init__(self, host: str = "http://localhost:11434"):
+    def __init__(
+        self,
+        host: str = "http://localhost:11434",
+        cache: Optional[SemanticCache] = None,
+    ):
         self.host = host.rstrip("/")
         self.headers = {"Content-Type": "application/json"}
-    
+        self.cache = cache
+
+    def __enter__(self) -> "OllamaClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Persist the cache; connections are not pooled, so nothing else is open"""
+        if self.cache is not None:
+            self.cache.save()
+
     def generate(
-        self, 
-        prompt: str, 
-        model: str = "llama3", 
+        self,
+        prompt: str,
+        model: str = "llama3",
         temperature: float = 0.7,
-        max_tokens: int = 512
+        max_tokens: int = 512,
     ) -> GenerationResponse:
         """Generate text based on the provided prompt"""
         url = f"{self.host}/api/generate"
-        
+
+        options = {"max_tokens": max_tokens}
+        vector = self._cache_vector(prompt, temperature)
+        if self.cache is not None and vector is not None:
+            cached = self.cache.lookup("generate", model, vector, options)
+            if cached is not None:
+                return GenerationResponse(**cached)
+
         payload = {
             "model": model,
             "prompt": prompt,
-            "temperature": temperature,
-            "max_tokens": max_tokens
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": False,
         }
-        
+
         with httpx.Client() as client:
-            response = client.post(
-                url,
-                json=payload,
-                headers=self.headers
-            )
-            
+            response = client.post(url, json=payload, headers=self.headers)
+
             response.raise_for_status()
             data = response.json()
-            
-            return GenerationResponse(
+
+            result = GenerationResponse(
                 text=data.get("response", ""),
                 model=model,
                 created_at=data.get("created_at"),
@@ -63,36 +111,36 @@ class OllamaClient:
                 load_duration=data.get("load_duration"),
                 prompt_eval_duration=data.get("prompt_eval_duration"),
                 eval_count=data.get("eval_count"),
-                eval_duration=data.get("eval_duration")
+                eval_duration=data.get("eval_duration"),
             )
-    
+
+        if self.cache is not None and vector is not None:
+            self.cache.store("generate", model, vector, result.model_dump(), options)
+        return result
+
     async def generate_async(
-        self, 
-        prompt: str, 
-        model: str = "llama3", 
+        self,
+        prompt: str,
+        model: str = "llama3",
         temperature: float = 0.7,
-        max_tokens: int = 512
+        max_tokens: int = 512,
     ) -> GenerationResponse:
         """Generate text asynchronously based on the provided prompt"""
         url = f"{self.host}/api/generate"
-        
+
         payload = {
             "model": model,
             "prompt": prompt,
-            "temperature": temperature,
-            "max_tokens": max_tokens
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": False,
         }
-        
+
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url,
-                json=payload,
-                headers=self.headers
-            )
-            
+            response = await client.post(url, json=payload, headers=self.headers)
+
             response.raise_for_status()
             data = response.json()
-            
+
             return GenerationResponse(
                 text=data.get("response", ""),
                 model=model,
@@ -102,140 +150,589 @@ class OllamaClient:
                 load_duration=data.get("load_duration"),
                 prompt_eval_duration=data.get("prompt_eval_duration"),
                 eval_count=data.get("eval_count"),
-                eval_duration=data.get("eval_duration")
+                eval_duration=data.get("eval_duration"),
             )
-    
+
     def list_models(self) -> List[ModelInfo]:
         """List all available models in Ollama"""
         url = f"{self.host}/api/tags"
-        
+
         with httpx.Client() as client:
             response = client.get(url, headers=self.headers)
             response.raise_for_status()
             data = response.json()
-            
+
             models = []
             for model_data in data.get("models", []):
-                models.append(ModelInfo(
-                    name=model_data.get("name"),
-                    size=model_data.get("size", 0),
-                    modified_at=model_data.get("modified_at", ""),
-                    digest=model_data.get("digest"),
-                    details=model_data.get("details")
-                ))
-            
+                models.append(
+                    ModelInfo(
+                        name=model_data.get("name"),
+                        size=model_data.get("size", 0),
+                        modified_at=model_data.get("modified_at", ""),
+                        digest=model_data.get("digest"),
+                        details=model_data.get("details"),
+                    )
+                )
+
             return models
-    
+
     async def list_models_async(self) -> List[ModelInfo]:
         """List all available models in Ollama asynchronously"""
         url = f"{self.host}/api/tags"
-        
+
         async with httpx.AsyncClient() as client:
             response = await client.get(url, headers=self.headers)
             response.raise_for_status()
             data = response.json()
-            
+
             models = []
             for model_data in data.get("models", []):
-                models.append(ModelInfo(
-                    name=model_data.get("name"),
-                    size=model_data.get("size", 0),
-                    modified_at=model_data.get("modified_at", ""),
-                    digest=model_data.get("digest"),
-                    details=model_data.get("details")
-                ))
-            
+                models.append(
+                    ModelInfo(
+                        name=model_data.get("name"),
+                        size=model_data.get("size", 0),
+                        modified_at=model_data.get("modified_at", ""),
+                        digest=model_data.get("digest"),
+                        details=model_data.get("details"),
+                    )
+                )
+
             return models
-    
+
     def create_model(
-        self,
-        name: str,
-        model_file: str,
-        system_prompt: Optional[str] = None
+        self, name: str, model_file: str, system_prompt: Optional[str] = None
     ) -> Dict[str, Any]:
         """Create a new model from a Modelfile"""
         url = f"{self.host}/api/create"
-        
+
         with open(model_file, "r") as f:
             modelfile = f.read()
-        
-        payload = {
-            "name": name,
-            "modelfile": modelfile
-        }
-        
+
+        payload = {"name": name, "modelfile": modelfile}
+
         if system_prompt:
             payload["system"] = system_prompt
-        
+
         with httpx.Client() as client:
-            response = client.post(
-                url,
-                json=payload,
-                headers=self.headers
-            )
-            
+            response = client.post(url, json=payload, headers=self.headers)
+
             response.raise_for_status()
             return response.json()
-    
+
     def delete_model(self, name: str) -> Dict[str, Any]:
         """Delete a model from Ollama"""
         url = f"{self.host}/api/delete"
-        
-        payload = {
-            "name": name
-        }
-        
+
+        payload = {"name": name}
+
         with httpx.Client() as client:
-            response = client.delete(
-                url,
-                json=payload,
-                headers=self.headers
-            )
-            
+            response = client.delete(url, json=payload, headers=self.headers)
+
             response.raise_for_status()
             return response.json()
-    
+
     def chat(
         self,
         messages: List[Dict[str, str]],
         model: str = "llama3",
         temperature: float = 0.7,
-        max_tokens: int = 512
+        max_tokens: int = 512,
     ) -> GenerationResponse:
         """Chat with the model using a list of messages"""
         url = f"{self.host}/api/chat"
-        
+
+        options = {"max_tokens": max_tokens}
+        vector = self._cache_vector(chat_text(messages), temperature)
+        if self.cache is not None and vector is not None:
+            cached = self.cache.lookup("chat", model, vector, options)
+            if cached is not None:
+                return GenerationResponse(**cached)
+
         payload = {
             "model": model,
             "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": False,
         }
-        
+
         with httpx.Client() as client:
-            response = client.post(
-                url,
-                json=payload,
-                headers=self.headers
-            )
-            
+            response = client.post(url, json=payload, headers=self.headers)
+
             response.raise_for_status()
             data = response.json()
-            
-            return GenerationResponse(
+
+            result = GenerationResponse(
                 text=data.get("message", {}).get("content", ""),
                 model=model,
                 created_at=data.get("created_at"),
-                done=True
+                done=True,
+            )
+
+        if self.cache is not None and vector is not None:
+            self.cache.store("chat", model, vector, result.model_dump(), options)
+        return result
+
+    def generate_stream(
+        self,
+        prompt: str,
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        format: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Stream raw generation chunks as Ollama produces them
+
+        ``format`` constrains the output: ``"json"`` or a JSON schema.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": True,
+        }
+        if format is not None:
+            payload["format"] = format
+
+        yield from self._stream("generate", payload)
+
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        format: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Stream raw chat chunks as Ollama produces them
+
+        ``format`` constrains the output: ``"json"`` or a JSON schema.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": True,
+        }
+        if format is not None:
+            payload["format"] = format
+
+        yield from self._stream("chat", payload)
+
+    def generate_structured(
+        self,
+        prompt: str,
+        schema: Type[M],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> M:
+        """Generate an instance of the pydantic model ``schema``
+
+        The output is constrained to the model's JSON schema and parsed as
+        it streams. Generation stops as soon as the JSON is complete, or
+        has become invalid, which raises ``StructuredOutputError``.
+        """
+        chunks = self.generate_stream(
+            prompt, model, temperature, max_tokens, format=json_schema(schema)
+        )
+        return parse_chunks(chunks, schema)
+
+    def chat_structured(
+        self,
+        messages: List[Dict[str, str]],
+        schema: Type[M],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> M:
+        """Like ``generate_structured``, for the reply to a conversation"""
+        chunks = self.chat_stream(
+            messages, model, temperature, max_tokens, format=json_schema(schema)
+        )
+        return parse_chunks(chunks, schema)
+
+    def _stream(
+        self, endpoint: str, payload: Dict[str, Any]
+    ) -> Generator[Dict[str, Any], None, None]:
+        """POST a streaming request to ``/api/<endpoint>`` and yield each chunk
+
+        Closing the generator closes the connection, which makes Ollama
+        stop decoding. There is no read timeout, as loading a model can
+        take minutes before the first chunk.
+        """
+        url = f"{self.host}/api/{endpoint}"
+        timeout = httpx.Timeout(None, connect=10.0)
+
+        with httpx.Client(timeout=timeout) as client:
+            with client.stream(
+                "POST", url, json=payload, headers=self.headers
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+
+    def embed(
+        self, input: Union[str, List[str]], model: str = "nomic-embed-text"
+    ) -> List[List[float]]:
+        """Embed one or more texts"""
+        url = f"{self.host}/api/embed"
+
+        with httpx.Client() as client:
+            response = client.post(
+                url, json={"model": model, "input": input}, headers=self.headers
             )
-    
+
+            response.raise_for_status()
+            embeddings: List[List[float]] = response.json()["embeddings"]
+            return embeddings
+
+    def _cache_vector(self, text: str, temperature: float) -> Optional[List[float]]:
+        """Embed ``text`` for a semantic cache lookup; None if the call is not cached
+
+        Only deterministic calls (temperature 0) are cached. An empty prompt
+        only loads the model, so it is never cached either.
+        """
+        if self.cache is None or temperature != 0 or not text:
+            return None
+        try:
+            return self.embed(text, model=self.cache.embed_model)[0]
+        except Exception as e:
+            logger.warning(f"Semantic cache bypassed, embedding failed: {e}")
+            return None
+
     def health(self) -> bool:
         """Check if Ollama is running"""
         url = f"{self.host}/api/health"
-        
+
         try:
             with httpx.Client() as client:
                 response = client.get(url)
                 return response.status_code == 200
         except Exception:
-            return False
\ No newline at end of file
+            return False
+
+
+class AsyncOllamaClient:
+    """Asynchronous Ollama client sharing one connection pool across calls
+
+    Unlike ``OllamaClient``, which opens a new HTTP connection per call, this
+    client keeps a single ``httpx.AsyncClient`` alive so it can be shared by
+    many concurrent coroutines (e.g. every request of a REST worker). Call
+    ``aclose()`` or use it as an async context manager to release the pool.
+    """
+
+    def __init__(
+        self,
+        host: str = "http://localhost:11434",
+        timeout: float = 300.0,
+        max_connections: int = 100,
+        cache: Optional[SemanticCache] = None,
+    ):
+        self.host = host.rstrip("/")
+        self.headers = {"Content-Type": "application/json"}
+        self.cache = cache
+        self._client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def __aenter__(self) -> "AsyncOllamaClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the underlying connection pool and persist the cache"""
+        await self._client.aclose()
+        if self.cache is not None:
+            self.cache.save()
+
+    async def generate(
+        self,
+        prompt: str,
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> GenerationResponse:
+        """Generate text based on the provided prompt"""
+        options = {"max_tokens": max_tokens}
+        vector = await self._cache_vector(prompt, temperature)
+        if self.cache is not None and vector is not None:
+            # A lookup scans the cache, so it runs off the event loop
+            cached = await asyncio.to_thread(
+                self.cache.lookup, "generate", model, vector, options
+            )
+            if cached is not None:
+                return GenerationResponse(**cached)
+
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": False,
+        }
+
+        data = await self._post("generate", payload)
+        response = _generation_response(data, data.get("response", ""), model)
+        if self.cache is not None and vector is not None:
+            await asyncio.to_thread(
+                self.cache.store,
+                "generate",
+                model,
+                vector,
+                response.model_dump(),
+                options,
+            )
+        return response
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> GenerationResponse:
+        """Chat with the model using a list of messages"""
+        options = {"max_tokens": max_tokens}
+        vector = await self._cache_vector(chat_text(messages), temperature)
+        if self.cache is not None and vector is not None:
+            cached = await asyncio.to_thread(
+                self.cache.lookup, "chat", model, vector, options
+            )
+            if cached is not None:
+                return GenerationResponse(**cached)
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": False,
+        }
+
+        data = await self._post("chat", payload)
+        response = _generation_response(
+            data, data.get("message", {}).get("content", ""), model
+        )
+        if self.cache is not None and vector is not None:
+            await asyncio.to_thread(
+                self.cache.store, "chat", model, vector, response.model_dump(), options
+            )
+        return response
+
+    async def embed(
+        self, input: Union[str, List[str]], model: str = "nomic-embed-text"
+    ) -> List[List[float]]:
+        """Embed one or more texts"""
+        data = await self._post("embed", {"model": model, "input": input})
+        embeddings: List[List[float]] = data["embeddings"]
+        return embeddings
+
+    async def _cache_vector(
+        self, text: str, temperature: float
+    ) -> Optional[List[float]]:
+        """Embed ``text`` for a semantic cache lookup; None if the call is not cached
+
+        Only deterministic calls (temperature 0) are cached. An empty prompt
+        only loads the model, so it is never cached either.
+        """
+        if self.cache is None or temperature != 0 or not text:
+            return None
+        try:
+            return (await self.embed(text, model=self.cache.embed_model))[0]
+        except Exception as e:
+            logger.warning(f"Semantic cache bypassed, embedding failed: {e}")
+            return None
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        format: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream raw generation chunks as Ollama produces them
+
+        ``format`` constrains the output: ``"json"`` or a JSON schema.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": True,
+        }
+        if format is not None:
+            payload["format"] = format
+
+        async for chunk in self._stream("generate", payload):
+            yield chunk
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        format: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream raw chat chunks as Ollama produces them
+
+        ``format`` constrains the output: ``"json"`` or a JSON schema.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": True,
+        }
+        if format is not None:
+            payload["format"] = format
+
+        async for chunk in self._stream("chat", payload):
+            yield chunk
+
+    async def generate_structured(
+        self,
+        prompt: str,
+        schema: Type[M],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> M:
+        """Generate an instance of the pydantic model ``schema``
+
+        The output is constrained to the model's JSON schema and parsed as
+        it streams. Generation stops as soon as the JSON is complete, or
+        has become invalid, which raises ``StructuredOutputError``.
+        """
+        chunks = self.generate_stream(
+            prompt, model, temperature, max_tokens, format=json_schema(schema)
+        )
+        return await parse_stream(chunks, schema)
+
+    async def chat_structured(
+        self,
+        messages: List[Dict[str, str]],
+        schema: Type[M],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> M:
+        """Like ``generate_structured``, for the reply to a conversation"""
+        chunks = self.chat_stream(
+            messages, model, temperature, max_tokens, format=json_schema(schema)
+        )
+        return await parse_stream(chunks, schema)
+
+    async def _post(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a non-streaming request to ``/api/<endpoint>``"""
+        UPSTREAM_REQUESTS.labels(endpoint).inc()
+        try:
+            response = await self._client.post(
+                f"{self.host}/api/{endpoint}", json=payload
+            )
+            response.raise_for_status()
+            data: Dict[str, Any] = response.json()
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(endpoint, error_type(e)).inc()
+            raise
+
+        observe_usage(payload["model"], data)
+        return data
+
+    async def _stream(
+        self, endpoint: str, payload: Dict[str, Any]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """POST a streaming request to ``/api/<endpoint>`` and yield each chunk
+
+        Closing the generator closes the upstream response, which makes
+        Ollama stop decoding.
+        """
+        model = payload["model"]
+        url = f"{self.host}/api/{endpoint}"
+        UPSTREAM_REQUESTS.labels(endpoint).inc()
+        started = time.perf_counter()
+        first = True
+        try:
+            async with self._client.stream("POST", url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if first:
+                        TIME_TO_FIRST_TOKEN.labels(model).observe(
+                            time.perf_counter() - started
+                        )
+                        first = False
+                    if chunk.get("done"):
+                        observe_usage(model, chunk)
+                    yield chunk
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(endpoint, error_type(e)).inc()
+            raise
+
+    async def list_models(self) -> List[ModelInfo]:
+        """List all available models in Ollama"""
+        response = await self._client.get(f"{self.host}/api/tags")
+        response.raise_for_status()
+        data = response.json()
+
+        return [
+            ModelInfo(
+                name=model_data.get("name"),
+                size=model_data.get("size", 0),
+                modified_at=model_data.get("modified_at", ""),
+                digest=model_data.get("digest"),
+                details=model_data.get("details"),
+            )
+            for model_data in data.get("models", [])
+        ]
+
+    async def health(self) -> bool:
+        """Check if Ollama is running"""
+        try:
+            response = await self._client.get(f"{self.host}/api/health")
+            return response.status_code == 200
+        except Exception:
+            return False
+
+
+async def collect_stream(
+    chunks: AsyncIterator[Dict[str, Any]], model: str
+) -> GenerationResponse:
+    """Join a generate or chat stream into the response of the non-streaming call"""
+    text: List[str] = []
+    final: Dict[str, Any] = {"done": False}
+    async for chunk in chunks:
+        if "error" in chunk:
+            raise OllamaAPIError(f"Ollama stream failed: {chunk['error']}")
+        text.append(
+            chunk.get("response") or chunk.get("message", {}).get("content") or ""
+        )
+        if chunk.get("done"):
+            final = chunk
+    return _generation_response(final, "".join(text), model)
+
+
+def _generation_response(
+    data: Dict[str, Any], text: str, model: str
+) -> GenerationResponse:
+    """Build a GenerationResponse from an Ollama response body"""
+    return GenerationResponse(
+        text=text,
+        model=model,
+        created_at=data.get("created_at"),
+        done=data.get("done", True),
+        total_duration=data.get("total_duration"),
+        load_duration=data.get("load_duration"),
+        prompt_eval_duration=data.get("prompt_eval_duration"),
+        eval_count=data.get("eval_count"),
+        eval_duration=data.get("eval_duration"),
+    )
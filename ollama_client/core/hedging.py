@@ -0,0 +1,390 @@
+"""
+Hedged requests across several Ollama hosts
+
+Each request goes to one host, chosen round-robin. If it has not answered
+after a delay (the ``percentile`` of recent times to the first token for
+generations, or to the response otherwise), the same request is sent to
+the next host, and whichever answers first is kept. The other is
+cancelled, which closes its connection and makes that Ollama stop
+generating. Non-streaming generations are streamed internally for this,
+so a long but healthy generation is never sent twice.
+
+Hedges are paid for out of a budget: every request adds ``budget`` to it
+and a hedge takes 1, so in the long run at most that fraction of requests
+is sent twice, however slow the hosts get.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from ollama_client.core.cache import SemanticCache, chat_text
+from ollama_client.core.client import (
+    AsyncOllamaClient,
+    GenerationResponse,
+    ModelInfo,
+    collect_stream,
+)
+from ollama_client.core.structured import M, json_schema, parse_stream
+from ollama_client.utils.config import HEDGING_OPTIONS
+from ollama_client.utils.metrics import HEDGED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+Chunks = AsyncGenerator[Dict[str, Any], None]
+
+
+class LatencyTracker:
+    """The most recent latencies of one kind of request"""
+
+    def __init__(self, window: int = 500, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The ``q`` percentile, or None until ``min_samples`` are recorded"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class HedgeBudget:
+    """Credit for hedges: ``ratio`` per request, up to ``burst``, 1 per hedge"""
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.balance = burst
+
+    def deposit(self) -> None:
+        self.balance = min(self.burst, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class HedgedOllamaClient:
+    """``AsyncOllamaClient`` interface over several hosts, with hedged requests
+
+    Until ``min_samples`` requests of a kind have been seen, hedges are
+    sent after ``initial_delay``. The delay is kept between ``min_delay``
+    and ``max_delay``. ``cache`` is a semantic cache shared by all hosts.
+    Other keyword arguments are passed to each host's ``AsyncOllamaClient``.
+    """
+
+    def __init__(
+        self,
+        hosts: Sequence[str],
+        percentile: float = 0.95,
+        budget: float = 0.1,
+        burst: float = 10.0,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.05,
+        max_delay: float = 5.0,
+        min_samples: int = 20,
+        cache: Optional[SemanticCache] = None,
+        **client_options: Any,
+    ):
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.clients = [
+            AsyncOllamaClient(host=host, **client_options) for host in hosts
+        ]
+        self.cache = cache
+        self.host = ", ".join(client.host for client in self.clients)
+        self.percentile = percentile
+        self.budget = HedgeBudget(budget, burst)
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.stats = {"requests": 0, "hedged": 0, "won": 0, "throttled": 0}
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._next = 0
+
+    async def __aenter__(self) -> "HedgedOllamaClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close every host's connection pool and persist the cache"""
+        await asyncio.gather(*(client.aclose() for client in self.clients))
+        if self.cache is not None:
+            self.cache.save()
+
+    def delay(self, endpoint: str) -> float:
+        """Seconds to wait for ``endpoint`` before sending a hedge"""
+        tracker = self._trackers.get(endpoint)
+        value = tracker.percentile(self.percentile) if tracker is not None else None
+        if value is None:
+            value = self.initial_delay
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def _pick(self) -> Tuple[AsyncOllamaClient, Optional[AsyncOllamaClient]]:
+        """The primary host of the next request and the host of its hedge"""
+        index = self._next
+        self._next = (index + 1) % len(self.clients)
+        if len(self.clients) == 1:
+            return self.clients[0], None
+        return self.clients[index], self.clients[(index + 1) % len(self.clients)]
+
+    async def _race(
+        self,
+        endpoint: str,
+        attempt: Callable[[AsyncOllamaClient], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """Run ``attempt`` on one host, hedged on another if it is slow
+
+        ``discard`` releases the result of an attempt that finished but
+        lost, such as an open stream.
+        """
+        self.stats["requests"] += 1
+        self.budget.deposit()
+        tracker = self._trackers.setdefault(
+            endpoint, LatencyTracker(min_samples=self.min_samples)
+        )
+        primary_client, hedge_client = self._pick()
+        started = time.perf_counter()
+
+        primary = asyncio.ensure_future(attempt(primary_client))
+        hedge: Optional[asyncio.Future] = None
+        winner: Optional[asyncio.Future] = None
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay(endpoint))
+            if not done and hedge_client is not None:
+                if self.budget.withdraw():
+                    hedge = asyncio.ensure_future(attempt(hedge_client))
+                    tasks.add(hedge)
+                    self.stats["hedged"] += 1
+                else:
+                    self.stats["throttled"] += 1
+                    HEDGED_REQUESTS.labels(endpoint, "throttled").inc()
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # The primary first, so it wins a tie
+                for task in sorted(done, key=lambda task: task is not primary):
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                    elif winner is None:
+                        winner = task
+            if winner is None:
+                assert error is not None
+                raise error
+
+            tracker.observe(time.perf_counter() - started)
+            if hedge is not None:
+                won = winner is hedge
+                self.stats["won"] += int(won)
+                HEDGED_REQUESTS.labels(endpoint, "won" if won else "lost").inc()
+            result: T = winner.result()
+            return result
+        finally:
+            losers = [task for task in tasks if task is not winner]
+            for task in losers:
+                task.cancel()
+            await asyncio.gather(*losers, return_exceptions=True)
+            if discard is not None:
+                for task in losers:
+                    if not task.cancelled() and task.exception() is None:
+                        await discard(task.result())
+
+    async def _stream(
+        self, endpoint: str, open_stream: Callable[[AsyncOllamaClient], Chunks]
+    ) -> Chunks:
+        """Race streams to their first chunk and continue with the winner"""
+
+        async def attempt(
+            client: AsyncOllamaClient,
+        ) -> Tuple[Chunks, Optional[Dict[str, Any]]]:
+            chunks = open_stream(client)
+            try:
+                return chunks, await chunks.__anext__()
+            except StopAsyncIteration:
+                return chunks, None
+            except BaseException:
+                await chunks.aclose()
+                raise
+
+        async def discard(result: Tuple[Chunks, Optional[Dict[str, Any]]]) -> None:
+            await result[0].aclose()
+
+        chunks, first = await self._race(endpoint, attempt, discard)
+        async with aclosing(chunks):
+            if first is None:
+                return
+            yield first
+            async for chunk in chunks:
+                yield chunk
+
+    async def generate(
+        self,
+        prompt: str,
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> GenerationResponse:
+        """Generate text, hedged on the time to the first token"""
+        options = {"max_tokens": max_tokens}
+        vector = await self._cache_vector(prompt, temperature)
+        if vector is not None and self.cache is not None:
+            cached = await asyncio.to_thread(
+                self.cache.lookup, "generate", model, vector, options
+            )
+            if cached is not None:
+                return GenerationResponse(**cached)
+
+        chunks = self._stream(
+            "generate",
+            lambda client: client.generate_stream(
+                prompt, model, temperature, max_tokens
+            ),
+        )
+        response = await collect_stream(chunks, model)
+        if vector is not None and self.cache is not None:
+            await asyncio.to_thread(
+                self.cache.store,
+                "generate",
+                model,
+                vector,
+                response.model_dump(),
+                options,
+            )
+        return response
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "llama3",
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ) -> GenerationResponse:
+        """Chat with the model, hedged on the time to the first token"""
+        options = {"max_tokens": max_tokens}
+        vector = await self._cache_vector(chat_text(messages), temperature)
+        if vector is not None and self.cache is not None:
+            cached = await asyncio.to_thread(
+                self.cache.lookup, "chat", model, vector, options
+            )
+            if cached is not None:
+                return GenerationResponse(**cached)
+
+        chunks = self._stream(
+            "chat",
+            lambda client: client.chat_stream(messages, model, temperature, max_tokens),
+        )
+        response = await collect_stream(chunks, model)
+        if vector is not None and self.cache is not None:
+            await asyncio.to_thread(
+                self.cache.store, "chat", model, vector, response.model_dump(), options
+            )
+        return response
+
+    async def _cache_vector(
+        self, text: str, temperature: float
+    ) -> Optional[List[float]]:
+        """Embed ``text`` for a semantic cache lookup, as ``AsyncOllamaClient`` does"""
+        if self.cache is None or temperature != 0 or not text:
+            return None
+        try:
+            return (await self.embed(text, model=self.cache.embed_model))[0]
+        except Exception as e:
+            logger.warning(f"Semantic cache bypassed, embedding failed: {e}")
+            return None
+
+    async def embed(self, *args: Any, **kwargs: Any) -> List[List[float]]:
+        return await self._race("embed", lambda client: client.embed(*args, **kwargs))
+
+    def generate_stream(self, *args: Any, **kwargs: Any) -> Chunks:
+        return self._stream(
+            "generate_stream", lambda client: client.generate_stream(*args, **kwargs)
+        )
+
+    def chat_stream(self, *args: Any, **kwargs: Any) -> Chunks:
+        return self._stream(
+            "chat_stream", lambda client: client.chat_stream(*args, **kwargs)
+        )
+
+    async def generate_structured(
+        self, prompt: str, schema: Type[M], *args: Any, **kwargs: Any
+    ) -> M:
+        """``AsyncOllamaClient.generate_structured``, hedged like ``generate_stream``"""
+        chunks = self.generate_stream(
+            prompt, *args, format=json_schema(schema), **kwargs
+        )
+        return await parse_stream(chunks, schema)
+
+    async def chat_structured(
+        self, messages: List[Dict[str, str]], schema: Type[M], *args: Any, **kwargs: Any
+    ) -> M:
+        chunks = self.chat_stream(messages, *args, format=json_schema(schema), **kwargs)
+        return await parse_stream(chunks, schema)
+
+    async def list_models(self) -> List[ModelInfo]:
+        return await self._race("list_models", lambda client: client.list_models())
+
+    async def health(self) -> bool:
+        """True if any host is up"""
+        return any(await asyncio.gather(*(client.health() for client in self.clients)))
+
+
+# Either client, as returned by ``connect``
+Client = Union[AsyncOllamaClient, HedgedOllamaClient]
+
+
+def hedging_options() -> Dict[str, Any]:
+    """``HedgedOllamaClient`` settings given in the environment"""
+    options = {}
+    for key, (env_name, cast) in HEDGING_OPTIONS.items():
+        if os.environ.get(env_name):
+            options[key] = cast(os.environ[env_name])
+    return options
+
+
+def connect(
+    host: str, hedging: Optional[Dict[str, Any]] = None, **options: Any
+) -> Client:
+    """A client for ``host``, hedging if it lists several hosts separated by commas
+
+    ``hedging`` holds ``HedgedOllamaClient`` settings; ``options`` go to
+    every ``AsyncOllamaClient``.
+    """
+    hosts = [h.strip() for h in host.split(",") if h.strip()]
+    if len(hosts) > 1:
+        return HedgedOllamaClient(hosts, **(hedging or {}), **options)
+    return AsyncOllamaClient(host=host.strip(), **options)
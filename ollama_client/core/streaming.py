@@ -0,0 +1,132 @@
+"""
+Helpers for consuming Ollama's streamed responses
+"""
+
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from ollama_client.core.exceptions import OllamaAPIError
+
+# Fields of the final Ollama chunk that are reported in the "done" event
+USAGE_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+
+def usage_event(chunk: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """Build the terminal event from the final Ollama chunk"""
+    event = {"type": "done", "model": model}
+    for field in USAGE_FIELDS:
+        if chunk.get(field) is not None:
+            event[field] = chunk[field]
+
+    if chunk.get("eval_count") and chunk.get("eval_duration"):
+        seconds = chunk["eval_duration"] / 1e9
+        event["tokens_per_second"] = chunk["eval_count"] / seconds
+
+    return event
+
+
+async def stream_events(
+    chunks: AsyncGenerator[Dict[str, Any], None],
+    extract_text: Callable[[Dict[str, Any]], str],
+    model: str,
+    on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Translate Ollama chunks into token events followed by a done event
+
+    Each chunk is forwarded as soon as it arrives; nothing is buffered.
+    Upstream errors after the first event become a terminal error event,
+    since the status code has already been sent: an ``{"error": ...}``
+    chunk, a failed request, or a stream that ends without its final
+    chunk. ``on_done`` receives the done event before it is sent.
+    """
+    async with aclosing(chunks):
+        try:
+            async for chunk in chunks:
+                if "error" in chunk:
+                    raise OllamaAPIError(f"Ollama stream failed: {chunk['error']}")
+                text = extract_text(chunk)
+                if text:
+                    yield {"type": "token", "text": text}
+                if chunk.get("done"):
+                    event = usage_event(chunk, model)
+                    if on_done is not None:
+                        on_done(event)
+                    yield event
+                    return
+            raise OllamaAPIError("Ollama stream ended before the final chunk")
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+
+
+async def coalesce_tokens(
+    events: AsyncGenerator[Dict[str, Any], None],
+    max_delay: float = 0.05,
+    max_chars: int = 64,
+    max_queued: int = 256,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Merge consecutive token events into fewer, larger ones
+
+    Buffered text is flushed once it reaches ``max_chars`` characters or
+    ``max_delay`` seconds after its first token arrived, whichever comes
+    first, and always before a non-token event. Events are read by a
+    separate task so the delay is honoured even while Ollama is silent.
+    At most ``max_queued`` events wait between the two, so a slow reader
+    of the result slows reading from Ollama instead of buffering it all.
+    """
+    queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max_queued)
+    end = object()
+
+    async def read() -> None:
+        async with aclosing(events):
+            try:
+                async for event in events:
+                    await queue.put(event)
+            except Exception:
+                await queue.put(end)
+                raise
+            await queue.put(end)
+
+    reader = asyncio.ensure_future(read())
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    deadline: Optional[float] = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                event = None
+
+            if event is not None and event is not end and event["type"] == "token":
+                if deadline is None:
+                    deadline = loop.time() + max_delay
+                buffer.append(event["text"])
+                size += len(event["text"])
+                if size < max_chars:
+                    continue
+
+            if buffer:
+                yield {"type": "token", "text": "".join(buffer)}
+                buffer = []
+                size = 0
+                deadline = None
+
+            if event is end:
+                break
+            if event is not None and event["type"] != "token":
+                yield event
+        # Surface errors raised by the source rather than the reader task
+        await reader
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
@@ -0,0 +1,380 @@
+"""
+Structured output: JSON generated to the schema of a pydantic model
+
+The model's JSON schema is sent to Ollama as ``format``. The streamed text
+goes through ``JSONStreamParser`` as it arrives, which builds the value
+while parsing. Generation is stopped as soon as the value is complete, or
+as soon as the text can no longer become a valid instance: a syntax error,
+an unknown field of a model that forbids extra fields, or a field whose
+value fails validation. The model is then built from the parsed value,
+without parsing the text again, and from the fields as already validated
+when model-level validation would add nothing.
+"""
+
+import json
+import re
+from contextlib import aclosing, closing
+from functools import lru_cache
+from typing import (
+    Annotated,
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    Generator,
+    Generic,
+    List,
+    Optional,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from ollama_client.core.exceptions import StructuredOutputError
+
+M = TypeVar("M", bound=BaseModel)
+
+Container = Union[Dict[str, Any], List[Any]]
+
+WHITESPACE = frozenset(" \t\n\r")
+NUMBER_START = frozenset("-0123456789")
+NUMBER_CHARS = frozenset("+-.eE0123456789")
+LITERALS = {"true": True, "false": False, "null": None}
+ESCAPES = frozenset('"\\/bfnrtu')
+
+NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+# Characters that end the plain run of a string
+STRING_SPECIAL = re.compile(r'["\\\x00-\x1f]')
+
+
+class JSONStreamParser:
+    """Incremental parser of one JSON value, fed text as it is generated
+
+    ``feed`` returns True once the value is complete, and ``value`` then
+    holds it; text after it is ignored. ``ValueError`` is raised as soon
+    as the text cannot be the start of valid JSON.
+
+    For the members of the top-level object, ``on_key(key)`` is called as
+    soon as a key is complete and ``on_member(key, value)`` as soon as its
+    value is. Either may raise to stop parsing.
+    """
+
+    def __init__(
+        self,
+        on_key: Optional[Callable[[str], None]] = None,
+        on_member: Optional[Callable[[str, Any], None]] = None,
+    ):
+        self.on_key = on_key
+        self.on_member = on_member
+        self.value: Any = None
+        self.done = False
+        self.offset = 0
+        # Open containers, and the key awaiting a value in each object
+        self._stack: List[Container] = []
+        self._keys: List[Optional[str]] = []
+        # value, value_or_end, key, key_or_end, colon or comma_or_end
+        self._expect = "value"
+        # The token being read: None, "string", "key", "number" or "literal"
+        self._token: Optional[str] = None
+        self._buffer: List[str] = []
+        self._escape = False
+
+    def feed(self, text: str) -> bool:
+        i, n = 0, len(text)
+        while i < n and not self.done:
+            if self._token in ("string", "key"):
+                i = self._string(text, i)
+                continue
+            char = text[i]
+            if self._token == "number":
+                if char in NUMBER_CHARS:
+                    self._buffer.append(char)
+                    i += 1
+                    continue
+                self._end_number(i)
+            elif self._token == "literal":
+                self._literal(char, i)
+                i += 1
+                continue
+            if self.done:
+                break
+            self._char(char, i)
+            i += 1
+        self.offset += i
+        return self.done
+
+    def _error(self, position: int, reason: str) -> ValueError:
+        return ValueError(f"Invalid JSON at offset {self.offset + position}: {reason}")
+
+    def _char(self, char: str, i: int) -> None:
+        """A character between tokens"""
+        if char in WHITESPACE:
+            return
+        expect = self._expect
+        if expect in ("value", "value_or_end"):
+            if char == "{":
+                self._open({}, "key_or_end")
+            elif char == "[":
+                self._open([], "value_or_end")
+            elif char == '"':
+                self._token = "string"
+            elif char in NUMBER_START:
+                self._token = "number"
+                self._buffer = [char]
+            elif char in "tfn":
+                self._token = "literal"
+                self._buffer = [char]
+            elif char == "]" and expect == "value_or_end":
+                self._close()
+            else:
+                raise self._error(i, f"unexpected {char!r}, expected a value")
+        elif expect in ("key", "key_or_end"):
+            if char == '"':
+                self._token = "key"
+            elif char == "}" and expect == "key_or_end":
+                self._close()
+            else:
+                raise self._error(i, f"unexpected {char!r}, expected a key")
+        elif expect == "colon":
+            if char != ":":
+                raise self._error(i, f"unexpected {char!r}, expected ':'")
+            self._expect = "value"
+        else:
+            if char == ",":
+                self._expect = "key" if isinstance(self._stack[-1], dict) else "value"
+            elif char == "}" and isinstance(self._stack[-1], dict):
+                self._close()
+            elif char == "]" and isinstance(self._stack[-1], list):
+                self._close()
+            else:
+                raise self._error(
+                    i, f"unexpected {char!r}, expected ',' or the end of a container"
+                )
+
+    def _string(self, text: str, i: int) -> int:
+        """Read a string from ``text[i]``, returning the index after what was read"""
+        if self._escape:
+            if text[i] not in ESCAPES:
+                raise self._error(i, f"invalid escape '\\{text[i]}'")
+            self._buffer.append(text[i])
+            self._escape = False
+            i += 1
+        match = STRING_SPECIAL.search(text, i)
+        if match is None:
+            self._buffer.append(text[i:])
+            return len(text)
+        self._buffer.append(text[i : match.start()])
+        char = match.group()
+        if char == "\\":
+            self._buffer.append(char)
+            self._escape = True
+            return match.end()
+        if char != '"':
+            raise self._error(match.start(), "control character in string")
+        try:
+            # Escapes, \u ones included, are decoded by the json module
+            value = json.loads('"' + "".join(self._buffer) + '"')
+        except ValueError as e:
+            raise self._error(match.start(), f"invalid string ({e})") from None
+        is_key = self._token == "key"
+        self._token = None
+        self._buffer = []
+        if is_key:
+            self._keys[-1] = value
+            self._expect = "colon"
+            if len(self._stack) == 1 and self.on_key is not None:
+                self.on_key(value)
+        else:
+            self._add(value)
+        return match.end()
+
+    def _end_number(self, i: int) -> None:
+        text = "".join(self._buffer)
+        match = NUMBER.fullmatch(text)
+        if match is None:
+            raise self._error(i, f"invalid number {text!r}")
+        self._token = None
+        self._buffer = []
+        self._add(float(text) if match.group(1) or match.group(2) else int(text))
+
+    def _literal(self, char: str, i: int) -> None:
+        self._buffer.append(char)
+        text = "".join(self._buffer)
+        if text in LITERALS:
+            self._token = None
+            self._buffer = []
+            self._add(LITERALS[text])
+        elif not any(literal.startswith(text) for literal in LITERALS):
+            raise self._error(i, f"invalid literal {text!r}")
+
+    def _open(self, container: Container, expect: str) -> None:
+        self._stack.append(container)
+        self._keys.append(None)
+        self._expect = expect
+
+    def _close(self) -> None:
+        container = self._stack.pop()
+        self._keys.pop()
+        self._add(container)
+
+    def _add(self, value: Any) -> None:
+        """A complete value, added to its container or ending the parse"""
+        if not self._stack:
+            self.value = value
+            self.done = True
+            return
+        container = self._stack[-1]
+        if isinstance(container, dict):
+            key = self._keys[-1]
+            # Set by the key that precedes any value in an object
+            assert key is not None
+            container[key] = value
+            if len(self._stack) == 1 and self.on_member is not None:
+                self.on_member(key, value)
+        else:
+            container.append(value)
+        self._expect = "comma_or_end"
+
+
+@lru_cache(maxsize=64)
+def json_schema(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """The JSON schema of ``schema``, sent to Ollama as ``format``"""
+    return schema.model_json_schema()
+
+
+@lru_cache(maxsize=64)
+def _field_adapters(schema: Type[BaseModel]) -> Dict[str, "TypeAdapter[Any]"]:
+    """A validator per field of ``schema``, by the key it has in JSON"""
+    adapters: Dict[str, "TypeAdapter[Any]"] = {}
+    for name, field in schema.model_fields.items():
+        # Built at runtime, which is not a type mypy can check
+        annotation: Any = Annotated[field.annotation, field]
+        adapters[field.alias or name] = TypeAdapter(annotation)
+    return adapters
+
+
+@lru_cache(maxsize=64)
+def _constructible(schema: Type[BaseModel]) -> bool:
+    """Whether validating each field is all that validating ``schema`` does
+
+    Not so if the model has validators of its own, which the field
+    validators do not run, or keeps extra fields.
+    """
+    decorators = schema.__pydantic_decorators__
+    return not (
+        decorators.validators
+        or decorators.field_validators
+        or decorators.root_validators
+        or decorators.model_validators
+        or schema.model_config.get("extra") == "allow"
+    )
+
+
+class StructuredParser(Generic[M]):
+    """Parses streamed text into an instance of ``schema``, failing early
+
+    ``feed`` returns True once the JSON value is complete and raises
+    ``StructuredOutputError`` as soon as the text cannot become a valid
+    instance. ``result`` then builds the instance from the parsed value:
+    from the fields already validated while parsing when they are all
+    there, otherwise by validating the whole value.
+    """
+
+    def __init__(self, schema: Type[M]):
+        self.schema = schema
+        self.fields = _field_adapters(schema)
+        self.required = [
+            field.alias or name
+            for name, field in schema.model_fields.items()
+            if field.is_required()
+        ]
+        self.forbid_extra = schema.model_config.get("extra") == "forbid"
+        self.parser = JSONStreamParser(on_key=self._key, on_member=self._member)
+        self._text: List[str] = []
+        # Field values as validated, by their key in JSON
+        self._values: Dict[str, Any] = {}
+
+    @property
+    def text(self) -> str:
+        """The text fed so far"""
+        return "".join(self._text)
+
+    def feed(self, text: str) -> bool:
+        self._text.append(text)
+        try:
+            return self.parser.feed(text)
+        except ValueError as e:
+            raise StructuredOutputError(str(e), self.text) from None
+
+    def result(self) -> M:
+        if not self.parser.done:
+            raise StructuredOutputError(
+                "Output ended before the JSON value was complete", self.text
+            )
+        if (
+            isinstance(self.parser.value, dict)
+            and _constructible(self.schema)
+            and all(key in self._values for key in self.required)
+        ):
+            # Every field has passed validation: build without validating again
+            return self.schema.model_construct(**self._values)
+        try:
+            return self.schema.model_validate(self.parser.value)
+        except ValidationError as e:
+            raise StructuredOutputError(
+                f"Output does not match {self.schema.__name__}: {e}", self.text
+            ) from None
+
+    def _key(self, key: str) -> None:
+        if self.forbid_extra and key not in self.fields:
+            raise StructuredOutputError(
+                f"Unexpected field {key!r} for {self.schema.__name__}", self.text
+            )
+
+    def _member(self, key: str, value: Any) -> None:
+        adapter = self.fields.get(key)
+        if adapter is None:
+            return
+        try:
+            self._values[key] = adapter.validate_python(value)
+        except ValidationError as e:
+            raise StructuredOutputError(
+                f"Invalid field {key!r} for {self.schema.__name__}: {e}", self.text
+            ) from None
+
+
+def chunk_text(chunk: Dict[str, Any]) -> str:
+    """The generated text of a ``generate`` or ``chat`` chunk"""
+    if "error" in chunk:
+        raise StructuredOutputError(f"Ollama stream failed: {chunk['error']}")
+    if "message" in chunk:
+        return chunk["message"].get("content") or ""
+    return chunk.get("response") or ""
+
+
+async def parse_stream(
+    chunks: AsyncGenerator[Dict[str, Any], None], schema: Type[M]
+) -> M:
+    """Parse streamed chunks into ``schema``, closing the stream once it is decided
+
+    Closing the stream closes the connection, so Ollama stops generating
+    once the value is complete or has become invalid.
+    """
+    parser = StructuredParser(schema)
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            if parser.feed(chunk_text(chunk)):
+                break
+    return parser.result()
+
+
+def parse_chunks(chunks: Generator[Dict[str, Any], None, None], schema: Type[M]) -> M:
+    """Like ``parse_stream``, for the synchronous client"""
+    parser = StructuredParser(schema)
+    with closing(chunks):
+        for chunk in chunks:
+            if parser.feed(chunk_text(chunk)):
+                break
+    return parser.result()
@@ -1,30 +1,122 @@
 import asyncio
-import json
-import websockets
-from typing import Dict, Any, List, Optional
-import os
 import logging
+import os
+import sys
+import time
+from contextlib import aclosing
+from http import HTTPStatus
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Type,
+    Union,
+)
+
+import websockets
+from websockets.asyncio.server import ServerConnection
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from websockets.http11 import Request as HTTPRequest
+from websockets.http11 import Response as HTTPResponse
 
-from ollama_client.core.client import OllamaClient
+from ollama_client.core.hedging import Client, connect, hedging_options
+from ollama_client.core.streaming import coalesce_tokens, stream_events
+from ollama_client.interfaces.mcp.protocol import (
+    Codec,
+    Connection,
+    JSONCodec,
+    MessagePackCodec,
+    msgpack,
+)
+from ollama_client.utils.metrics import (
+    IN_FLIGHT,
+    REJECTED,
+    REQUEST_LATENCY,
+    WEBSOCKET_CONNECTIONS,
+    serve_metrics,
+)
 
 logger = logging.getLogger(__name__)
 
+# Longest message accepted over stdio
+STDIO_LINE_LIMIT = 16 * 1024 * 1024
+
+# Pending TCP connections; bursts of reconnecting agents overflow the default 100
+LISTEN_BACKLOG = 4096
+
 
 class MCPAdapter:
+    """WebSocket server exposing Ollama as MCP tools
+
+    Each message on a connection is handled as its own task, so a slow
+    generation doesn't hold up later requests. Up to ``max_in_flight``
+    requests run per connection and as many again wait for a slot;
+    beyond that requests are answered at once with a ``SERVER_BUSY``
+    (-32000) error while the socket keeps being read, so cancels still
+    get through. Responses are sent as they complete and carry the request
+    ``id``. A ``cancel`` message with the same ``id`` stops a request, and
+    a disconnect stops all of the connection's requests.
+
+    ``generate`` and ``chat`` requests with ``"stream": true`` send the
+    text as ``delta`` frames while it is generated. Tokens are merged
+    until ``stream_chunk`` characters are buffered or ``stream_interval``
+    seconds have passed, so fast models don't send a frame per token.
+
+    Websocket messages are compressed with permessage-deflate when the
+    client supports it (``compression=None`` turns it off), and clients
+    offering the ``mcp.msgpack`` subprotocol get MessagePack frames.
+    """
+
     def __init__(
-            self,
-            client: OllamaClient,
-            host: str = "0.0.0.0",
-            port: int = 8080
+        self,
+        client: Client,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        metrics_port: Optional[int] = None,
+        max_in_flight: int = 8,
+        stream_interval: float = 0.05,
+        stream_chunk: int = 64,
+        compression: Optional[str] = "deflate",
+        compression_level: int = 6,
+        ping_interval: Optional[float] = 20.0,
+        ping_timeout: Optional[float] = 20.0,
+        idle_timeout: Optional[float] = None,
+        max_connections: Optional[int] = None,
     ):
         self.client = client
         self.host = host
         self.port = port
-        self.connections = set()
+        self.metrics_port = metrics_port
+        self.max_in_flight = max_in_flight
+        self.stream_interval = stream_interval
+        self.stream_chunk = stream_chunk
+        self.compression = compression
+        self.compression_level = compression_level
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        # The tools message serialized once per codec
+        self._handshakes: Dict[str, Union[str, bytes]] = {}
+        self.connections: Dict[ServerConnection, Connection] = {}
+        self.in_flight = IN_FLIGHT.labels("mcp")
+        self.connection_gauge = WEBSOCKET_CONNECTIONS.labels("mcp")
         self.handlers = {
             "generate": self.handle_generate,
             "list_models": self.handle_list_models,
             "chat": self.handle_chat,
+            "list_tools": self.handle_list_tools,
+        }
+        self.stream_handlers = {
+            "generate": self.stream_generate,
+            "chat": self.stream_chat,
         }
 
         # MCP Tool definitions
@@ -36,30 +128,39 @@ class MCPAdapter:
                         "name": "prompt",
                         "description": "The prompt text to generate from",
                         "type": "string",
-                        "required": True
+                        "required": True,
                     },
                     {
                         "name": "model",
                         "description": "The model to use for generation",
                         "type": "string",
                         "required": False,
-                        "default": "llama3"
+                        "default": "llama3",
                     },
                     {
                         "name": "temperature",
                         "description": "The sampling temperature (0-1)",
                         "type": "number",
                         "required": False,
-                        "default": 0.7
+                        "default": 0.7,
                     },
                     {
                         "name": "max_tokens",
                         "description": "Maximum number of tokens to generate",
                         "type": "integer",
                         "required": False,
-                        "default": 512
-                    }
-                ]
+                        "default": 512,
+                    },
+                    {
+                        "name": "stream",
+                        "description": (
+                            "Send the text as delta frames while it is generated"
+                        ),
+                        "type": "boolean",
+                        "required": False,
+                        "default": False,
+                    },
+                ],
             },
             "chat": {
                 "description": "Chat with an Ollama model using a conversation history",
@@ -68,34 +169,43 @@ class MCPAdapter:
                         "name": "messages",
                         "description": "List of chat messages",
                         "type": "array",
-                        "required": True
+                        "required": True,
                     },
                     {
                         "name": "model",
                         "description": "The model to use for chat",
                         "type": "string",
                         "required": False,
-                        "default": "llama3"
+                        "default": "llama3",
                     },
                     {
                         "name": "temperature",
                         "description": "The sampling temperature (0-1)",
                         "type": "number",
                         "required": False,
-                        "default": 0.7
+                        "default": 0.7,
                     },
                     {
                         "name": "max_tokens",
                         "description": "Maximum number of tokens to generate",
                         "type": "integer",
                         "required": False,
-                        "default": 512
-                    }
-                ]
+                        "default": 512,
+                    },
+                    {
+                        "name": "stream",
+                        "description": (
+                            "Send the text as delta frames while it is generated"
+                        ),
+                        "type": "boolean",
+                        "required": False,
+                        "default": False,
+                    },
+                ],
             },
             "list_models": {
                 "description": "List available models in Ollama",
-                "parameters": []
+                "parameters": [],
             },
         }
 
@@ -110,18 +220,14 @@ class MCPAdapter:
             return {"error": "Prompt is required", "status": "error"}
 
         try:
-            response = self.client.generate(
+            response = await self.client.generate(
                 prompt=prompt,
                 model=model,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
             )
 
-            return {
-                "text": response.text,
-                "model": model,
-                "status": "success"
-            }
+            return {"text": response.text, "model": model, "status": "success"}
         except Exception as e:
             logger.error(f"Error generating text: {e}")
             return {"error": str(e), "status": "error"}
@@ -129,22 +235,26 @@ class MCPAdapter:
     async def handle_list_models(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Handle list_models request from MCP"""
         try:
-            models = self.client.list_models()
+            models = await self.client.list_models()
             return {
                 "models": [
                     {
                         "name": model.name,
                         "size": model.size,
-                        "modified_at": model.modified_at
+                        "modified_at": model.modified_at,
                     }
                     for model in models
                 ],
-                "status": "success"
+                "status": "success",
             }
         except Exception as e:
             logger.error(f"Error listing models: {e}")
             return {"error": str(e), "status": "error"}
 
+    async def handle_list_tools(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Handle list_tools request from MCP"""
+        return {"tools": self.tools, "status": "success"}
+
     async def handle_chat(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Handle chat request from MCP"""
         messages = data.get("messages", [])
@@ -156,101 +266,353 @@ class MCPAdapter:
             return {"error": "Messages are required", "status": "error"}
 
         try:
-            response = self.client.chat(
+            response = await self.client.chat(
                 messages=messages,
                 model=model,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
             )
 
             return {
-                "message": {
-                    "role": "assistant",
-                    "content": response.text
-                },
+                "message": {"role": "assistant", "content": response.text},
                 "model": model,
-                "status": "success"
+                "status": "success",
             }
         except Exception as e:
             logger.error(f"Error in chat: {e}")
             return {"error": str(e), "status": "error"}
 
-    async def handle_connection(self, websocket, path):
-        """Handle WebSocket connection"""
-        self.connections.add(websocket)
+    async def stream_generate(
+        self, data: Dict[str, Any], send_delta: Callable[[str], Awaitable[None]]
+    ) -> Dict[str, Any]:
+        """Handle a streamed generate request from MCP"""
+        prompt = data.get("prompt")
+        model = data.get("model", "llama3")
 
+        if not prompt:
+            return {"error": "Prompt is required", "status": "error"}
+
+        chunks = self.client.generate_stream(
+            prompt=prompt,
+            model=model,
+            temperature=data.get("temperature", 0.7),
+            max_tokens=data.get("max_tokens", 512),
+        )
+        return await self.stream_text(
+            chunks, lambda chunk: chunk.get("response", ""), model, send_delta
+        )
+
+    async def stream_chat(
+        self, data: Dict[str, Any], send_delta: Callable[[str], Awaitable[None]]
+    ) -> Dict[str, Any]:
+        """Handle a streamed chat request from MCP"""
+        messages = data.get("messages", [])
+        model = data.get("model", "llama3")
+
+        if not messages:
+            return {"error": "Messages are required", "status": "error"}
+
+        chunks = self.client.chat_stream(
+            messages=messages,
+            model=model,
+            temperature=data.get("temperature", 0.7),
+            max_tokens=data.get("max_tokens", 512),
+        )
+        return await self.stream_text(
+            chunks,
+            lambda chunk: chunk.get("message", {}).get("content", ""),
+            model,
+            send_delta,
+        )
+
+    async def stream_text(
+        self,
+        chunks: AsyncGenerator[Dict[str, Any], None],
+        extract_text: Callable[[Dict[str, Any]], str],
+        model: str,
+        send_delta: Callable[[str], Awaitable[None]],
+    ) -> Dict[str, Any]:
+        """Send coalesced tokens as deltas; return the usage and timing
+
+        An upstream failure, an error chunk or a stream cut off before its
+        final chunk returns an error result instead.
+        """
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"model": model, "status": "success"}
+        events = coalesce_tokens(
+            stream_events(chunks, extract_text, model),
+            max_delay=self.stream_interval,
+            max_chars=self.stream_chunk,
+        )
+        async with aclosing(events):
+            async for event in events:
+                if event["type"] == "token":
+                    if "time_to_first_token" not in result:
+                        result["time_to_first_token"] = time.perf_counter() - started
+                    await send_delta(event["text"])
+                elif event["type"] == "error":
+                    logger.error(f"Error streaming {model}: {event['error']}")
+                    return {"error": event["error"], "status": "error"}
+                else:
+                    result.update(
+                        (key, value)
+                        for key, value in event.items()
+                        if key not in ("type", "model")
+                    )
+
+        result["duration"] = time.perf_counter() - started
+        return result
+
+    async def handle_connection(
+        self, websocket: ServerConnection, path: Optional[str] = None
+    ) -> None:
+        """Handle WebSocket connection"""
+        codec: Type[Codec] = JSONCodec
+        if (
+            msgpack is not None
+            and websocket.subprotocol == MessagePackCodec.subprotocol
+        ):
+            codec = MessagePackCodec
+        connection = Connection(self, websocket.send, codec)
+        self.connections[websocket] = connection
+        self.connection_gauge.inc()
         try:
             # Send tools on connection
-            await websocket.send(json.dumps({
-                "type": "tools",
-                "tools": self.tools
-            }))
-
-            async for message in websocket:
-                try:
-                    data = json.loads(message)
-                    action = data.get("action")
-
-                    if action in self.handlers:
-                        result = await self.handlers[action](data)
-
-                        await websocket.send(json.dumps({
-                            "id": data.get("id"),
-                            "result": result
-                        }))
-                    else:
-                        await websocket.send(json.dumps({
-                            "id": data.get("id"),
-                            "error": f"Unknown action: {action}"
-                        }))
-                except json.JSONDecodeError as e:
-                    await websocket.send(json.dumps({
-                        "error": f"Invalid JSON: {e}"
-                    }))
-                except Exception as e:
-                    logger.error(f"Error handling message: {e}")
-                    await websocket.send(json.dumps({
-                        "error": str(e)
-                    }))
+            await websocket.send(self.handshake(codec))
+            await connection.run(websocket)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            del self.connections[websocket]
+            self.connection_gauge.dec()
+
+    def handshake(self, codec: Type[Codec]) -> Union[str, bytes]:
+        """The tools message sent on connect; tools don't change after startup"""
+        message = self._handshakes.get(codec.name)
+        if message is None:
+            message = codec.dumps({"type": "tools", "tools": self.tools})
+            self._handshakes[codec.name] = message
+        return message
+
+    def serve_options(self) -> Dict[str, Any]:
+        """Keyword arguments for ``websockets.serve``"""
+        extensions: Optional[List[ServerPerMessageDeflateFactory]] = None
+        if self.compression in ("deflate", "deflate-stateless"):
+            # websockets' memory-saving defaults, with a configurable level.
+            # Stateless mode frees the zlib buffers between messages, which
+            # makes idle connections cheap but compresses repeats worse.
+            stateless = self.compression == "deflate-stateless"
+            extensions = [
+                ServerPerMessageDeflateFactory(
+                    server_no_context_takeover=stateless,
+                    client_no_context_takeover=stateless,
+                    server_max_window_bits=12,
+                    client_max_window_bits=12,
+                    compress_settings={"memLevel": 5, "level": self.compression_level},
+                )
+            ]
+        return {
+            "compression": None,
+            "extensions": extensions,
+            "select_subprotocol": select_subprotocol,
+            "process_request": self.check_capacity,
+            "ping_interval": self.ping_interval,
+            "ping_timeout": self.ping_timeout,
+        }
+
+    def check_capacity(
+        self, websocket: ServerConnection, request: HTTPRequest
+    ) -> Optional[HTTPResponse]:
+        """Refuse the handshake with 503 once ``max_connections`` are open"""
+        if self.max_connections and len(self.connections) >= self.max_connections:
+            REJECTED.labels("connections").inc()
+            return websocket.respond(
+                HTTPStatus.SERVICE_UNAVAILABLE, "Too many connections\n"
+            )
+        return None
+
+    async def close_idle(self) -> None:
+        """Close connections that sent nothing for ``idle_timeout`` seconds
+
+        A single task checks every connection, so a quiet connection costs
+        no timer of its own. Connections with requests in flight are never
+        idle.
+        """
+        timeout = self.idle_timeout
+        if not timeout:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(timeout / 2, 30.0))
+            cutoff = loop.time() - timeout
+            idle = [
+                websocket
+                for websocket, connection in self.connections.items()
+                if connection.last_active < cutoff and not connection.requests
+            ]
+            if idle:
+                logger.info(f"Closing {len(idle)} idle connections")
+                await asyncio.gather(
+                    *(websocket.close(1000, "Idle timeout") for websocket in idle),
+                    return_exceptions=True,
+                )
+
+    async def serve_stdio(
+        self, stdin: Optional[BinaryIO] = None, stdout: Optional[BinaryIO] = None
+    ) -> None:
+        """Serve one client over stdin and stdout, one JSON message per line
+
+        Saves a local agent the websocket handshake and the TCP stack. No
+        tools message is sent; the client asks with ``list_tools``.
+        """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=STDIO_LINE_LIMIT)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), stdin or sys.stdin.buffer
+        )
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, stdout or sys.stdout.buffer
+        )
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+
+        async def send(message: Union[str, bytes]) -> None:
+            data = message.encode() if isinstance(message, str) else message
+            # One write per message, so concurrent replies never interleave
+            writer.write(data + b"\n")
+            await writer.drain()
+
+        async def lines() -> AsyncIterator[bytes]:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.strip():
+                    yield line
+
+        try:
+            await Connection(self, send).run(lines())
         finally:
-            self.connections.remove(websocket)
+            writer.close()
+
+    async def call_handler(
+        self,
+        action: str,
+        data: Dict[str, Any],
+        send_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
+        """Run a tool handler, recording its latency and outcome
 
-    async def run(self):
+        With ``send_delta`` the action's streaming handler is used.
+        """
+        started = time.perf_counter()
+        status = "error"
+        self.in_flight.inc()
+        try:
+            if send_delta is not None:
+                result = await self.stream_handlers[action](data, send_delta)
+            else:
+                result = await self.handlers[action](data)
+            status = result.get("status", "success")
+            return result
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            self.in_flight.dec()
+            REQUEST_LATENCY.labels("mcp", action, status).observe(
+                time.perf_counter() - started
+            )
+
+    async def run(self) -> None:
         """Run the MCP adapter server"""
         server = await websockets.serve(
             self.handle_connection,
             self.host,
-            self.port
+            self.port,
+            backlog=LISTEN_BACKLOG,
+            **self.serve_options(),
         )
 
         logger.info(f"MCP adapter running at ws://{self.host}:{self.port}")
 
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = await serve_metrics(self.host, self.metrics_port)
+            logger.info(
+                f"MCP metrics at http://{self.host}:{self.metrics_port}/metrics"
+            )
+
+        reaper = asyncio.ensure_future(self.close_idle()) if self.idle_timeout else None
         try:
             await asyncio.Future()  # Run forever
         finally:
+            if reaper is not None:
+                reaper.cancel()
             server.close()
             await server.wait_closed()
+            if metrics_server is not None:
+                metrics_server.close()
+                await metrics_server.wait_closed()
+
 
+def select_subprotocol(
+    connection: ServerConnection, subprotocols: Sequence[str]
+) -> Optional[str]:
+    """Use MessagePack if the client offers it and msgpack is installed"""
+    if msgpack is not None and MessagePackCodec.subprotocol in subprotocols:
+        return MessagePackCodec.subprotocol
+    return None
 
-def start():
+
+def start() -> None:
     """Start the MCP adapter"""
     host = os.environ.get("HOST", "0.0.0.0")
     port = int(os.environ.get("MCP_PORT", 8080))
+    metrics_port = int(os.environ.get("MCP_METRICS_PORT", 9090))
+    max_in_flight = int(os.environ.get("MCP_MAX_IN_FLIGHT", 8))
+    stream_interval = float(os.environ.get("MCP_STREAM_INTERVAL", 0.05))
+    stream_chunk = int(os.environ.get("MCP_STREAM_CHUNK", 64))
+    transport = os.environ.get("MCP_TRANSPORT", "websocket")
+    compression = os.environ.get("MCP_COMPRESSION", "deflate")
+    compression_level = int(os.environ.get("MCP_COMPRESSION_LEVEL", 6))
+    ping_interval = float(os.environ.get("MCP_PING_INTERVAL", 20)) or None
+    ping_timeout = float(os.environ.get("MCP_PING_TIMEOUT", 20)) or None
+    idle_timeout = float(os.environ.get("MCP_IDLE_TIMEOUT", 0)) or None
+    max_connections = int(os.environ.get("MCP_MAX_CONNECTIONS", 0)) or None
     ollama_host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
 
-    # Configure logging
+    # Configure logging (stderr, which keeps stdout free for stdio)
     logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+        level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
     )
 
-    # Create client and adapter
-    client = OllamaClient(host=ollama_host)
-    adapter = MCPAdapter(client, host=host, port=port)
+    async def main() -> None:
+        # One shared connection pool for every websocket connection, hedging
+        # across hosts if several are given
+        async with connect(ollama_host, hedging_options()) as client:
+            adapter = MCPAdapter(
+                client,
+                host=host,
+                port=port,
+                metrics_port=metrics_port,
+                max_in_flight=max_in_flight,
+                stream_interval=stream_interval,
+                stream_chunk=stream_chunk,
+                compression=None if compression == "none" else compression,
+                compression_level=compression_level,
+                ping_interval=ping_interval,
+                ping_timeout=ping_timeout,
+                idle_timeout=idle_timeout,
+                max_connections=max_connections,
+            )
+            if transport == "stdio":
+                await adapter.serve_stdio()
+            else:
+                await adapter.run()
 
     # Run the adapter
-    asyncio.run(adapter.run())
+    asyncio.run(main())
 
 
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    start()
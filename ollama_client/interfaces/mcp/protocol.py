@@ -0,0 +1,461 @@
+"""
+Request framing for the MCP adapter, independent of the transport
+
+Two framings are accepted on every connection:
+
+* the original one, ``{"id": 1, "action": "generate", "prompt": ...}``,
+  answered with ``{"id": 1, "result": ...}``
+* JSON-RPC 2.0, ``{"jsonrpc": "2.0", "id": 1, "method": "generate",
+  "params": {...}}``, including batches (a JSON array of requests) and
+  notifications (requests without an ``id``, which get no response)
+
+Messages are compact JSON text unless the websocket client negotiated
+the ``mcp.msgpack`` subprotocol, in which case replies are binary
+MessagePack frames (requires ``msgpack``).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+import websockets
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+from ollama_client.utils.metrics import observe_cancelled
+
+if TYPE_CHECKING:
+    from ollama_client.interfaces.mcp.adapter import MCPAdapter
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+# Implementation-defined server error: the connection's backlog is full
+SERVER_BUSY = -32000
+
+# Raised by a transport's send once the peer is gone
+CLOSED_ERRORS = (websockets.ConnectionClosed, ConnectionError)
+
+Send = Callable[[Union[str, bytes]], Awaitable[None]]
+Task = asyncio.Task[Any]
+
+
+class Codec:
+    """How messages are framed; used as the class, never instantiated"""
+
+    name: str
+    label: str
+
+    @staticmethod
+    def dumps(message: Any) -> Union[str, bytes]:
+        raise NotImplementedError
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    """Compact JSON in text frames"""
+
+    name = "json"
+    label = "JSON"
+
+    @staticmethod
+    def dumps(message: Any) -> str:
+        return json.dumps(message, separators=(",", ":"))
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class MessagePackCodec(Codec):
+    """MessagePack in binary frames; text frames are still read as JSON"""
+
+    name = "msgpack"
+    label = "MessagePack"
+    subprotocol = "mcp.msgpack"
+
+    @staticmethod
+    def dumps(message: Any) -> bytes:
+        packed: bytes = msgpack.packb(message, use_bin_type=True)
+        return packed
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+
+class Request:
+    """One request, in either framing"""
+
+    __slots__ = (
+        "action",
+        "params",
+        "id",
+        "jsonrpc",
+        "notification",
+        "error",
+        "batched",
+        "started",
+    )
+
+    def __init__(
+        self,
+        action: Any,
+        params: Dict[str, Any],
+        request_id: Any = None,
+        jsonrpc: bool = False,
+        notification: bool = False,
+        error: Optional[Tuple[int, str]] = None,
+    ):
+        self.action = action
+        self.params = params
+        self.id = request_id
+        self.jsonrpc = jsonrpc
+        self.notification = notification
+        self.error = error
+        self.batched = False
+        self.started = time.perf_counter()
+
+    @classmethod
+    def parse(cls, data: Any, jsonrpc: bool = False) -> "Request":
+        """Read a decoded message; ``jsonrpc`` forces JSON-RPC framing"""
+        if isinstance(data, dict) and not jsonrpc and "jsonrpc" not in data:
+            return cls(data.get("action"), data, data.get("id"))
+
+        if not isinstance(data, dict):
+            return cls(
+                None,
+                {},
+                jsonrpc=True,
+                error=(INVALID_REQUEST, "Expected a JSON object"),
+            )
+
+        request_id = data.get("id")
+        if data.get("jsonrpc") != "2.0" or not isinstance(data.get("method"), str):
+            return cls(
+                None,
+                {},
+                request_id,
+                jsonrpc=True,
+                error=(INVALID_REQUEST, "Invalid request"),
+            )
+
+        params = data.get("params", {})
+        if not isinstance(params, dict):
+            return cls(
+                data["method"],
+                {},
+                request_id,
+                jsonrpc=True,
+                error=(INVALID_REQUEST, "params must be an object"),
+            )
+        return cls(
+            data["method"],
+            params,
+            request_id,
+            jsonrpc=True,
+            notification="id" not in data,
+        )
+
+    def reply(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.notification:
+            return None
+        if self.jsonrpc:
+            return {"jsonrpc": "2.0", "id": self.id, "result": result}
+        return {"id": self.id, "result": result}
+
+    def reply_error(self, code: int, message: str) -> Optional[Dict[str, Any]]:
+        if self.notification:
+            return None
+        if self.jsonrpc:
+            return {
+                "jsonrpc": "2.0",
+                "id": self.id,
+                "error": {"code": code, "message": message},
+            }
+        return {"id": self.id, "error": message}
+
+    def delta(self, text: str) -> Dict[str, Any]:
+        if self.jsonrpc:
+            return {
+                "jsonrpc": "2.0",
+                "method": "delta",
+                "params": {"id": self.id, "delta": text},
+            }
+        return {"id": self.id, "delta": text}
+
+
+class Connection:
+    """Reads the requests of one client and runs them as tasks
+
+    Up to ``max_in_flight`` requests run at once and as many again wait
+    for a slot; beyond that requests are answered with a busy error.
+    Reading never pauses, so cancellations are always seen. Messages are
+    text frames (websocket) or lines (stdio); ``send`` writes one.
+    """
+
+    def __init__(
+        self, adapter: "MCPAdapter", send: Send, codec: Type[Codec] = JSONCodec
+    ):
+        self.adapter = adapter
+        self.send = send
+        self.codec = codec
+        # Updated on every message and reply, for the idle timeout
+        self.last_active = asyncio.get_running_loop().time()
+        self.slots = asyncio.Semaphore(adapter.max_in_flight)
+        # Requests running or waiting for a slot, and their limit
+        self.pending = 0
+        self.max_pending = adapter.max_in_flight * 2
+        self.jsonrpc = False
+        self.requests: Dict[Task, Request] = {}
+        self.by_id: Dict[Any, Task] = {}
+        # Batches and cancellation replies, awaited when the connection closes
+        self.background: Set[Task] = set()
+
+    async def run(self, messages: AsyncIterable[Union[str, bytes]]) -> None:
+        try:
+            async for message in messages:
+                await self.receive(message)
+        finally:
+            # Nobody is left to receive the results
+            tasks = list(self.requests)
+            for task in tasks:
+                if not task.done():
+                    self.cancel(task, "disconnect")
+            await asyncio.gather(*tasks, *self.background, return_exceptions=True)
+
+    async def receive(self, message: Union[str, bytes]) -> None:
+        self.last_active = asyncio.get_running_loop().time()
+        try:
+            data = self.codec.loads(message)
+        except ValueError as e:
+            # Also covers msgpack's errors
+            if self.jsonrpc:
+                error = Request(None, {}, jsonrpc=True).reply_error(
+                    PARSE_ERROR, f"Parse error: {e}"
+                )
+                await self.write(error)
+            else:
+                await self.write({"error": f"Invalid {self.codec.label}: {e}"})
+            return
+
+        if isinstance(data, list):
+            self.jsonrpc = True
+            if not data:
+                error = Request(None, {}, jsonrpc=True).reply_error(
+                    INVALID_REQUEST, "Empty batch"
+                )
+                await self.write(error)
+                return
+            requests = [Request.parse(item, jsonrpc=True) for item in data]
+            if self.pending >= self.max_pending:
+                await self.write(self.busy_batch(requests))
+                return
+            for request in requests:
+                request.batched = True
+            self.pending += 1
+            batch = self.spawn(self.respond_batch(requests))
+            batch.add_done_callback(self.done_pending)
+            return
+
+        if not isinstance(data, dict):
+            if self.jsonrpc:
+                error = Request(None, {}, jsonrpc=True).reply_error(
+                    INVALID_REQUEST, "Expected a JSON object"
+                )
+                await self.write(error)
+            else:
+                await self.write({"error": "Invalid request: expected a JSON object"})
+            return
+
+        request = Request.parse(data)
+        self.jsonrpc = self.jsonrpc or request.jsonrpc
+        if request.action == "cancel" and request.error is None:
+            # The original framing names the request to cancel by its own id
+            target = request.params.get("id")
+            cancelled = self.cancel_id(target)
+            if request.jsonrpc:
+                await self.write(request.reply({"cancelled": cancelled}))
+            return
+
+        if self.pending >= self.max_pending:
+            await self.write(self.busy(request))
+            return
+        self.pending += 1
+        self.start(request, self.respond(request)).add_done_callback(self.done_pending)
+
+    def busy(self, request: Request) -> Optional[Dict[str, Any]]:
+        """The reply to a request refused because the backlog is full"""
+        message = f"Server busy: {self.max_pending} requests pending, retry later"
+        return request.reply_error(SERVER_BUSY, message)
+
+    def busy_batch(self, requests: List[Request]) -> Optional[List[Dict[str, Any]]]:
+        """The reply to a refused batch, whose cancellations are still carried out"""
+        replies = []
+        for request in requests:
+            if request.action == "cancel" and request.error is None:
+                cancelled = self.cancel_id(request.params.get("id"))
+                reply = request.reply({"cancelled": cancelled})
+            else:
+                reply = self.busy(request)
+            if reply is not None:
+                replies.append(reply)
+        return replies or None
+
+    def done_pending(self, task: Task) -> None:
+        self.pending -= 1
+
+    def start(self, request: Request, work: Coroutine[Any, Any, Any]) -> Task:
+        """Run ``work`` for ``request`` as a task that can be cancelled by id"""
+        task = asyncio.ensure_future(work)
+        self.requests[task] = request
+        if request.id is not None:
+            self.by_id[request.id] = task
+        task.add_done_callback(self.finished)
+        return task
+
+    def finished(self, task: Task) -> None:
+        self.last_active = asyncio.get_running_loop().time()
+        request = self.requests.pop(task)
+        if self.by_id.get(request.id) is task:
+            del self.by_id[request.id]
+
+    def spawn(self, work: Coroutine[Any, Any, Any]) -> Task:
+        task = asyncio.ensure_future(work)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+        return task
+
+    def cancel_id(self, request_id: Any) -> bool:
+        """Cancel a running request
+
+        Unknown ids are ignored, as the request may just have finished.
+        """
+        task = self.by_id.get(request_id)
+        if task is None or task.done():
+            return False
+        request = self.cancel(task, "client")
+        if not request.batched:
+            # Sent from here: a task cancelled before it started runs none of its code
+            self.spawn(self.reply_cancelled(request, task))
+        return True
+
+    async def reply_cancelled(self, request: Request, task: Task) -> None:
+        await asyncio.gather(task, return_exceptions=True)
+        await self.write(request.reply({"status": "cancelled"}))
+
+    def cancel(self, task: Task, reason: str) -> Request:
+        """Cancel a request's task, which closes its upstream stream"""
+        request = self.requests[task]
+        task.cancel()
+        if request.action in self.adapter.stream_handlers:
+            observe_cancelled(
+                "mcp",
+                reason,
+                request.params.get("model", "llama3"),
+                request.params.get("max_tokens", 512),
+                time.perf_counter() - request.started,
+            )
+        else:
+            observe_cancelled("mcp", reason)
+        return request
+
+    async def write(self, reply: Any) -> None:
+        if reply is None:
+            return
+        try:
+            await self.send(self.codec.dumps(reply))
+        except CLOSED_ERRORS:
+            pass
+
+    async def execute(self, request: Request) -> Optional[Dict[str, Any]]:
+        """Run one request and return its reply, or None for a notification"""
+        if request.error is not None:
+            return request.reply_error(*request.error)
+        if request.action not in self.adapter.handlers:
+            return request.reply_error(
+                METHOD_NOT_FOUND, f"Unknown action: {request.action}"
+            )
+
+        send_delta = None
+        if (
+            request.params.get("stream")
+            and request.action in self.adapter.stream_handlers
+        ):
+
+            async def send_delta(text: str) -> None:
+                await self.send(self.codec.dumps(request.delta(text)))
+
+        try:
+            async with self.slots:
+                result = await self.adapter.call_handler(
+                    request.action, request.params, send_delta
+                )
+        except CLOSED_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error handling message: {e}")
+            return request.reply_error(INTERNAL_ERROR, str(e))
+        return request.reply(result)
+
+    async def respond(self, request: Request) -> None:
+        """Run one request and send its reply, tagged with the request id"""
+        try:
+            reply = await self.execute(request)
+        except CLOSED_ERRORS:
+            return
+        await self.write(reply)
+
+    async def respond_batch(self, requests: List[Request]) -> None:
+        """Run a JSON-RPC batch concurrently and answer it with one array"""
+        tasks: List[Awaitable[Optional[Dict[str, Any]]]] = []
+        for request in requests:
+            if request.action == "cancel" and request.error is None:
+                cancelled = self.cancel_id(request.params.get("id"))
+                tasks.append(asyncio.sleep(0, request.reply({"cancelled": cancelled})))
+            else:
+                tasks.append(self.start(request, self.execute(request)))
+
+        replies = []
+        for request, reply in zip(
+            requests, await asyncio.gather(*tasks, return_exceptions=True), strict=True
+        ):
+            if isinstance(reply, asyncio.CancelledError):
+                reply = request.reply({"status": "cancelled"})
+            elif isinstance(reply, CLOSED_ERRORS):
+                return
+            elif isinstance(reply, BaseException):
+                reply = request.reply_error(INTERNAL_ERROR, str(reply))
+            if reply is not None:
+                replies.append(reply)
+
+        if replies:
+            await self.write(replies)
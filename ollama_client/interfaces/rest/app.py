@@ -1,24 +1,151 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional
-import uvicorn
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
 
-from ollama_client.core.client import OllamaClient
-from ollama_client.core.models import ModelResponse, GenerationResponse
-from ollama_client.interfaces.rest.schemas import (
-    GenerateRequest,
-    GenerateResponse,
-    ModelListResponse
+from ollama_client.core.cache import SemanticCache, parse_thresholds
+from ollama_client.core.hedging import connect, hedging_options
+from ollama_client.interfaces.rest.jobs import JobQueue, MemoryJobStore, SQLiteJobStore
+from ollama_client.interfaces.rest.limits import (
+    AdmissionController,
+    AdmissionMiddleware,
+    RateLimiter,
+    parse_api_keys,
 )
+from ollama_client.interfaces.rest.metrics import MetricsMiddleware, app_state_collector
+from ollama_client.interfaces.rest.responses import (
+    CompressionMiddleware,
+    FastJSONResponse,
+)
+from ollama_client.interfaces.rest.routes import get_client, router  # noqa: F401
+from ollama_client.interfaces.rest.serving import (
+    APP_PATH,
+    server_options,
+    share_metrics,
+    warm_up,
+    worker_count,
+)
+from ollama_client.interfaces.rest.websocket import ChatSessions
+from ollama_client.utils.metrics import REGISTRY, MultiProcessMetrics
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Create the shared OllamaClient on startup and close it on shutdown"""
+    host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+    timeout = float(os.environ.get("OLLAMA_TIMEOUT", 300))
+    max_connections = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", 100))
+    app.state.batch_concurrency = int(os.environ.get("BATCH_CONCURRENCY", 8))
+
+    app.state.api_keys = parse_api_keys(os.environ.get("API_KEYS"))
+    app.state.rate_limiter = RateLimiter(
+        requests_per_second=float(os.environ.get("RATE_LIMIT_RPS", 0)),
+        request_burst=float(os.environ.get("RATE_LIMIT_BURST", 0)) or None,
+        tokens_per_second=float(os.environ.get("TOKEN_LIMIT_TPS", 0)),
+        token_burst=float(os.environ.get("TOKEN_LIMIT_BURST", 0)) or None,
+    )
+    app.state.admission = AdmissionController(
+        max_in_flight=int(os.environ.get("MAX_IN_FLIGHT", 32)),
+        max_queued=int(os.environ.get("MAX_QUEUED", 128)),
+        queue_timeout=float(os.environ.get("QUEUE_TIMEOUT", 30)),
+    )
+    app.state.chat_sessions = ChatSessions(
+        max_sessions=int(os.environ.get("WS_MAX_SESSIONS", 10000)),
+        ttl=float(os.environ.get("WS_SESSION_TTL", 3600)),
+        max_history=int(os.environ.get("WS_MAX_HISTORY", 50)),
+    )
+
+    cache = None
+    if os.environ.get("SEMANTIC_CACHE", "").lower() in ("1", "true", "yes"):
+        cache = SemanticCache(
+            embed_model=os.environ.get("SEMANTIC_CACHE_MODEL", "nomic-embed-text"),
+            threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+            thresholds=parse_thresholds(
+                os.environ.get("SEMANTIC_CACHE_THRESHOLDS", "")
+            ),
+            max_entries=int(os.environ.get("SEMANTIC_CACHE_SIZE", 10000)),
+            ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", 0)) or None,
+            path=os.environ.get("SEMANTIC_CACHE_PATH") or None,
+        )
+
+    job_store_path = os.environ.get("JOB_STORE")
+    job_store: Optional[MemoryJobStore] = None
+    if job_store_path:
+        job_store = SQLiteJobStore(job_store_path)
+    elif worker_count() == 1:
+        job_store = MemoryJobStore()
+    else:
+        # Jobs in memory would only be visible to the worker that took them
+        logger.warning("Jobs API disabled: several workers need a shared JOB_STORE")
+    app.state.ready = False
+
+    # Set by ``start`` when several workers sum their metrics
+    metrics_dir = os.environ.get("METRICS_DIR")
+    app.state.metrics = MultiProcessMetrics(metrics_dir) if metrics_dir else None
+
+    # Several comma-separated hosts give a client hedging requests across them
+    async with connect(
+        host,
+        hedging_options(),
+        timeout=timeout,
+        max_connections=max_connections,
+        cache=cache,
+    ) as client:
+        app.state.ollama_client = client
+        app.state.job_queue = None
+        if job_store is not None:
+            app.state.job_queue = JobQueue(
+                client, store=job_store, workers=int(os.environ.get("JOB_WORKERS", 4))
+            )
+            await app.state.job_queue.start()
+
+        warmup = asyncio.ensure_future(
+            warm_up(app, client, model=os.environ.get("WARMUP_MODEL") or None)
+        )
+
+        collector = app_state_collector(app)
+        REGISTRY.add_collector(collector)
+        saver = None
+        if app.state.metrics is not None:
+            saver = asyncio.ensure_future(app.state.metrics.run())
+        try:
+            yield
+        finally:
+            app.state.ready = False
+            warmup.cancel()
+            if saver is not None:
+                saver.cancel()
+                # The final counts outlive this worker
+                app.state.metrics.save()
+            REGISTRY.remove_collector(collector)
+            if app.state.job_queue is not None:
+                await app.state.job_queue.stop()
+
 
 app = FastAPI(
     title="Ollama API",
     description="REST API for Ollama LLM",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
+# Compress large buffered responses (streams are left alone)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", 1024)),
+)
+
+# Rate limiting and admission control (inside CORS so rejections get CORS headers)
+app.add_middleware(AdmissionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -28,59 +155,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dependency
-def get_ollama_client():
-    host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
-    return OllamaClient(host=host)
-
-@app.get("/health", summary="Health check endpoint")
-async def health_check():
-    """Check if the API is running"""
-    return {"status": "ok"}
-
-@app.get("/models", response_model=ModelListResponse, summary="List available models")
-async def list_models(client: OllamaClient = Depends(get_ollama_client)):
-    """List all available models in Ollama"""
-    try:
-        models = client.list_models()
-        return {"models": models}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the OllamaClient on startup"""
-    global ollama_client
-
-    host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
-    ollama_client = OllamaClient(host=host)
-
+# Request metrics (outermost, so rejected requests are measured too)
+app.add_middleware(MetricsMiddleware)
 
 # Include routes
+app.include_router(router)
 
-@app.post("/generate", response_model=GenerateResponse, summary="Generate text from prompt")
-async def generate(
-    request: GenerateRequest,
-    client: OllamaClient = Depends(get_ollama_client)
-):
-    """Generate text based on the provided prompt"""
-    try:
-        response = client.generate(
-            prompt=request.prompt,
-            model=request.model,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens
-        )
-        return {"text": response.text, "model": request.model}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
 
-def start():
-    """Start the FastAPI server"""
-    host = os.environ.get("HOST", "0.0.0.0")
-    port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("ollama_client.interfaces.rest.app:app", host=host, port=port, reload=True)
+def start() -> None:
+    """Start the FastAPI server in dev or prod mode (see ``API_MODE``)"""
+    share_metrics()
+    uvicorn.run(APP_PATH, **server_options())
+
 
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    start()
@@ -0,0 +1,596 @@
+"""
+Asynchronous job queue for long-running generations
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import aclosing, contextmanager
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from pydantic import BaseModel
+
+from ollama_client.core.exceptions import OllamaAPIError
+from ollama_client.core.hedging import Client
+from ollama_client.core.streaming import usage_event
+from ollama_client.interfaces.rest.schemas import JobRequest
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+FINISHED = ("succeeded", "failed", "cancelled")
+
+T = TypeVar("T")
+
+
+class Job(BaseModel):
+    id: str
+    request: JobRequest
+    status: JobStatus = "queued"
+    text: str = ""
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class JobQueueFull(Exception):
+    """The job queue has reached its configured size"""
+
+    pass
+
+
+class MemoryJobStore:
+    """Keeps jobs in memory, for a single process; queued jobs are lost on restart
+
+    Only the most recent ``max_jobs`` jobs are kept; the oldest finished
+    jobs are evicted first.
+    """
+
+    # Whether other processes can see and update the same jobs
+    shared = False
+
+    def __init__(self, max_jobs: int = 10000):
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queued: Deque[str] = deque()
+
+    def add(self, job: Job) -> None:
+        """Store a new queued job"""
+        self._remember(job)
+        self._queued.append(job.id)
+
+    def _remember(self, job: Job) -> None:
+        self.jobs[job.id] = job
+        if len(self.jobs) > self.max_jobs:
+            for job_id, stored in list(self.jobs.items()):
+                if stored.status in FINISHED:
+                    del self.jobs[job_id]
+                    break
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def queued(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return len(self._queued)
+
+    def claim(self, owner: str, lease: float) -> Optional[Job]:
+        """Mark the oldest queued job as running for ``owner`` and return it
+
+        The claim holds for ``lease`` seconds unless renewed.
+        """
+        while self._queued:
+            job = self.jobs.get(self._queued.popleft())
+            if job is not None and job.status == "queued":
+                job.status = "running"
+                job.started_at = time.time()
+                return job
+        return None
+
+    def renew(self, job: Job, owner: str, lease: float) -> bool:
+        """Extend ``owner``'s claim on a running job and save its text so far
+
+        Returns False if the job was cancelled or claimed by someone else.
+        """
+        return job.status == "running"
+
+    def finish(self, job: Job, owner: str) -> bool:
+        """Save a finished job; returns False if it was cancelled meanwhile"""
+        self._remember(job)
+        return True
+
+    def release(self, job: Job, owner: str) -> None:
+        """Return a claimed job to the queue, to be run again from the start"""
+        job.status = "queued"
+        job.text = ""
+        job.started_at = None
+        self._queued.appendleft(job.id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; finished jobs are returned unchanged"""
+        job = self.jobs.get(job_id)
+        if job is not None and job.status not in FINISHED:
+            if job.status == "queued":
+                self._queued.remove(job_id)
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteJobStore(MemoryJobStore):
+    """Persists jobs to SQLite, shared by every process using the same file
+
+    Processes claim queued jobs with an atomic update and hold them under
+    a lease, renewed while the job runs. A job left running by a process
+    that died is claimed again once its lease expires. Rows are written on
+    state changes and lease renewals, never per token, so the store stays
+    off the streaming hot path. Jobs claimed by this process are also kept
+    in memory so their text can be read live.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._lock = threading.Lock()
+        # Autocommit, with explicit transactions where a read and a write
+        # must be atomic across processes
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, "
+            "owner TEXT, lease_until REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column in ("owner TEXT", "lease_until REAL"):
+            if column.split()[0] not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def _query(self, sql: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _update(self, sql: str, params: Tuple[Any, ...]) -> int:
+        with self._lock:
+            return self._db.execute(sql, params).rowcount
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """An immediate transaction, so no other process writes in between"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def add(self, job: Job) -> None:
+        self._update(
+            "INSERT INTO jobs (id, status, data) VALUES (?, ?, ?)",
+            (job.id, job.status, job.model_dump_json()),
+        )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        rows = self._query("SELECT status, data FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        local = self.jobs.get(job_id)
+        if local is not None and rows[0][0] == "running":
+            return local
+        return Job.model_validate_json(rows[0][1])
+
+    def queued(self) -> int:
+        return int(
+            self._query("SELECT COUNT(*) FROM jobs WHERE status = 'queued'")[0][0]
+        )
+
+    def claim(self, owner: str, lease: float) -> Optional[Job]:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT data FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND COALESCE(lease_until, 0) < ?) "
+                "ORDER BY rowid LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = Job.model_validate_json(row[0])
+            # A job taken over from a dead process starts again
+            job.status = "running"
+            job.text = ""
+            job.started_at = now
+            db.execute(
+                "UPDATE jobs SET status = ?, data = ?, owner = ?, lease_until = ? "
+                "WHERE id = ?",
+                (job.status, job.model_dump_json(), owner, now + lease, job.id),
+            )
+        self.jobs[job.id] = job
+        return job
+
+    def renew(self, job: Job, owner: str, lease: float) -> bool:
+        renewed = self._update(
+            "UPDATE jobs SET data = ?, lease_until = ? "
+            "WHERE id = ? AND owner = ? AND status = 'running'",
+            (job.model_dump_json(), time.time() + lease, job.id, owner),
+        )
+        if not renewed:
+            self.jobs.pop(job.id, None)
+        return bool(renewed)
+
+    def finish(self, job: Job, owner: str) -> bool:
+        self.jobs.pop(job.id, None)
+        return bool(
+            self._update(
+                "UPDATE jobs SET status = ?, data = ?, owner = NULL, "
+                "lease_until = NULL WHERE id = ? AND owner = ? AND status = 'running'",
+                (job.status, job.model_dump_json(), job.id, owner),
+            )
+        )
+
+    def release(self, job: Job, owner: str) -> None:
+        self.jobs.pop(job.id, None)
+        job.status = "queued"
+        job.text = ""
+        job.started_at = None
+        self._update(
+            "UPDATE jobs SET status = ?, data = ?, owner = NULL, lease_until = NULL "
+            "WHERE id = ? AND owner = ? AND status = 'running'",
+            (job.status, job.model_dump_json(), job.id, owner),
+        )
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._transaction() as db:
+            row = db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = Job.model_validate_json(row[0])
+            if job.status in FINISHED:
+                return job
+            local = self.jobs.pop(job_id, None)
+            if local is not None:
+                job.text = local.text
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            db.execute(
+                "UPDATE jobs SET status = ?, data = ?, owner = NULL, "
+                "lease_until = NULL WHERE id = ?",
+                (job.status, job.model_dump_json(), job_id),
+            )
+        return job
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JobQueue:
+    """Bounded pool of workers running generate/chat jobs from a job store
+
+    Workers stream from Ollama so partial text is visible while a job runs
+    and can be followed live via ``subscribe``. With a shared store, any
+    number of processes can serve the same jobs. Each polls the store for
+    queued jobs every ``poll_interval`` seconds and renews its claims as
+    often, which saves their text and stops jobs cancelled by another
+    process.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        store: Optional[MemoryJobStore] = None,
+        workers: int = 4,
+        max_queued: int = 1000,
+        poll_interval: float = 0.5,
+        lease: float = 30.0,
+    ):
+        self.client = client
+        self.store = store or MemoryJobStore()
+        self.workers = workers
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.lease = lease
+        # Identifies this queue's claims in a shared store
+        self.owner = uuid.uuid4().hex
+        self._slots = asyncio.Semaphore(workers)
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._cancelled: Set[str] = set()
+        self._on_usage: Dict[str, Callable[[Optional[int]], None]] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def start(self) -> None:
+        """Start taking jobs from the store, including any left by a restart"""
+        self._tasks = [asyncio.ensure_future(self._dispatch())]
+        if self.store.shared:
+            self._tasks.append(asyncio.ensure_future(self._renew_leases()))
+
+    async def stop(self) -> None:
+        """Stop the workers; running jobs go back to the queue of a shared store"""
+        for task in self._tasks:
+            task.cancel()
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *running, return_exceptions=True)
+        self.store.close()
+
+    def submit(
+        self,
+        request: JobRequest,
+        on_usage: Optional[Callable[[Optional[int]], None]] = None,
+    ) -> Job:
+        """Enqueue a new job
+
+        ``on_usage`` is called with the job's ``eval_count`` when it
+        succeeds, if it runs in this process.
+        """
+        if self.store.queued() >= self.max_queued:
+            raise JobQueueFull(f"Job queue is full ({self.max_queued} jobs)")
+
+        job = Job(id=uuid.uuid4().hex, request=request, created_at=time.time())
+        if on_usage is not None:
+            self._on_usage[job.id] = on_usage
+        self.store.add(job)
+        self._wakeup.set()
+        return job
+
+    @property
+    def queued(self) -> int:
+        """Jobs waiting for a worker"""
+        return self.store.queued()
+
+    @property
+    def running(self) -> int:
+        """Jobs being generated by this process"""
+        return len(self._running)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self._call(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; returns None if unknown
+
+        Finished jobs are returned unchanged. A job running in another
+        process is stopped by that process within ``poll_interval``.
+        """
+        job = await self._call(self.store.cancel, job_id)
+        if job is None or job.status != "cancelled":
+            return job
+
+        task = self._running.get(job_id)
+        if task is not None:
+            # Closing the stream stops Ollama; the worker just moves on
+            self._cancelled.add(job_id)
+            task.cancel()
+        self._on_usage.pop(job_id, None)
+        self._publish(job_id, self._final_event(job))
+        return job
+
+    async def subscribe(self, job_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield a job's events: text produced so far, then live tokens
+
+        Tokens of a job running in this process are yielded as they are
+        generated. Those of a job in another process are read back from
+        the store every ``poll_interval``.
+        """
+        job = await self._call(self.store.get, job_id)
+        if job is None:
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        getter: Optional[asyncio.Future] = None
+        sent = len(job.text)
+        try:
+            if job.text:
+                yield {"type": "token", "text": job.text}
+            if job.status in FINISHED:
+                yield self._final_event(job)
+                return
+
+            timeout = self.poll_interval if self.store.shared else None
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    if job_id in self._running:
+                        continue
+                    polled = await self._call(self.store.get, job_id)
+                    if polled is None:
+                        return
+                    if len(polled.text) > sent:
+                        yield {"type": "token", "text": polled.text[sent:]}
+                        sent = len(polled.text)
+                    if polled.status in FINISHED:
+                        yield self._final_event(polled)
+                        return
+                    continue
+
+                event = getter.result()
+                getter = None
+                if event["type"] == "token":
+                    sent += len(event["text"])
+                yield event
+                if event["type"] != "token":
+                    return
+        finally:
+            if getter is not None:
+                getter.cancel()
+            self._subscribers[job_id].remove(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
+
+    async def _dispatch(self) -> None:
+        """Claim jobs from the store whenever a worker is free"""
+        while True:
+            await self._slots.acquire()
+            job = await self._next_job()
+            task = asyncio.ensure_future(self._execute(job))
+            self._jobs[job.id] = job
+            self._running[job.id] = task
+            task.add_done_callback(lambda _: self._slots.release())
+
+    async def _next_job(self) -> Job:
+        while True:
+            # Cleared before claiming, so a job submitted meanwhile is not missed
+            self._wakeup.clear()
+            claim = asyncio.ensure_future(
+                self._call(self.store.claim, self.owner, self.lease)
+            )
+            try:
+                job = await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                # A claim under way still completes: hand its job back
+                job = await claim
+                if job is not None:
+                    await self._call(self.store.release, job, self.owner)
+                raise
+            if job is not None:
+                return job
+            # Only a shared store gets jobs submitted by other processes
+            timeout = self.poll_interval if self.store.shared else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _renew_leases(self) -> None:
+        """Renew claims on running jobs and stop those cancelled elsewhere"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for job_id, task in list(self._running.items()):
+                job = self._jobs[job_id]
+                renewed = await self._call(
+                    self.store.renew, job, self.owner, self.lease
+                )
+                if not renewed:
+                    self._cancelled.add(job_id)
+                    task.cancel()
+                    self._publish(job_id, {"type": "cancelled"})
+
+    async def _execute(self, job: Job) -> None:
+        try:
+            await self._run(job)
+        except asyncio.CancelledError:
+            if job.id not in self._cancelled:
+                # Stopping: the job is left for another process or a restart
+                await self._call(self.store.release, job, self.owner)
+                raise
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            await self._finish(job, "failed", error=str(e))
+        finally:
+            self._running.pop(job.id, None)
+            self._jobs.pop(job.id, None)
+            self._cancelled.discard(job.id)
+
+    async def _run(self, job: Job) -> None:
+        request = job.request
+        if request.type == "chat":
+            chunks = self.client.chat_stream(
+                messages=[m.model_dump() for m in request.messages or []],
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+            )
+        else:
+            chunks = self.client.generate_stream(
+                prompt=request.prompt or "",
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+            )
+
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if "error" in chunk:
+                    raise OllamaAPIError(f"Ollama stream failed: {chunk['error']}")
+                if request.type == "chat":
+                    text = chunk.get("message", {}).get("content", "")
+                else:
+                    text = chunk.get("response", "")
+
+                if text:
+                    job.text += text
+                    self._publish(job.id, {"type": "token", "text": text})
+
+                if chunk.get("done"):
+                    event = usage_event(chunk, request.model)
+                    await self._finish(job, "succeeded", event=event)
+                    return
+
+        raise OllamaAPIError("Ollama stream ended before the final chunk")
+
+    async def _finish(
+        self,
+        job: Job,
+        status: JobStatus,
+        event: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        if status == "succeeded" and event is not None:
+            job.result = {k: v for k, v in event.items() if k != "type"}
+        on_usage = self._on_usage.pop(job.id, None)
+        if on_usage is not None and job.result is not None:
+            on_usage(job.result.get("eval_count"))
+        if await self._call(self.store.finish, job, self.owner):
+            self._publish(job.id, self._final_event(job))
+        else:
+            # Cancelled by another process before it finished
+            self._publish(job.id, {"type": "cancelled"})
+
+    async def _call(self, method: Callable[..., T], *args: Any) -> T:
+        """Call a store method, in a thread if the store is shared
+
+        A shared store waits on other processes for its lock, which must
+        not block the event loop.
+        """
+        if self.store.shared:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def _final_event(self, job: Job) -> Dict[str, Any]:
+        if job.status == "succeeded":
+            return {"type": "done", **(job.result or {})}
+        if job.status == "failed":
+            return {"type": "error", "error": job.error}
+        return {"type": "cancelled"}
+
+    def _publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait(event)
@@ -0,0 +1,317 @@
+"""
+Admission control, rate limiting and load shedding for the REST API
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Collection,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Tuple,
+)
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Paths that are never rate limited
+EXEMPT_PATHS = (
+    "/health",
+    "/ready",
+    "/limits",
+    "/metrics",
+    "/docs",
+    "/redoc",
+    "/openapi.json",
+)
+
+# Paths whose requests occupy an upstream generation slot. ``/batch``
+# takes one per line it runs instead (see ``routes.batch``).
+GENERATION_PATHS = ("/generate", "/chat")
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` per second
+
+    ``consume`` may push the level below zero; the bucket then rejects work
+    until it has refilled, which lets usage be charged after the fact.
+    """
+
+    __slots__ = ("rate", "capacity", "level", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """Take ``amount`` if available; otherwise return seconds to wait"""
+        self._refill()
+        if self.level >= amount:
+            self.level -= amount
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def wait_time(self) -> float:
+        """Seconds until the bucket holds a whole token again (0 if it does)"""
+        self._refill()
+        return 0.0 if self.level >= 1 else (1 - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Charge ``amount`` unconditionally"""
+        self._refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    """Per-key token buckets for requests and generated tokens
+
+    A rate of 0 disables that limit. Only the ``max_keys`` most recently
+    seen keys are tracked.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = 0.0,
+        request_burst: Optional[float] = None,
+        tokens_per_second: float = 0.0,
+        token_burst: Optional[float] = None,
+        max_keys: int = 10000,
+    ):
+        self.requests_per_second = requests_per_second
+        self.request_burst = request_burst or max(requests_per_second, 1.0)
+        self.tokens_per_second = tokens_per_second
+        self.token_burst = token_burst or max(tokens_per_second * 10, 1.0)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Dict[str, TokenBucket]]" = OrderedDict()
+        self.rejected_requests = 0
+        self.rejected_tokens = 0
+
+    def _buckets_for(self, key: str) -> Dict[str, TokenBucket]:
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            buckets = {}
+            if self.requests_per_second:
+                buckets["requests"] = TokenBucket(
+                    self.requests_per_second, self.request_burst
+                )
+            if self.tokens_per_second:
+                buckets["tokens"] = TokenBucket(
+                    self.tokens_per_second, self.token_burst
+                )
+            self._buckets[key] = buckets
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return buckets
+
+    def check(self, key: str) -> float:
+        """Admit one request for ``key``; return a retry delay if limited"""
+        buckets = self._buckets_for(key)
+
+        tokens = buckets.get("tokens")
+        if tokens is not None:
+            wait = tokens.wait_time()
+            if wait:
+                self.rejected_tokens += 1
+                return wait
+
+        requests = buckets.get("requests")
+        if requests is not None:
+            wait = requests.try_acquire()
+            if wait:
+                self.rejected_requests += 1
+                return wait
+
+        return 0.0
+
+    def record_tokens(self, key: str, count: Optional[int]) -> None:
+        """Charge generated tokens (Ollama's ``eval_count``) to ``key``"""
+        if count and self.tokens_per_second:
+            self._buckets_for(key)["tokens"].consume(count)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "tracked_keys": len(self._buckets),
+            "rejected_requests": self.rejected_requests,
+            "rejected_tokens": self.rejected_tokens,
+            "requests_per_second": self.requests_per_second,
+            "tokens_per_second": self.tokens_per_second,
+        }
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full or a queued request times out"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__("Server overloaded")
+
+
+class AdmissionController:
+    """Global cap on in-flight generations with a bounded wait queue
+
+    Up to ``max_in_flight`` requests run at once and up to ``max_queued``
+    more wait for a slot for at most ``queue_timeout`` seconds. Anything
+    beyond that is shed immediately rather than added to the backlog.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        max_queued: int = 128,
+        queue_timeout: float = 30.0,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # Exponentially weighted mean time a slot is held, for Retry-After
+        self._service_time = 1.0
+
+    def retry_after(self) -> float:
+        """Estimated seconds until a new request could get a slot"""
+        return self._service_time * (self.queued + 1) / self.max_in_flight
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a generation slot for the duration of the block"""
+        if self._slots.locked():
+            if self.queued >= self.max_queued:
+                self.shed += 1
+                raise Overloaded(self.retry_after())
+
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                raise Overloaded(self.retry_after()) from None
+            finally:
+                self.queued -= 1
+        else:
+            await self._slots.acquire()
+
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self._service_time = 0.9 * self._service_time + 0.1 * (
+                time.monotonic() - started
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "shed": self.shed,
+        }
+
+
+def parse_api_keys(value: Optional[str]) -> FrozenSet[str]:
+    """Parse the comma-separated ``API_KEYS`` setting"""
+    return frozenset(key.strip() for key in (value or "").split(",") if key.strip())
+
+
+def client_key(scope: Scope, api_keys: Collection[str] = ()) -> str:
+    """Identify the caller by API key, falling back to the client address
+
+    Only keys in ``api_keys`` count: any other value is chosen by the
+    caller, who could otherwise get a fresh bucket per request.
+    """
+    headers: List[Tuple[bytes, bytes]] = scope.get("headers", [])
+    for name, value in headers:
+        if name == b"x-api-key":
+            key = value.decode("latin-1")
+        elif name == b"authorization" and value.lower().startswith(b"bearer "):
+            key = value[7:].decode("latin-1")
+        else:
+            continue
+        if key in api_keys:
+            return "key:" + key
+
+    client = scope.get("client")
+    host: str = client[0] if client else "unknown"
+    return "ip:" + host
+
+
+def record_usage(request: Request, eval_count: Optional[int]) -> None:
+    """Charge tokens generated for ``request`` to its caller's token bucket"""
+    limiter = getattr(request.app.state, "rate_limiter", None)
+    key = request.scope.get("state", {}).get("rate_limit_key")
+    if limiter is not None and key is not None:
+        limiter.record_tokens(key, eval_count)
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying rate limits and admission control
+
+    Implemented as plain ASGI rather than ``BaseHTTPMiddleware`` so that a
+    generation slot stays held until a streamed response has finished.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        state = scope["app"].state
+        limiter: Optional[RateLimiter] = getattr(state, "rate_limiter", None)
+        admission: Optional[AdmissionController] = getattr(state, "admission", None)
+
+        key = client_key(scope, getattr(state, "api_keys", ()))
+        scope.setdefault("state", {})["rate_limit_key"] = key
+
+        if limiter is not None:
+            wait = limiter.check(key)
+            if wait:
+                await _reject(429, "Rate limit exceeded", wait)(scope, receive, send)
+                return
+
+        if (
+            admission is None
+            or scope["method"] != "POST"
+            or scope["path"] not in GENERATION_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            async with admission.slot():
+                await self.app(scope, receive, send)
+        except Overloaded as e:
+            await _reject(503, str(e), e.retry_after)(scope, receive, send)
@@ -0,0 +1,72 @@
+"""
+Request metrics for the REST API
+"""
+
+import time
+from typing import Callable
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ollama_client.utils.metrics import IN_FLIGHT, QUEUED, REJECTED, REQUEST_LATENCY
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests
+
+    Routes are labelled by their path template (``/jobs/{job_id}``) so label
+    cardinality stays bounded. Latency covers the whole response, including
+    the body of streamed responses.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.in_flight = IN_FLIGHT.labels("rest")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels("rest", path, str(status)).observe(
+                time.perf_counter() - started
+            )
+
+
+def app_state_collector(app: FastAPI) -> Callable[[], None]:
+    """Build a collector exporting admission, limiter and job queue state"""
+
+    def collect() -> None:
+        state = app.state
+        admission = getattr(state, "admission", None)
+        if admission is not None:
+            QUEUED.labels("rest").set(admission.queued)
+            REJECTED.labels("shed").set(admission.shed)
+
+        limiter = getattr(state, "rate_limiter", None)
+        if limiter is not None:
+            REJECTED.labels("rate_limit").set(limiter.rejected_requests)
+            REJECTED.labels("token_limit").set(limiter.rejected_tokens)
+
+        job_queue = getattr(state, "job_queue", None)
+        if job_queue is not None:
+            QUEUED.labels("jobs").set(job_queue.queued)
+            IN_FLIGHT.labels("jobs").set(job_queue.running)
+
+    return collect
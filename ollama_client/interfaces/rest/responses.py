@@ -0,0 +1,156 @@
+"""
+Fast JSON responses and response compression for the REST API
+"""
+
+import gzip
+import hashlib
+from typing import Any, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic_core import to_json
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Content types worth compressing; streams are never compressed
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/plain",
+    "text/html",
+    "application/x-ndjson",
+)
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact JSON bytes, models included, without validation
+
+    orjson is fastest for plain data; anything holding pydantic models
+    goes to pydantic-core's serializer, which dumps them without a
+    round-trip through Python dicts.
+    """
+    if orjson is not None:
+        try:
+            encoded: bytes = orjson.dumps(content)
+            return encoded
+        except TypeError:
+            pass
+    return to_json(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response serialized by ``dumps`` rather than ``json.dumps``
+
+    Returning it from a route bypasses FastAPI's ``response_model``
+    validation, so it is only used for objects we built ourselves.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def etag_response(request: Request, content: Any) -> Response:
+    """Serialize ``content`` with an ETag, answering 304 if it matches"""
+    body = dumps(content)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if (
+        etag in (tag.strip() for tag in if_none_match.split(","))
+        or if_none_match == "*"
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _accepted_encodings(headers: Headers) -> List[str]:
+    accepted = []
+    for part in headers.get("accept-encoding", "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.append(coding.lower())
+    return accepted
+
+
+def _compressor(headers: Headers) -> Optional[Tuple[str, Any]]:
+    accepted = _accepted_encodings(headers)
+    if brotli is not None and "br" in accepted:
+        return "br", lambda body: brotli.compress(body, quality=4)
+    if "gzip" in accepted:
+        return "gzip", lambda body: gzip.compress(body, compresslevel=6)
+    return None
+
+
+class CompressionMiddleware:
+    """Compress large buffered responses with brotli (if installed) or gzip
+
+    Unlike Starlette's ``GZipMiddleware`` only single-message responses are
+    compressed; streamed SSE/NDJSON responses pass through untouched so
+    tokens are never held back in a compressor buffer.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.minimum_size:
+            await self.app(scope, receive, send)
+            return
+
+        compressor = _compressor(Headers(scope=scope))
+        if compressor is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+
+            response_start, start = start, None
+            headers = MutableHeaders(raw=response_start["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(response_start)
+                await send(message)
+                return
+
+            encoding, compress = compressor
+            body = compress(body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(response_start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,76 +1,306 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional
 
-from ollama_client.core.client import OllamaClient
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket
+from fastapi.requests import HTTPConnection
+from fastapi.responses import JSONResponse
+
+from ollama_client.core.batch import run_batch, split_lines
+from ollama_client.core.client import AsyncOllamaClient
+from ollama_client.interfaces.rest.jobs import FINISHED, Job, JobQueue, JobQueueFull
+from ollama_client.interfaces.rest.limits import record_usage
+from ollama_client.interfaces.rest.responses import FastJSONResponse, etag_response
 from ollama_client.interfaces.rest.schemas import (
+    ChatRequest,
+    ChatResponse,
     GenerateRequest,
     GenerateResponse,
+    JobRequest,
+    JobResponse,
     ModelListResponse,
-    ChatRequest,
-    ChatResponse,
-    ChatMessage
 )
+from ollama_client.interfaces.rest.streaming import (
+    NDJSON_MEDIA_TYPE,
+    EventStreamResponse,
+    JSONLinesResponse,
+    negotiate_stream,
+    stream_response,
+)
+from ollama_client.interfaces.rest.websocket import ChatConnection
+from ollama_client.utils.metrics import CONTENT_TYPE, REGISTRY
 
 router = APIRouter()
 
-def get_ollama_client():
-    """Dependency to get OllamaClient instance"""
-    from ollama_client.interfaces.rest.app import get_client
-    return get_client()
+
+def get_client(connection: HTTPConnection) -> AsyncOllamaClient:
+    """Return the shared client created by the app lifespan"""
+    client: AsyncOllamaClient = connection.app.state.ollama_client
+    return client
+
+
+def get_ollama_client(request: Request) -> AsyncOllamaClient:
+    """Dependency to get the shared AsyncOllamaClient instance"""
+    return get_client(request)
+
+
+def get_job_queue(request: Request) -> JobQueue:
+    """Dependency to get the job queue started by the app lifespan"""
+    queue: Optional[JobQueue] = request.app.state.job_queue
+    if queue is None:
+        raise HTTPException(
+            status_code=503, detail="Jobs need a shared JOB_STORE when API_WORKERS > 1"
+        )
+    return queue
+
 
 @router.get("/health", summary="Health check endpoint")
-async def health_check(client: OllamaClient = Depends(get_ollama_client)):
+async def health_check(
+    client: AsyncOllamaClient = Depends(get_ollama_client),
+) -> Dict[str, str]:
     """Check if the API and Ollama are running"""
-    ollama_health = client.health()
+    ollama_health = await client.health()
     return {"api_status": "ok", "ollama_status": "ok" if ollama_health else "down"}
 
-@router.get("/models", response_model=ModelListResponse, summary="List available models")
-async def list_models(client: OllamaClient = Depends(get_ollama_client)):
-    """List all available models in Ollama"""
+
+@router.get("/ready", summary="Readiness probe")
+async def ready(request: Request) -> Response:
+    """Report whether the upstream has been reached since startup"""
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return JSONResponse({"status": "ready"})
+
+
+@router.get("/metrics", summary="Prometheus metrics")
+async def metrics(request: Request) -> Response:
+    """Expose metrics in the Prometheus text exposition format
+
+    With several workers sharing ``METRICS_DIR``, these are the totals of
+    all of them, whichever worker answers.
+    """
+    shared = getattr(request.app.state, "metrics", None)
+    body = shared.render() if shared is not None else REGISTRY.render()
+    return Response(body, media_type=CONTENT_TYPE)
+
+
+@router.get("/limits", summary="Rate limiter and admission state")
+async def limits(request: Request) -> Dict[str, Any]:
+    """Report rate limiter and admission control state"""
+    state = request.app.state
+    limiter = getattr(state, "rate_limiter", None)
+    admission = getattr(state, "admission", None)
+    return {
+        "rate_limiter": limiter.snapshot() if limiter else None,
+        "admission": admission.snapshot() if admission else None,
+    }
+
+
+@router.get(
+    "/models", response_model=ModelListResponse, summary="List available models"
+)
+async def list_models(
+    raw_request: Request, client: AsyncOllamaClient = Depends(get_ollama_client)
+) -> Response:
+    """List all available models in Ollama
+
+    Supports ``If-None-Match``: an unchanged list is answered with 304.
+    """
     try:
-        models = client.list_models()
-        return {"models": models}
+        models = await client.list_models()
+        return etag_response(raw_request, {"models": models})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e)) from e
 
-@router.post("/generate", response_model=GenerateResponse, summary="Generate text from prompt")
+
+@router.post(
+    "/generate", response_model=GenerateResponse, summary="Generate text from prompt"
+)
 async def generate(
     request: GenerateRequest,
-    client: OllamaClient = Depends(get_ollama_client)
-):
-    """Generate text based on the provided prompt"""
+    raw_request: Request,
+    client: AsyncOllamaClient = Depends(get_ollama_client),
+) -> Response:
+    """Generate text based on the provided prompt
+
+    Streams SSE or NDJSON events when requested via ``Accept`` or ``stream``.
+    """
+    media_type = negotiate_stream(raw_request, request.stream)
+    if media_type:
+        chunks = client.generate_stream(
+            prompt=request.prompt,
+            model=request.model,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+        )
+        return await stream_response(
+            chunks,
+            lambda chunk: chunk.get("response", ""),
+            request.model,
+            media_type,
+            on_done=lambda event: record_usage(raw_request, event.get("eval_count")),
+        )
+
     try:
-        response = client.generate(
+        response = await client.generate(
             prompt=request.prompt,
             model=request.model,
             temperature=request.temperature,
-            max_tokens=request.max_tokens
+            max_tokens=request.max_tokens,
         )
-        return {"text": response.text, "model": request.model}
+        record_usage(raw_request, response.eval_count)
+        return FastJSONResponse({"text": response.text, "model": request.model})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
 
 @router.post("/chat", response_model=ChatResponse, summary="Chat with the model")
 async def chat(
     request: ChatRequest,
-    client: OllamaClient = Depends(get_ollama_client)
-):
-    """Chat with the model using a list of messages"""
+    raw_request: Request,
+    client: AsyncOllamaClient = Depends(get_ollama_client),
+) -> Response:
+    """Chat with the model using a list of messages
+
+    Streams SSE or NDJSON events when requested via ``Accept`` or ``stream``.
+    """
+    # Convert ChatMessage objects to dictionaries
+    messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+
+    media_type = negotiate_stream(raw_request, request.stream)
+    if media_type:
+        chunks = client.chat_stream(
+            messages=messages,
+            model=request.model,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+        )
+        return await stream_response(
+            chunks,
+            lambda chunk: chunk.get("message", {}).get("content", ""),
+            request.model,
+            media_type,
+            on_done=lambda event: record_usage(raw_request, event.get("eval_count")),
+        )
+
     try:
-        # Convert ChatMessage objects to dictionaries
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-        
-        response = client.chat(
+        response = await client.chat(
             messages=messages,
             model=request.model,
             temperature=request.temperature,
-            max_tokens=request.max_tokens
+            max_tokens=request.max_tokens,
+        )
+        record_usage(raw_request, response.eval_count)
+
+        return FastJSONResponse(
+            {
+                "message": {"role": "assistant", "content": response.text},
+                "model": request.model,
+            }
         )
-        
-        return {
-            "message": ChatMessage(role="assistant", content=response.text),
-            "model": request.model
-        }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.post("/batch", summary="Run a JSONL batch of generate/chat requests")
+async def batch(
+    raw_request: Request, client: AsyncOllamaClient = Depends(get_ollama_client)
+) -> Response:
+    """Run a JSONL body of generate/chat requests concurrently
+
+    Each input line is a generate request (``prompt``) or chat request
+    (``messages``) with an optional ``id``. Results are streamed back as
+    JSONL in completion order, tagged with the caller's id (or the line
+    number), with failures reported per line. Each line takes its own
+    admission slot, so a batch counts as many generations as it runs.
+    """
+    concurrency = raw_request.app.state.batch_concurrency
+    admission = getattr(raw_request.app.state, "admission", None)
+    slot = admission.slot if admission is not None else None
+    body_consumed = asyncio.Event()
+
+    async def lines() -> AsyncIterator[bytes]:
+        async for line in split_lines(raw_request.stream()):
+            yield line
+        body_consumed.set()
+
+    async def results() -> AsyncGenerator[Dict[str, Any], None]:
+        async with aclosing(
+            run_batch(client, lines(), concurrency, slot)
+        ) as batch_results:
+            async for result in batch_results:
+                record_usage(raw_request, result.get("eval_count"))
+                yield result
+
+    return JSONLinesResponse(results(), body_consumed)
+
+
+@router.post(
+    "/jobs",
+    response_model=JobResponse,
+    status_code=202,
+    summary="Enqueue a generate/chat job",
+)
+async def create_job(
+    request: JobRequest, raw_request: Request, queue: JobQueue = Depends(get_job_queue)
+) -> Job:
+    """Enqueue a generate or chat request and return its job id immediately"""
+    if request.type == "chat" and not request.messages:
+        raise HTTPException(status_code=400, detail="Messages are required")
+    if request.type == "generate" and not request.prompt:
+        raise HTTPException(status_code=400, detail="Prompt is required")
+
+    try:
+        return queue.submit(
+            request, on_usage=lambda eval_count: record_usage(raw_request, eval_count)
+        )
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "5"}
+        ) from e
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, summary="Get job status")
+async def get_job(job_id: str, queue: JobQueue = Depends(get_job_queue)) -> Job:
+    """Poll a job for its status, partial text and result"""
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/stream", summary="Stream job output")
+async def stream_job(
+    job_id: str, raw_request: Request, queue: JobQueue = Depends(get_job_queue)
+) -> Response:
+    """Stream a job's text so far and then its live tokens (SSE or NDJSON)"""
+    if await queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+
+    media_type = negotiate_stream(raw_request, True) or NDJSON_MEDIA_TYPE
+    return EventStreamResponse(queue.subscribe(job_id), media_type)
+
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse, summary="Cancel a job")
+async def cancel_job(
+    job_id: str, queue: JobQueue = Depends(get_job_queue)
+) -> Optional[Job]:
+    """Cancel a queued or running job"""
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    if job.status in FINISHED:
+        raise HTTPException(
+            status_code=409, detail=f"Job '{job_id}' is already {job.status}"
+        )
+    return await queue.cancel(job_id)
+
+
+@router.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket) -> None:
+    """Multi-turn chat over one connection with server-side history
+
+    Pass ``?session_id=`` to resume a conversation after reconnecting.
+    """
+    await ChatConnection(
+        websocket, get_client(websocket), websocket.app.state.chat_sessions
+    ).run()
@@ -1,36 +1,60 @@
+from typing import Any, Dict, List, Literal, Optional
+
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+
+from ollama_client.core.client import ModelInfo
+
 
 class GenerateRequest(BaseModel):
     prompt: str
     model: str = "llama3"
     temperature: float = Field(0.7, ge=0.0, le=1.0)
     max_tokens: int = Field(512, gt=0)
+    stream: bool = False
+
 
 class GenerateResponse(BaseModel):
     text: str
     model: str
 
-class ModelInfo(BaseModel):
-    name: str
-    size: int
-    modified_at: str
-    digest: Optional[str] = None
-    details: Optional[Dict[str, Any]] = None
 
 class ModelListResponse(BaseModel):
     models: List[ModelInfo]
 
+
 class ChatMessage(BaseModel):
     role: str
     content: str
 
+
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     model: str = "llama3"
     temperature: float = Field(0.7, ge=0.0, le=1.0)
     max_tokens: int = Field(512, gt=0)
+    stream: bool = False
+
 
 class ChatResponse(BaseModel):
     message: ChatMessage
-    model: str
\ No newline at end of file
+    model: str
+
+
+class JobRequest(BaseModel):
+    type: Literal["generate", "chat"] = "generate"
+    prompt: Optional[str] = None
+    messages: Optional[List[ChatMessage]] = None
+    model: str = "llama3"
+    temperature: float = Field(0.7, ge=0.0, le=1.0)
+    max_tokens: int = Field(512, gt=0)
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    text: str = ""
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
@@ -0,0 +1,105 @@
+"""
+Server settings and upstream warm-up for the REST API
+
+``dev`` mode runs a single auto-reloading worker. ``prod`` mode runs
+several worker processes without reload, each with its own Ollama
+connection pool created by the app lifespan.
+"""
+
+import asyncio
+import glob
+import importlib.util
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI
+
+from ollama_client.core.hedging import Client
+
+logger = logging.getLogger(__name__)
+
+APP_PATH = "ollama_client.interfaces.rest.app:app"
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def worker_count() -> int:
+    """Number of worker processes uvicorn runs in the configured mode"""
+    if os.environ.get("API_MODE", "dev") != "prod":
+        return 1
+    return int(os.environ.get("API_WORKERS") or os.cpu_count() or 1)
+
+
+def share_metrics() -> None:
+    """Give several workers a directory to sum their metrics in (``METRICS_DIR``)
+
+    A given directory is emptied of the metrics of a previous run, since
+    counters start again from zero.
+    """
+    if worker_count() == 1:
+        return
+    directory = os.environ.get("METRICS_DIR")
+    if not directory:
+        os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="ollama-client-metrics-")
+        return
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+
+
+def server_options() -> Dict[str, Any]:
+    """Build ``uvicorn.run`` keyword arguments from the environment"""
+    options: Dict[str, Any] = {
+        "host": os.environ.get("HOST", "0.0.0.0"),
+        "port": int(os.environ.get("PORT", 8000)),
+    }
+
+    if os.environ.get("API_MODE", "dev") != "prod":
+        options["reload"] = True
+        return options
+
+    options.update(
+        workers=worker_count(),
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        # Longer than typical load balancer idle timeouts (60s), so the
+        # proxy rather than the API closes idle keep-alive connections
+        timeout_keep_alive=int(os.environ.get("API_KEEP_ALIVE", 75)),
+        backlog=int(os.environ.get("API_BACKLOG", 2048)),
+        # On SIGTERM stop accepting, then let in-flight requests finish
+        timeout_graceful_shutdown=int(os.environ.get("API_GRACEFUL_TIMEOUT", 30)),
+        access_log=False,
+    )
+    return options
+
+
+async def warm_up(
+    app: FastAPI,
+    client: Client,
+    model: Optional[str] = None,
+    max_delay: float = 10.0,
+) -> None:
+    """Mark the app ready once Ollama answers, retrying with backoff
+
+    Listing models opens the first pooled connection; if ``model`` is set
+    it is also loaded into memory with an empty prompt, so the first real
+    request does not pay the model load time. The semantic cache never
+    stores the reply to an empty prompt.
+    """
+    delay = 0.5
+    while True:
+        try:
+            await client.list_models()
+            if model:
+                await client.generate(prompt="", model=model, max_tokens=1)
+            app.state.ready = True
+            logger.info("Ollama is reachable; API is ready")
+            return
+        except Exception as e:
+            logger.warning(f"Waiting for Ollama: {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
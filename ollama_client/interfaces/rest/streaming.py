@@ -0,0 +1,150 @@
+"""
+Streaming responses (Server-Sent Events and NDJSON) for the REST API
+"""
+
+import asyncio
+import json
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from ollama_client.core.streaming import stream_events
+
+SSE_MEDIA_TYPE = "text/event-stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Sources of events, closed explicitly when the response ends
+Events = AsyncGenerator[Dict[str, Any], None]
+
+
+def negotiate_stream(request: Request, stream: bool) -> Optional[str]:
+    """Return the streaming media type requested by the client, if any
+
+    An explicit ``Accept`` header wins; ``stream: true`` in the body without
+    one falls back to NDJSON, the format Ollama itself uses.
+    """
+    accept = request.headers.get("accept", "")
+    if SSE_MEDIA_TYPE in accept:
+        return SSE_MEDIA_TYPE
+    if NDJSON_MEDIA_TYPE in accept:
+        return NDJSON_MEDIA_TYPE
+    if stream:
+        return NDJSON_MEDIA_TYPE
+    return None
+
+
+def encode_sse(event: Dict[str, Any]) -> bytes:
+    """Encode an event as a Server-Sent Events frame"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+def encode_ndjson(event: Dict[str, Any]) -> bytes:
+    """Encode an event as a single NDJSON line"""
+    return (json.dumps(event) + "\n").encode()
+
+
+class EventStreamResponse(StreamingResponse):
+    """Streaming response that always closes its event source
+
+    Each frame is sent only after the previous one was handed to the
+    server, so a slow reader throttles how fast we pull from Ollama. When
+    the client disconnects the event iterator is closed explicitly, which
+    in turn closes the upstream Ollama stream.
+    """
+
+    def __init__(self, events: Events, media_type: str):
+        self.events = events
+        encode = encode_sse if media_type == SSE_MEDIA_TYPE else encode_ndjson
+        self.frames = (encode(event) async for event in events)
+        super().__init__(
+            self.frames,
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.frames.aclose()
+            await self.events.aclose()
+
+
+class JSONLinesResponse(StreamingResponse):
+    """NDJSON response that streams while the request body is still read
+
+    Starlette's StreamingResponse starts a ``receive()`` listener to detect
+    disconnects on older ASGI servers, which would swallow request body
+    messages the handler is still consuming. Here disconnects are only
+    watched for once ``body_consumed`` is set; before that, reading the body
+    raises ``ClientDisconnect`` on its own.
+    """
+
+    def __init__(self, lines: Events, body_consumed: asyncio.Event):
+        self.lines = lines
+        self.body_consumed = body_consumed
+        self.frames = (encode_ndjson(line) async for line in lines)
+        super().__init__(
+            self.frames,
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def watch_disconnect() -> None:
+            await self.body_consumed.wait()
+            await self.listen_for_disconnect(receive)
+
+        streamer = asyncio.ensure_future(self.stream_response(send))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await asyncio.wait({streamer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if streamer.done():
+                streamer.result()
+        except OSError as e:
+            raise ClientDisconnect() from e
+        finally:
+            streamer.cancel()
+            watcher.cancel()
+            await asyncio.gather(streamer, watcher, return_exceptions=True)
+            await self.frames.aclose()
+            await self.lines.aclose()
+
+
+async def stream_response(
+    chunks: Events,
+    extract_text: Callable[[Dict[str, Any]], str],
+    model: str,
+    media_type: str,
+    on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> EventStreamResponse:
+    """Start streaming ``chunks`` back to the client
+
+    The first event is awaited before the response starts, so failures to
+    reach Ollama still surface as a regular HTTP error.
+    """
+    events = stream_events(chunks, extract_text, model, on_done)
+    try:
+        first = await anext(events)
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        await events.aclose()
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    if first is not None and first["type"] == "error":
+        await events.aclose()
+        raise HTTPException(status_code=500, detail=first["error"])
+
+    async def replay() -> Events:
+        async with aclosing(events):
+            if first is not None:
+                yield first
+            async for event in events:
+                yield event
+
+    return EventStreamResponse(replay(), media_type)
@@ -0,0 +1,298 @@
+"""
+WebSocket chat sessions for the REST API
+
+One connection carries a whole conversation. The history is kept on the
+server, so each turn only sends the new message, and tokens are pushed
+as they are generated.
+
+Client messages::
+
+    {"type": "message", "content": "Hi"}      start a turn
+    {"type": "cancel"}                        stop the running turn
+    {"type": "config", "model": "llama3", "temperature": 0.2,
+     "max_tokens": 256, "system": "Be brief"} change settings between turns
+    {"type": "reset"}                         clear the history
+
+Server messages: ``session`` on connect, then per turn ``token`` events
+followed by ``done``, ``cancelled`` or ``error``.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing, nullcontext
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from ollama_client.core.client import AsyncOllamaClient
+from ollama_client.core.streaming import stream_events
+from ollama_client.interfaces.rest.limits import Overloaded, client_key
+from ollama_client.interfaces.rest.responses import dumps
+from ollama_client.utils.metrics import REQUEST_LATENCY, WEBSOCKET_CONNECTIONS
+
+ROUTE = "/ws/chat"
+
+
+class ChatSession:
+    """Conversation history and generation settings of one chat"""
+
+    def __init__(self, session_id: str, max_history: int = 50):
+        self.id = session_id
+        self.max_history = max_history
+        self.model = "llama3"
+        self.temperature = 0.7
+        self.max_tokens = 512
+        self.system: Optional[str] = None
+        self.messages: List[Dict[str, str]] = []
+        self.last_active = time.monotonic()
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        """Apply the settings present in a ``config`` message or query string"""
+        if settings.get("model"):
+            self.model = str(settings["model"])
+        if settings.get("temperature") is not None:
+            temperature = float(settings["temperature"])
+            if not 0.0 <= temperature <= 1.0:
+                raise ValueError("temperature must be between 0 and 1")
+            self.temperature = temperature
+        if settings.get("max_tokens") is not None:
+            max_tokens = int(settings["max_tokens"])
+            if max_tokens <= 0:
+                raise ValueError("max_tokens must be positive")
+            self.max_tokens = max_tokens
+        if "system" in settings:
+            self.system = settings["system"] or None
+
+    def history(self) -> List[Dict[str, str]]:
+        """Messages to send upstream: the system prompt and recent turns
+
+        Older turns beyond ``max_history`` messages are dropped for good.
+        """
+        if len(self.messages) > self.max_history:
+            del self.messages[: -self.max_history]
+        if self.system:
+            return [{"role": "system", "content": self.system}, *self.messages]
+        return list(self.messages)
+
+    def settings(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "system": self.system,
+        }
+
+
+class ChatSessions:
+    """Sessions kept between turns and across reconnects
+
+    A client reconnecting with ``?session_id=`` resumes its conversation.
+    Sessions idle for longer than ``ttl`` seconds are dropped, as are the
+    least recently used ones beyond ``max_sessions``.
+    """
+
+    def __init__(
+        self, max_sessions: int = 10000, ttl: float = 3600.0, max_history: int = 50
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_history = max_history
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def open(self, session_id: Optional[str] = None) -> ChatSession:
+        """Resume ``session_id`` if it is still known, otherwise start a new session"""
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_active <= self.ttl:
+                break
+            del self._sessions[oldest.id]
+
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            session = ChatSession(uuid.uuid4().hex, self.max_history)
+            self._sessions[session.id] = session
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self.touch(session)
+        return session
+
+    def touch(self, session: ChatSession) -> None:
+        session.last_active = time.monotonic()
+        if session.id in self._sessions:
+            self._sessions.move_to_end(session.id)
+
+
+class ChatConnection:
+    """Drives one WebSocket: reads client messages, runs turns as tasks"""
+
+    def __init__(
+        self, websocket: WebSocket, client: AsyncOllamaClient, sessions: ChatSessions
+    ):
+        self.websocket = websocket
+        self.client = client
+        self.sessions = sessions
+        self.turn: Optional["asyncio.Task[None]"] = None
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        if self._closed:
+            return
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(dumps(event).decode())
+            except (WebSocketDisconnect, RuntimeError, OSError):
+                self._closed = True
+
+    async def run(self) -> None:
+        await self.websocket.accept()
+        connections = WEBSOCKET_CONNECTIONS.labels("rest")
+        connections.inc()
+        try:
+            params = self.websocket.query_params
+            session = self.sessions.open(params.get("session_id"))
+            try:
+                session.configure(dict(params))
+            except ValueError as e:
+                await self.send({"type": "error", "error": str(e)})
+            await self.send(
+                {
+                    "type": "session",
+                    "session_id": session.id,
+                    "messages": len(session.messages),
+                    **session.settings(),
+                }
+            )
+
+            while True:
+                try:
+                    message = json.loads(await self.websocket.receive_text())
+                except json.JSONDecodeError as e:
+                    await self.send({"type": "error", "error": f"Invalid JSON: {e}"})
+                    continue
+                await self.handle(session, message if isinstance(message, dict) else {})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            if self.turn is not None:
+                # Closing the stream stops Ollama for a client that went away
+                self.turn.cancel()
+                await asyncio.gather(self.turn, return_exceptions=True)
+            connections.dec()
+
+    async def handle(self, session: ChatSession, message: Dict[str, Any]) -> None:
+        kind = message.get("type")
+        running = self.turn is not None and not self.turn.done()
+
+        if kind == "cancel":
+            if self.turn is not None:
+                self.turn.cancel()
+            return
+        if running and kind in ("message", "config", "reset"):
+            await self.send(
+                {"type": "error", "error": "A generation is already running"}
+            )
+            return
+
+        self.sessions.touch(session)
+        if kind == "message":
+            content = message.get("content")
+            if not isinstance(content, str) or not content:
+                await self.send(
+                    {"type": "error", "error": "Message content is required"}
+                )
+                return
+            self.turn = asyncio.ensure_future(self.run_turn(session, content))
+        elif kind == "config":
+            try:
+                session.configure(message)
+            except (TypeError, ValueError) as e:
+                await self.send({"type": "error", "error": str(e)})
+                return
+            await self.send({"type": "config", **session.settings()})
+        elif kind == "reset":
+            session.messages.clear()
+            await self.send({"type": "reset"})
+        else:
+            await self.send({"type": "error", "error": f"Unknown message type: {kind}"})
+
+    async def run_turn(self, session: ChatSession, content: str) -> None:
+        """Generate one reply, streaming it and recording it in the history"""
+        state = self.websocket.app.state
+        limiter = getattr(state, "rate_limiter", None)
+        admission = getattr(state, "admission", None)
+        key = client_key(self.websocket.scope, getattr(state, "api_keys", ()))
+
+        if limiter is not None:
+            wait = limiter.check(key)
+            if wait:
+                await self.send(
+                    {
+                        "type": "error",
+                        "error": "Rate limit exceeded",
+                        "retry_after": wait,
+                    }
+                )
+                return
+
+        session.messages.append({"role": "user", "content": content})
+        started = time.perf_counter()
+        outcome = "error"
+        text = ""
+        try:
+            async with admission.slot() if admission is not None else nullcontext():
+                chunks = self.client.chat_stream(
+                    messages=session.history(),
+                    model=session.model,
+                    temperature=session.temperature,
+                    max_tokens=session.max_tokens,
+                )
+                events = stream_events(
+                    chunks,
+                    lambda chunk: chunk.get("message", {}).get("content", ""),
+                    session.model,
+                )
+                async with aclosing(events):
+                    async for event in events:
+                        if event["type"] == "token":
+                            text += event["text"]
+                        elif event["type"] == "error":
+                            # A failed or cut-off reply is not kept
+                            session.messages.pop()
+                            await self.send(event)
+                            return
+                        else:
+                            session.messages.append(
+                                {"role": "assistant", "content": text}
+                            )
+                            if limiter is not None:
+                                limiter.record_tokens(key, event.get("eval_count"))
+                            outcome = "done"
+                        await self.send(event)
+        except Overloaded as e:
+            session.messages.pop()
+            await self.send(
+                {"type": "error", "error": str(e), "retry_after": e.retry_after}
+            )
+        except asyncio.CancelledError:
+            # Keep the partial reply so the conversation stays consistent
+            if text:
+                session.messages.append({"role": "assistant", "content": text})
+            else:
+                session.messages.pop()
+            outcome = "cancelled"
+            await self.send({"type": "cancelled"})
+            raise
+        finally:
+            self.sessions.touch(session)
+            REQUEST_LATENCY.labels("rest", ROUTE, outcome).observe(
+                time.perf_counter() - started
+            )
@@ -0,0 +1,145 @@
+"""
+Run a JSONL file of generate/chat requests from the command line
+
+Results are appended to the output file as they finish, one JSON line
+each, tagged with the input ``line`` they answer. The output doubles as
+the checkpoint: running the same command again skips every line that
+already has a result, so an interrupted run resumes where it stopped.
+"""
+
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    ProgressColumn,
+    Task,
+    TextColumn,
+    TimeElapsedColumn,
+    TimeRemainingColumn,
+)
+from rich.text import Text
+
+from ollama_client.core.batch import Deduplicator, as_completed_bounded, execute_line
+from ollama_client.core.client import AsyncOllamaClient
+
+
+class RateColumn(ProgressColumn):
+    """Completed lines per second"""
+
+    def render(self, task: Task) -> Text:
+        speed = task.finished_speed or task.speed
+        if speed is None:
+            return Text("- lines/s", style="progress.data.speed")
+        return Text(f"{speed:.1f} lines/s", style="progress.data.speed")
+
+
+def load_checkpoint(path: str, retry_errors: bool = False) -> Set[int]:
+    """Input lines that already have a result in the output file
+
+    A last line cut short by a crash is removed, so new results start
+    on a line of their own.
+    """
+    done: Set[int] = set()
+    if not os.path.exists(path):
+        return done
+
+    end = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            end += len(line)
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(result, dict) and isinstance(result.get("line"), int):
+                if retry_errors and result.get("status") == "error":
+                    done.discard(result["line"])
+                else:
+                    done.add(result["line"])
+
+    if end != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+    return done
+
+
+def count_lines(path: str) -> int:
+    """Non-blank lines of the input, for the progress total"""
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+async def run_file(
+    host: str,
+    input_path: str,
+    output_path: str,
+    concurrency: int = 8,
+    dedupe: bool = True,
+    retry_errors: bool = False,
+    console: Optional[Console] = None,
+) -> Dict[str, Any]:
+    """Run the requests of ``input_path`` that have no result yet and append theirs"""
+    console = console or Console(stderr=True)
+    done = load_checkpoint(output_path, retry_errors)
+    total = count_lines(input_path)
+    deduplicator = Deduplicator() if dedupe else None
+    stats = {
+        "completed": 0,
+        "errors": 0,
+        "skipped": 0,
+        "deduplicated": 0,
+        "elapsed": 0.0,
+    }
+
+    async def pending() -> AsyncIterator[Tuple[int, bytes]]:
+        with open(input_path, "rb") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                if line_no in done:
+                    stats["skipped"] += 1
+                    continue
+                yield line_no, line
+
+    async def worker(item: Tuple[int, bytes]) -> Dict[str, Any]:
+        line_no, line = item
+        return {
+            "line": line_no,
+            **await execute_line(client, line_no, line, deduplicator),
+        }
+
+    progress = Progress(
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        RateColumn(),
+        TimeElapsedColumn(),
+        TextColumn("ETA"),
+        TimeRemainingColumn(),
+        console=console,
+    )
+    started = time.perf_counter()
+    with progress, open(output_path, "ab") as output:
+        task = progress.add_task("batch", total=max(total - len(done), 0))
+        async with AsyncOllamaClient(host=host, max_connections=concurrency) as client:
+            async for result in as_completed_bounded(pending(), worker, concurrency):
+                # One flushed line per result, so an interruption loses no finished work
+                output.write(json.dumps(result, separators=(",", ":")).encode() + b"\n")
+                output.flush()
+                stats["completed"] += 1
+                if result["status"] == "error":
+                    stats["errors"] += 1
+                progress.advance(task)
+
+    stats["elapsed"] = time.perf_counter() - started
+    if deduplicator is not None:
+        stats["deduplicated"] = deduplicator.hits
+    return stats
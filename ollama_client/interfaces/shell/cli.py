@@ -1,114 +1,202 @@
 #!/usr/bin/env python
-import typer
 import os
 import sys
-from typing import Optional
+from typing import TYPE_CHECKING, NoReturn, Optional
+
+import typer
 from rich.console import Console
-from rich.markdown import Markdown
 
-from ollama_client.core.client import OllamaClient
+if TYPE_CHECKING:
+    from ollama_client.core.client import OllamaClient
 
 app = typer.Typer(help="Command-line interface for Ollama")
 console = Console()
 
-def get_client(host: str) -> OllamaClient:
-    """Get Ollama client"""
-    client = OllamaClient(host=host)
-    if not client.health():
+
+def get_client(host: str) -> "OllamaClient":
+    """Get Ollama client
+
+    The client (and httpx) is imported on first use, and there is no
+    health round trip up front: a command that cannot connect reports
+    that Ollama is not running instead.
+    """
+    from ollama_client.core.client import OllamaClient
+
+    return OllamaClient(host=host)
+
+
+def fail(error: Exception) -> NoReturn:
+    """Report a failed command and exit"""
+    import httpx
+
+    if isinstance(error, httpx.ConnectError):
         console.print("[red]Error: Ollama is not running![/red]")
-        console.print("[yellow]Please make sure Ollama is running and try again.[/yellow]")
-        sys.exit(1)
-    return client
+        console.print(
+            "[yellow]Please make sure Ollama is running and try again.[/yellow]"
+        )
+    else:
+        console.print(f"[red]Error: {error}[/red]")
+    sys.exit(1)
+
 
 @app.command()
 def models(
     host: str = typer.Option("http://localhost:11434", help="Ollama API host")
-):
+) -> None:
     """List available models"""
     client = get_client(host)
-    
+
     try:
         models = client.list_models()
-        
+
         if not models:
             console.print("[yellow]No models available.[/yellow]")
             return
-        
+
         console.print("[bold]Available Models:[/bold]")
         for model in models:
             # Convert size to human-readable format
-            size_str = f"{model.size / (1024**3):.2f} GB" if model.size > 1024**3 else f"{model.size / (1024**2):.2f} MB"
-            console.print(f"- [cyan]{model.name}[/cyan] ({size_str}, modified: {model.modified_at})")
+            size_str = (
+                f"{model.size / (1024**3):.2f} GB"
+                if model.size > 1024**3
+                else f"{model.size / (1024**2):.2f} MB"
+            )
+            console.print(
+                f"- [cyan]{model.name}[/cyan] "
+                f"({size_str}, modified: {model.modified_at})"
+            )
     except Exception as e:
-        console.print(f"[red]Error: {e}[/red]")
-        sys.exit(1)
+        fail(e)
+
 
 @app.command()
 def generate(
     prompt: str = typer.Argument(..., help="Prompt text to generate from"),
     model: str = typer.Option("llama3", help="Model to use"),
-    temperature: float = typer.Option(0.7, min=0.0, max=1.0, help="Sampling temperature"),
+    temperature: float = typer.Option(
+        0.7, min=0.0, max=1.0, help="Sampling temperature"
+    ),
     max_tokens: int = typer.Option(512, help="Maximum tokens to generate"),
-    host: str = typer.Option("http://localhost:11434", help="Ollama API host")
-):
+    host: str = typer.Option("http://localhost:11434", help="Ollama API host"),
+) -> None:
     """Generate text from a prompt"""
     client = get_client(host)
-    
+
     try:
         with console.status("[bold green]Generating...[/bold green]"):
             response = client.generate(
                 prompt=prompt,
                 model=model,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
             )
-        
+
+        from rich.markdown import Markdown
+
         console.print(Markdown(response.text))
     except Exception as e:
-        console.print(f"[red]Error: {e}[/red]")
-        sys.exit(1)
+        fail(e)
+
 
 @app.command()
 def chat(
     message: str = typer.Argument(..., help="Message to send"),
     model: str = typer.Option("llama3", help="Model to use"),
-    temperature: float = typer.Option(0.7, min=0.0, max=1.0, help="Sampling temperature"),
+    temperature: float = typer.Option(
+        0.7, min=0.0, max=1.0, help="Sampling temperature"
+    ),
     max_tokens: int = typer.Option(512, help="Maximum tokens to generate"),
-    host: str = typer.Option("http://localhost:11434", help="Ollama API host")
-):
+    host: str = typer.Option("http://localhost:11434", help="Ollama API host"),
+) -> None:
     """Chat with the model (single message)"""
     client = get_client(host)
-    
+
     try:
         messages = [{"role": "user", "content": message}]
-        
+
         with console.status("[bold green]Thinking...[/bold green]"):
             response = client.chat(
                 messages=messages,
                 model=model,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
             )
-        
+
+        from rich.markdown import Markdown
+
         console.print(Markdown(response.text))
     except Exception as e:
-        console.print(f"[red]Error: {e}[/red]")
+        fail(e)
+
+
+@app.command()
+def batch(
+    input: str = typer.Argument(..., help="JSONL file of generate/chat requests"),
+    output: Optional[str] = typer.Option(
+        None, help="JSONL file results are appended to [default: <input>.results.jsonl]"
+    ),
+    concurrency: int = typer.Option(8, min=1, help="Requests run at once"),
+    dedupe: bool = typer.Option(True, help="Run identical requests once"),
+    retry_errors: bool = typer.Option(
+        False, help="When resuming, rerun lines that failed"
+    ),
+    host: str = typer.Option("http://localhost:11434", help="Ollama API host"),
+) -> None:
+    """Run a JSONL batch of requests, resuming where an earlier run stopped"""
+    import asyncio
+
+    from ollama_client.interfaces.shell.batch import run_file
+
+    if not os.path.exists(input):
+        console.print(f"[red]Error: {input} not found[/red]")
         sys.exit(1)
+    output = output or f"{os.path.splitext(input)[0]}.results.jsonl"
+    progress_console = Console(stderr=True)
+
+    try:
+        stats = asyncio.run(
+            run_file(
+                host,
+                input,
+                output,
+                concurrency=concurrency,
+                dedupe=dedupe,
+                retry_errors=retry_errors,
+                console=progress_console,
+            )
+        )
+    except KeyboardInterrupt:
+        progress_console.print(
+            "[yellow]Interrupted. Run the same command again to resume.[/yellow]"
+        )
+        sys.exit(130)
+    except Exception as e:
+        fail(e)
+
+    rate = stats["completed"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    progress_console.print(
+        f"[green]{stats['completed']} lines in {stats['elapsed']:.1f}s "
+        f"({rate:.1f}/s)[/green], {stats['errors']} errors, "
+        f"{stats['deduplicated']} deduplicated, {stats['skipped']} already done. "
+        f"Results in [cyan]{output}[/cyan]"
+    )
+
 
 @app.command()
 def health(
     host: str = typer.Option("http://localhost:11434", help="Ollama API host")
-):
+) -> None:
     """Check if Ollama is running"""
-    client = OllamaClient(host=host)
-    
+    client = get_client(host)
+
     status = client.health()
-    
+
     if status:
         console.print("[green]Ollama is running[/green]")
     else:
         console.print("[red]Ollama is not running[/red]")
         sys.exit(1)
 
+
 if __name__ == "__main__":
-    app()
\ No newline at end of file
+    app()
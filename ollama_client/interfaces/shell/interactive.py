@@ -1,53 +1,140 @@
 #!/usr/bin/env python
+"""
+Interactive Ollama shell
+
+The prompt is shown at once: the health and model checks run in the
+background and the first command that needs Ollama waits for them.
+Heavy imports (the HTTP client, Markdown rendering) happen on first use.
+"""
+
 import cmd
-import typer
-import os
 import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+import typer
 from rich.console import Console
-from rich.markdown import Markdown
-from rich.syntax import Syntax
-from rich.panel import Panel
-from rich.table import Table
-from typing import List, Dict, Any, Optional
 
-from ollama_client.core.client import OllamaClient
+from ollama_client.core.exceptions import OllamaAPIError
+from ollama_client.interfaces.shell.sessions import SessionLog, SessionStore
+from ollama_client.utils.config import DEFAULT_SESSIONS_DIR
+
+if TYPE_CHECKING:
+    from ollama_client.core.client import ModelInfo, OllamaClient
+
+T = TypeVar("T")
 
 console = Console()
 app = typer.Typer()
 
+# Commands that work without Ollama and so do not wait for the startup checks
+OFFLINE_COMMANDS = {
+    "",
+    "help",
+    "?",
+    "reset",
+    "save",
+    "load",
+    "sessions",
+    "exit",
+    "quit",
+}
+
+
+def in_background(function: Callable[[], T]) -> "Future[T]":
+    """Run ``function`` in a daemon thread, so a slow check never delays exiting"""
+    future: "Future[T]" = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(function())
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
 
 class OllamaShell(cmd.Cmd):
     intro = "Welcome to Ollama Shell. Type help or ? to list commands."
     prompt = "ollama> "
 
-    def __init__(self, client: OllamaClient, model: str = "llama3"):
+    def __init__(
+        self,
+        client: "OllamaClient",
+        model: str = "llama3",
+        sessions: Optional[SessionStore] = None,
+        session_history: int = 50,
+    ):
         super().__init__()
         self.client = client
         self.model = model
-        self.conversation = []
+        self.conversation: List[Dict[str, str]] = []
+        self.sessions = sessions
+        self.session_history = session_history
+        # Log the turns are appended to once the session is saved or loaded
+        self.session: Optional[SessionLog] = None
+
+        # Check the server and the model concurrently, without blocking the prompt
+        self.health_check: Optional["Future[bool]"] = in_background(self.client.health)
+        self.models_check: Optional["Future[List[ModelInfo]]"] = in_background(
+            self.client.list_models
+        )
+
+    def precmd(self, line: str) -> str:
+        if (
+            self.health_check is not None
+            and line.split(" ", 1)[0] not in OFFLINE_COMMANDS
+        ):
+            self.finish_checks()
+        return line
+
+    def finish_checks(self) -> None:
+        """Wait for the startup checks and act on their results"""
+        health_check, models_check = self.health_check, self.models_check
+        if health_check is None or models_check is None:
+            return
+        self.health_check = self.models_check = None
 
         # Check if Ollama is running
-        if not self.client.health():
+        if not health_check.result():
             console.print("[red]Error: Ollama is not running![/red]")
-            console.print("[yellow]Please make sure Ollama is running and try again.[/yellow]")
+            console.print(
+                "[yellow]Please make sure Ollama is running and try again.[/yellow]"
+            )
             sys.exit(1)
 
         # Check if the model exists
         try:
-            models = self.client.list_models()
+            models = models_check.result()
             if not any(m.name == self.model for m in models):
-                console.print(f"[yellow]Warning: Model '{self.model}' not found.[/yellow]")
+                console.print(
+                    f"[yellow]Warning: Model '{self.model}' not found.[/yellow]"
+                )
 
                 if models:
                     self.model = models[0].name
                     console.print(f"[green]Using '{self.model}' instead.[/green]")
                 else:
-                    console.print("[red]No models available. Please download a model first.[/red]")
+                    console.print(
+                        "[red]No models available. Please download a model first.[/red]"
+                    )
                     sys.exit(1)
         except Exception as e:
             console.print(f"[red]Error checking models: {e}[/red]")
 
-    def do_query(self, arg):
+    def do_query(self, arg: str) -> None:
         """Generate response for a single query: query [text]"""
         if not arg:
             console.print("[yellow]Please provide a query text[/yellow]")
@@ -55,42 +142,162 @@ class OllamaShell(cmd.Cmd):
 
         try:
             console.print(f"[bold blue]Query:[/bold blue] {arg}")
-            with console.status("[bold green]Generating response...[/bold green]"):
-                response = self.client.generate(arg, model=self.model)
-
             console.print("[bold green]Response:[/bold green]")
-            console.print(Markdown(response.text))
+            self.stream_reply(
+                self.client.generate_stream(arg, model=self.model),
+                lambda chunk: chunk.get("response", ""),
+                "Generating response...",
+            )
         except Exception as e:
             console.print(f"[red]Error: {e}[/red]")
 
-    def do_chat(self, arg):
+    def do_chat(self, arg: str) -> None:
         """Chat with the model (maintains conversation history): chat [text]"""
         if not arg:
             console.print("[yellow]Please provide a message[/yellow]")
             return
 
+        # Add user message to conversation
+        self.conversation.append({"role": "user", "content": arg})
+        console.print(f"[bold blue]You:[/bold blue] {arg}")
+        console.print(f"[bold green]{self.model}:[/bold green]")
         try:
-            # Add user message to conversation
-            self.conversation.append({"role": "user", "content": arg})
-
-            console.print(f"[bold blue]You:[/bold blue] {arg}")
-            with console.status("[bold green]Thinking...[/bold green]"):
-                response = self.client.chat(self.conversation, model=self.model)
-
-            # Add assistant response to conversation
-            self.conversation.append({"role": "assistant", "content": response.text})
-
-            console.print(f"[bold green]{self.model}:[/bold green]")
-            console.print(Markdown(response.text))
+            text = self.stream_reply(
+                self.client.chat_stream(self.conversation, model=self.model),
+                lambda chunk: chunk.get("message", {}).get("content", ""),
+                "Thinking...",
+            )
         except Exception as e:
+            self.conversation.pop()
             console.print(f"[red]Error: {e}[/red]")
+            return
 
-    def do_reset(self, arg):
+        # Keep a partial reply so the conversation stays consistent
+        if text:
+            self.conversation.append({"role": "assistant", "content": text})
+            if self.session is not None:
+                self.session.append(self.conversation[-2:])
+        else:
+            self.conversation.pop()
+
+    def stream_reply(
+        self,
+        chunks: Generator[Dict[str, Any], None, None],
+        extract_text: Callable[[Dict[str, Any]], str],
+        status: str,
+    ) -> str:
+        """Render a streamed reply as it arrives and return its text
+
+        Ctrl-C stops the generation: closing the stream closes the
+        connection, so Ollama stops decoding, and the shell keeps running.
+        An error chunk raises ``OllamaAPIError``.
+        """
+        from ollama_client.interfaces.shell.render import LiveMarkdown
+
+        reply = LiveMarkdown(console, status)
+        try:
+            with reply:
+                for chunk in chunks:
+                    if "error" in chunk:
+                        raise OllamaAPIError(f"Ollama stream failed: {chunk['error']}")
+                    reply.append(extract_text(chunk))
+        except KeyboardInterrupt:
+            console.print("[yellow]Generation stopped.[/yellow]")
+        finally:
+            chunks.close()
+        return reply.text
+
+    def do_reset(self, arg: str) -> None:
         """Reset the conversation history"""
         self.conversation = []
+        if self.session is not None:
+            self.session.append([], reset=True)
         console.print("[green]Conversation history has been reset.[/green]")
 
-    def do_model(self, arg):
+    def do_save(self, arg: str) -> None:
+        """Save the conversation as a session, then each new turn: save [name]"""
+        if self.sessions is None:
+            console.print("[yellow]Sessions are not enabled[/yellow]")
+            return
+        if not arg:
+            console.print("[yellow]Please provide a session name[/yellow]")
+            return
+        if self.session is not None and self.session.name == arg:
+            console.print(f"[green]Session '{arg}' is already being saved.[/green]")
+            return
+
+        try:
+            replace = self.sessions.exists(arg)
+            session = self.sessions.open(arg)
+            # An existing session is replaced by appending a reset, not by rewriting it
+            session.append(self.conversation, reset=replace)
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Error: {e}[/red]")
+            return
+
+        self.session = session
+        console.print(
+            f"[green]Saved {len(self.conversation)} messages to session '{arg}'. "
+            f"New turns are saved as they happen.[/green]"
+        )
+
+    def do_load(self, arg: str) -> None:
+        """Resume a saved session: load [name]"""
+        if self.sessions is None:
+            console.print("[yellow]Sessions are not enabled[/yellow]")
+            return
+        if not arg:
+            console.print("[yellow]Please provide a session name[/yellow]")
+            return
+
+        try:
+            if not self.sessions.exists(arg):
+                console.print(
+                    f"[yellow]Session '{arg}' not found. "
+                    f"Type 'sessions' to list them.[/yellow]"
+                )
+                return
+            session = self.sessions.open(arg)
+            # Only the recent messages that are sent as context are read
+            self.conversation = session.tail(self.session_history)
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Error: {e}[/red]")
+            return
+
+        self.session = session
+        console.print(
+            f"[green]Loaded {len(self.conversation)} messages "
+            f"from session '{arg}'.[/green]"
+        )
+
+    def do_sessions(self, arg: str) -> None:
+        """List saved sessions"""
+        sessions = self.sessions.list() if self.sessions is not None else []
+        if not sessions:
+            console.print("[yellow]No saved sessions.[/yellow]")
+            return
+
+        from rich.table import Table
+
+        table = Table(title="Saved Sessions")
+        table.add_column("Name", style="cyan")
+        table.add_column("Size", style="green")
+        table.add_column("Modified", style="blue")
+
+        for session in sessions:
+            name = session["name"]
+            if self.session is not None and self.session.name == name:
+                name += " (current)"
+            modified = time.localtime(session["modified"])
+            table.add_row(
+                name,
+                f"{session['size'] / 1024:.1f} KB",
+                time.strftime("%Y-%m-%d %H:%M", modified),
+            )
+
+        console.print(table)
+
+    def do_model(self, arg: str) -> None:
         """Change the model: model [model_name]"""
         if not arg:
             console.print(f"Current model: {self.model}")
@@ -104,13 +311,15 @@ class OllamaShell(cmd.Cmd):
                 self.model = arg
                 console.print(f"[green]Model changed to {self.model}[/green]")
             else:
-                console.print(f"[yellow]Model '{arg}' not found. Available models:[/yellow]")
+                console.print(
+                    f"[yellow]Model '{arg}' not found. Available models:[/yellow]"
+                )
                 for model in model_names:
                     console.print(f"- {model}")
         except Exception as e:
             console.print(f"[red]Error: {e}[/red]")
 
-    def do_models(self, arg):
+    def do_models(self, arg: str) -> None:
         """List available models"""
         try:
             models = self.client.list_models()
@@ -119,6 +328,8 @@ class OllamaShell(cmd.Cmd):
                 console.print("[yellow]No models available.[/yellow]")
                 return
 
+            from rich.table import Table
+
             table = Table(title="Available Models")
             table.add_column("Name", style="cyan")
             table.add_column("Size", style="green")
@@ -126,26 +337,36 @@ class OllamaShell(cmd.Cmd):
 
             for model in models:
                 # Convert size to human-readable format
-                size_str = f"{model.size / (1024 ** 3):.2f} GB" if model.size > 1024 ** 3 else f"{model.size / (1024 ** 2):.2f} MB"
+                size_str = (
+                    f"{model.size / (1024 ** 3):.2f} GB"
+                    if model.size > 1024**3
+                    else f"{model.size / (1024 ** 2):.2f} MB"
+                )
                 table.add_row(model.name, size_str, model.modified_at)
 
             console.print(table)
         except Exception as e:
             console.print(f"[red]Error: {e}[/red]")
 
-    def do_info(self, arg):
+    def do_info(self, arg: str) -> None:
         """Show information about the current session"""
-        console.print(Panel(f"[bold]Ollama Session Info[/bold]"))
+        from rich.panel import Panel
+
+        console.print(Panel("[bold]Ollama Session Info[/bold]"))
         console.print(f"Ollama Host: [cyan]{self.client.host}[/cyan]")
         console.print(f"Current Model: [cyan]{self.model}[/cyan]")
-        console.print(f"Conversation Length: [cyan]{len(self.conversation)}[/cyan] messages")
+        console.print(
+            f"Conversation Length: [cyan]{len(self.conversation)}[/cyan] messages"
+        )
+        if self.session is not None:
+            console.print(f"Session: [cyan]{self.session.name}[/cyan]")
 
         # Check Ollama status
         health = self.client.health()
         status = "[green]Running[/green]" if health else "[red]Not Running[/red]"
         console.print(f"Ollama Status: {status}")
 
-    def do_exit(self, arg):
+    def do_exit(self, arg: str) -> bool:
         """Exit the shell"""
         console.print("[green]Goodbye![/green]")
         return True
@@ -158,14 +379,30 @@ class OllamaShell(cmd.Cmd):
 
 @app.command()
 def main(
-        host: str = typer.Option("http://localhost:11434", help="Ollama API host"),
-        model: str = typer.Option("llama3", help="Default model to use")
-):
+    host: str = typer.Option("http://localhost:11434", help="Ollama API host"),
+    model: str = typer.Option("llama3", help="Default model to use"),
+    session: Optional[str] = typer.Option(None, help="Resume a saved session"),
+    sessions_dir: str = typer.Option(
+        DEFAULT_SESSIONS_DIR, help="Directory of saved sessions"
+    ),
+    session_history: int = typer.Option(
+        50, help="Messages of a session to resume with"
+    ),
+) -> None:
     """Interactive Ollama Shell"""
+    from ollama_client.core.client import OllamaClient
+
     client = OllamaClient(host=host)
-    shell = OllamaShell(client, model=model)
+    shell = OllamaShell(
+        client,
+        model=model,
+        sessions=SessionStore(sessions_dir),
+        session_history=session_history,
+    )
+    if session:
+        shell.do_load(session)
     shell.cmdloop()
 
 
 if __name__ == "__main__":
-    app()
\ No newline at end of file
+    app()
@@ -0,0 +1,103 @@
+"""
+Live Markdown rendering of streamed replies in the terminal
+
+Parsing the whole reply again for every token would take time quadratic
+in its length, so finished blocks (text before a blank line outside a
+code fence) are printed once, above the live region, and only the block
+still being written is re-rendered, at most ``fps`` times a second.
+"""
+
+import time
+from typing import Any, List, Optional
+
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.spinner import Spinner
+
+FENCES = ("```", "~~~")
+
+
+def finished_blocks(text: str) -> int:
+    """Length of the leading part of ``text`` made of finished Markdown blocks
+
+    A blank line ends a block once the next line has arrived and is not
+    indented, since an indented line may continue a list item.
+    """
+    end = 0
+    position = 0
+    candidate: Optional[int] = None
+    fence: Optional[str] = None
+    for line in text.splitlines(keepends=True):
+        if not line.endswith("\n"):
+            break
+        stripped = line.strip()
+        if fence is not None:
+            if stripped.startswith(fence):
+                fence = None
+        elif not stripped:
+            candidate = position + len(line)
+        else:
+            if candidate is not None and not line[0].isspace():
+                end = candidate
+            candidate = None
+            if stripped.startswith(FENCES):
+                fence = stripped[:3]
+        position += len(line)
+    return end
+
+
+class LiveMarkdown:
+    """Shows a reply as Markdown while it streams in
+
+    Use as a context manager and ``append`` text as it arrives. A spinner
+    with ``status`` is shown until the first text.
+    """
+
+    def __init__(
+        self, console: Console, status: str = "Generating...", fps: float = 12.0
+    ):
+        self.console = console
+        self.interval = 1.0 / fps
+        self.parts: List[str] = []
+        self.pending = ""
+        self.rendered_at = 0.0
+        self.live = Live(
+            Spinner("dots", text=f"[bold green]{status}[/bold green]"),
+            console=console,
+            refresh_per_second=fps,
+        )
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def __enter__(self) -> "LiveMarkdown":
+        self.live.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        try:
+            self.render()
+        finally:
+            self.live.stop()
+
+    def append(self, text: str) -> None:
+        if not text:
+            return
+        self.parts.append(text)
+        self.pending += text
+        if time.monotonic() - self.rendered_at >= self.interval:
+            self.render()
+
+    def render(self) -> None:
+        """Print finished blocks and re-render the one being written"""
+        self.rendered_at = time.monotonic()
+        if not self.parts:
+            self.live.update("")
+            return
+        end = finished_blocks(self.pending)
+        if end:
+            self.console.print(Markdown(self.pending[:end]))
+            self.pending = self.pending[end:]
+        self.live.update(Markdown(self.pending))
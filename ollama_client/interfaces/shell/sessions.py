@@ -0,0 +1,154 @@
+"""
+Named shell sessions stored as append-only logs
+
+Each session is one file of records, every record a compact JSON object
+framed by its length on both sides::
+
+    <u32 length> <JSON> <u32 length>
+
+Recording a turn is a single append; the file is never rewritten. The
+trailing length lets a log be read from the end, so resuming a session
+reads only the messages that fit the context window, however long the
+log has grown. A ``{"reset": true}`` record clears the history before it.
+"""
+
+import json
+import os
+import re
+import struct
+from typing import Any, BinaryIO, Dict, List
+
+FRAME = struct.Struct(">I")
+SUFFIX = ".log"
+NAME_PATTERN = re.compile(r"^[\w-][\w.-]*$")
+RESET: Dict[str, Any] = {"reset": True}
+
+
+def encode(record: Dict[str, Any]) -> bytes:
+    payload = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode()
+    length = FRAME.pack(len(payload))
+    return length + payload + length
+
+
+class SessionLog:
+    """The log file of one session"""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+
+    def append(self, messages: List[Dict[str, str]], reset: bool = False) -> None:
+        """Append messages in one write, after a reset record if ``reset``"""
+        records: List[Dict[str, Any]] = [RESET, *messages] if reset else [*messages]
+        data = b"".join(encode(record) for record in records)
+        if data:
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+    def tail(self, max_messages: int) -> List[Dict[str, str]]:
+        """The last ``max_messages`` messages since the last reset
+
+        Records are read backwards from the end, so the cost depends on
+        ``max_messages`` rather than on the length of the log.
+        """
+        messages: List[Dict[str, str]] = []
+        with open(self.path, "rb") as f:
+            position = self._valid_end(f)
+            while position > 0 and len(messages) < max_messages:
+                f.seek(position - FRAME.size)
+                (length,) = FRAME.unpack(f.read(FRAME.size))
+                position -= length + 2 * FRAME.size
+                f.seek(position + FRAME.size)
+                record = json.loads(f.read(length))
+                if record.get("reset"):
+                    break
+                messages.append(record)
+
+        messages.reverse()
+        return messages
+
+    def repair(self) -> None:
+        """Cut off a record left half-written by a crash, so appends stay readable"""
+        with open(self.path, "r+b") as f:
+            end = self._valid_end(f)
+            if end != f.seek(0, os.SEEK_END):
+                f.truncate(end)
+
+    @staticmethod
+    def _ends_with_record(f: BinaryIO, end: int) -> bool:
+        if end < 2 * FRAME.size:
+            return False
+        f.seek(end - FRAME.size)
+        (length,) = FRAME.unpack(f.read(FRAME.size))
+        start = end - length - 2 * FRAME.size
+        if start < 0:
+            return False
+        f.seek(start)
+        return f.read(FRAME.size) == FRAME.pack(length)
+
+    def _valid_end(self, f: BinaryIO) -> int:
+        """Offset just past the last complete record
+
+        Normally the end of the file. Only when the last record is
+        incomplete is the log scanned forwards for the last good one.
+        """
+        size = f.seek(0, os.SEEK_END)
+        if size == 0 or self._ends_with_record(f, size):
+            return size
+
+        end = 0
+        f.seek(0)
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return end
+            (length,) = FRAME.unpack(header)
+            if len(f.read(length)) < length or f.read(FRAME.size) != header:
+                return end
+            end += length + 2 * FRAME.size
+
+
+class SessionStore:
+    """Session logs kept in one directory, one file per session"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, name: str) -> str:
+        if not NAME_PATTERN.match(name):
+            raise ValueError(
+                "Session names may only contain letters, digits, '_', '-' and '.'"
+            )
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def open(self, name: str) -> SessionLog:
+        """Open a session's log, creating it if needed"""
+        path = self.path(name)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "ab"):
+            pass
+        log = SessionLog(name, path)
+        log.repair()
+        return log
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Saved sessions, most recently used first"""
+        if not os.path.isdir(self.directory):
+            return []
+
+        sessions: List[Dict[str, Any]] = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(SUFFIX):
+                stat = entry.stat()
+                sessions.append(
+                    {
+                        "name": entry.name[: -len(SUFFIX)],
+                        "size": stat.st_size,
+                        "modified": stat.st_mtime,
+                    }
+                )
+        sessions.sort(key=lambda session: session["modified"], reverse=True)
+        return sessions
@@ -1,27 +1,39 @@
 #!/usr/bin/env python
 """
 Main entry point for Ollama client
+
+Only typer and the config are imported up front; each command imports
+what it needs, so ``--help`` and quick commands start fast.
 """
-import typer
-import sys
+
 import os
-from typing import Optional
-from rich.console import Console
+import sys
+from typing import TYPE_CHECKING, Annotated, Any, Dict, List, Optional
 
-from ollama_client.core.client import OllamaClient
-from ollama_client.utils.config import load_config
+import typer
+
+from ollama_client.utils.config import (
+    API_OPTIONS,
+    DEFAULT_SESSIONS_DIR,
+    HEDGING_OPTIONS,
+    MCP_OPTIONS,
+    load_config,
+)
 from ollama_client.utils.logging import setup_logging
 
+if TYPE_CHECKING:
+    from rich.console import Console
+
 app = typer.Typer(help="Ollama client")
-console = Console()
 
 
 @app.command()
 def shell(
-        host: Optional[str] = typer.Option(None, help="Ollama API host"),
-        model: Optional[str] = typer.Option(None, help="Default model to use"),
-        interactive: bool = typer.Option(True, help="Start interactive shell")
-):
+    host: Optional[str] = typer.Option(None, help="Ollama API host"),
+    model: Optional[str] = typer.Option(None, help="Default model to use"),
+    session: Optional[str] = typer.Option(None, help="Resume a saved session"),
+    interactive: bool = typer.Option(True, help="Start interactive shell"),
+) -> None:
     """Start shell interface"""
     config = load_config()
 
@@ -29,9 +41,13 @@ def shell(
         # Run interactive shell
         from ollama_client.interfaces.shell.interactive import main as run_interactive
 
+        shell_config = config.get("shell", {})
         run_interactive(
             host=host or config["ollama_host"],
-            model=model or config["default_model"]
+            model=model or config["default_model"],
+            session=session,
+            sessions_dir=shell_config.get("sessions_dir", DEFAULT_SESSIONS_DIR),
+            session_history=shell_config.get("session_history", 50),
         )
     else:
         # Import CLI application
@@ -47,13 +63,47 @@ def shell(
 
 @app.command()
 def api(
-        host: Optional[str] = typer.Option(None, help="API host to bind"),
-        port: Optional[int] = typer.Option(None, help="API port to bind"),
-        ollama_host: Optional[str] = typer.Option(None, help="Ollama API host")
-):
+    host: Optional[str] = typer.Option(None, help="API host to bind"),
+    port: Optional[int] = typer.Option(None, help="API port to bind"),
+    ollama_host: Optional[str] = typer.Option(
+        None,
+        help=(
+            "Ollama API host, or several separated by commas to hedge requests "
+            "across them"
+        ),
+    ),
+    prod: Optional[bool] = typer.Option(
+        None,
+        "--prod/--dev",
+        help="Multi-worker production mode or auto-reloading dev mode",
+    ),
+    workers: Optional[int] = typer.Option(None, help="Worker processes in prod mode"),
+    keep_alive: Optional[int] = typer.Option(
+        None, help="Keep-alive timeout in seconds"
+    ),
+    backlog: Optional[int] = typer.Option(None, help="Listen backlog"),
+    graceful_timeout: Optional[int] = typer.Option(
+        None, help="Seconds to drain in-flight requests on shutdown"
+    ),
+    warmup_model: Optional[str] = typer.Option(
+        None, help="Model to load before reporting ready"
+    ),
+) -> None:
     """Start REST API server"""
     config = load_config()
 
+    if prod is not None:
+        config["api"]["mode"] = "prod" if prod else "dev"
+    for key, value in (
+        ("workers", workers),
+        ("keep_alive", keep_alive),
+        ("backlog", backlog),
+        ("graceful_timeout", graceful_timeout),
+        ("warmup_model", warmup_model),
+    ):
+        if value is not None:
+            config["api"][key] = value
+
     # Set environment variables for API app
     if ollama_host:
         os.environ["OLLAMA_HOST"] = ollama_host
@@ -70,17 +120,41 @@ def api(
     else:
         os.environ["PORT"] = str(config["api"]["port"])
 
+    # Pass tuning options through to the API app
+    for key, (env_name, _) in API_OPTIONS.items():
+        if config["api"].get(key) is not None:
+            os.environ[env_name] = str(config["api"][key])
+
+    pass_hedging_options(config)
+
     # Import and run API app
     from ollama_client.interfaces.rest.app import start as run_api
+
     run_api()
 
 
+def pass_hedging_options(config: Dict[str, Any]) -> None:
+    """Hand the hedging settings, used with several Ollama hosts, to the server"""
+    for key, (env_name, _) in HEDGING_OPTIONS.items():
+        if config["hedging"].get(key) is not None:
+            os.environ[env_name] = str(config["hedging"][key])
+
+
 @app.command()
 def mcp(
-        host: Optional[str] = typer.Option(None, help="MCP host to bind"),
-        port: Optional[int] = typer.Option(None, help="MCP port to bind"),
-        ollama_host: Optional[str] = typer.Option(None, help="Ollama API host")
-):
+    host: Optional[str] = typer.Option(None, help="MCP host to bind"),
+    port: Optional[int] = typer.Option(None, help="MCP port to bind"),
+    ollama_host: Optional[str] = typer.Option(
+        None,
+        help=(
+            "Ollama API host, or several separated by commas to hedge requests "
+            "across them"
+        ),
+    ),
+    stdio: bool = typer.Option(
+        False, "--stdio", help="Serve one client over stdin/stdout"
+    ),
+) -> None:
     """Start MCP adapter"""
     config = load_config()
 
@@ -100,16 +174,174 @@ def mcp(
     else:
         os.environ["MCP_PORT"] = str(config["mcp"]["port"])
 
+    os.environ["MCP_METRICS_PORT"] = str(config["mcp"].get("metrics_port", 9090))
+
+    # Pass tuning options through to the MCP adapter
+    for key, (env_name, _) in MCP_OPTIONS.items():
+        if config["mcp"].get(key) is not None:
+            os.environ[env_name] = str(config["mcp"][key])
+    if stdio:
+        os.environ["MCP_TRANSPORT"] = "stdio"
+    pass_hedging_options(config)
+
     # Import and run MCP adapter
     from ollama_client.interfaces.mcp.adapter import start as run_mcp
+
     run_mcp()
 
 
 @app.command()
-def health(
-        host: Optional[str] = typer.Option(None, help="Ollama API host")
-):
+def bench(
+    target: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            help="direct (default), rest or mcp; repeat to compare the layers"
+        ),
+    ] = None,
+    ollama_host: Optional[str] = typer.Option(None, help="Ollama API host"),
+    rest_url: str = typer.Option("http://localhost:8000", help="REST API to benchmark"),
+    mcp_url: str = typer.Option("ws://localhost:8080", help="MCP adapter to benchmark"),
+    mix: str = typer.Option("generate=1", help="Request mix, e.g. generate=3,chat=1"),
+    model: Optional[str] = typer.Option(None, help="Model to use"),
+    prompt: str = typer.Option(
+        "Write a haiku about the sea.", help="Prompt of every request"
+    ),
+    max_tokens: int = typer.Option(128, help="Maximum tokens to generate"),
+    concurrency: int = typer.Option(
+        8, min=1, help="Requests in flight (closed loop) or at most (with --rate)"
+    ),
+    rate: Optional[float] = typer.Option(
+        None, min=0.001, help="Open loop: new requests per second"
+    ),
+    duration: float = typer.Option(30.0, help="Seconds of load per target"),
+    requests: Optional[int] = typer.Option(
+        None, min=1, help="Requests per target, instead of --duration"
+    ),
+    warmup: int = typer.Option(
+        1, min=0, help="Unmeasured requests per kind before measuring"
+    ),
+    json_output: bool = typer.Option(False, "--json", help="Print the results as JSON"),
+) -> None:
+    """Measure time to first token, latency and throughput"""
+    import asyncio
+    import json
+    import logging
+
+    from rich.console import Console
+
+    from ollama_client.utils.bench import TARGETS, run_bench
+
+    # A log line per request would skew the measurements
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    console = Console(stderr=json_output)
+    config = load_config()
+    targets = target or ["direct"]
+    for name in targets:
+        if name not in TARGETS:
+            expected = ", ".join(TARGETS)
+            console.print(
+                f"[red]Error: unknown target '{name}', expected one of {expected}[/red]"
+            )
+            sys.exit(1)
+
+    try:
+        report = asyncio.run(
+            run_bench(
+                targets,
+                ollama_host=ollama_host or config["ollama_host"],
+                rest_url=rest_url,
+                mcp_url=mcp_url,
+                mix=mix,
+                prompt=prompt,
+                model=model or config["default_model"],
+                max_tokens=max_tokens,
+                concurrency=concurrency,
+                rate=rate,
+                duration=duration,
+                requests=requests,
+                warmup=warmup,
+                on_target=lambda name: console.print(
+                    f"[bold blue]Benchmarking {name}...[/bold blue]"
+                ),
+            )
+        )
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+        sys.exit(1)
+
+    if json_output:
+        print(json.dumps(report, indent=2))
+    else:
+        print_bench(console, report)
+
+
+def print_bench(console: "Console", report: Dict[str, Any]) -> None:
+    """Print bench results and the overhead over direct calls as tables"""
+    from rich.table import Table
+
+    def ms(value: Optional[float]) -> str:
+        return f"{value:.1f}" if value is not None else "-"
+
+    table = Table(title="Results (times in ms)")
+    for column in (
+        "Target",
+        "Reqs",
+        "Errors",
+        "Req/s",
+        "Tok/s",
+        "TTFT p50/p99",
+        "Latency p50/p90/p99",
+    ):
+        table.add_column(column, justify="left" if column == "Target" else "right")
+    for r in report["results"]:
+        table.add_row(
+            r["target"],
+            str(r["requests"]),
+            f"{r['error_rate']:.1%}",
+            f"{r['requests_per_second']:.1f}",
+            f"{r['tokens_per_second']:.1f}",
+            f"{ms(r['ttft_p50_ms'])}/{ms(r['ttft_p99_ms'])}",
+            f"{ms(r['latency_p50_ms'])}/{ms(r['latency_p90_ms'])}/{ms(r['latency_p99_ms'])}",
+        )
+    console.print(table)
+
+    if report["overhead"]:
+        table = Table(title="Added over direct Ollama calls (ms)")
+        for column in (
+            "Target",
+            "TTFT p50",
+            "Latency p50",
+            "Latency p99",
+            "Throughput",
+        ):
+            table.add_column(column, justify="left" if column == "Target" else "right")
+        for row in report["overhead"]:
+            ratio = row.get("throughput_ratio")
+            table.add_row(
+                row["target"],
+                ms(row["ttft_p50_added_ms"]),
+                ms(row["latency_p50_added_ms"]),
+                ms(row["latency_p99_added_ms"]),
+                f"{ratio:.0%} of direct" if ratio is not None else "-",
+            )
+        console.print(table)
+
+    for r in report["results"]:
+        if r["error_types"]:
+            errors = ", ".join(
+                f"{kind}: {count}" for kind, count in r["error_types"].items()
+            )
+            console.print(f"[yellow]{r['target']} errors: {errors}[/yellow]")
+
+
+@app.command()
+def health(host: Optional[str] = typer.Option(None, help="Ollama API host")) -> None:
     """Check if Ollama is running"""
+    from rich.console import Console
+
+    from ollama_client.core.client import OllamaClient
+
+    console = Console()
     config = load_config()
 
     client = OllamaClient(host=host or config["ollama_host"])
@@ -127,4 +359,4 @@ if __name__ == "__main__":
     setup_logging()
 
     # Run app
-    app()
\ No newline at end of file
+    app()
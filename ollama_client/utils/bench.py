@@ -0,0 +1,426 @@
+"""
+Load generator behind the ``bench`` command
+
+Drives a mix of streamed generate/chat requests at one of three targets
+and records, for every request, the time to the first token, the total
+latency and the number of tokens generated:
+
+* ``direct``: Ollama itself, through ``AsyncOllamaClient``
+* ``rest``: the REST API, ``POST /generate`` and ``/chat`` as NDJSON streams
+* ``mcp``: the MCP adapter over websockets, with ``stream: true`` deltas
+
+Load is either closed (``concurrency`` requests always in flight) or open
+(requests arrive at ``rate`` per second, Poisson distributed, whatever
+the latency). In open mode at most ``concurrency`` run at once; latency
+is measured from the scheduled arrival, so time spent waiting for a slot
+counts, as it would for a real client.
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import time
+from contextlib import aclosing
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import httpx
+import websockets
+
+from ollama_client.core.hedging import connect, hedging_options
+from ollama_client.utils.metrics import error_type
+
+TARGETS = ("direct", "rest", "mcp")
+
+OnToken = Callable[[], None]
+
+
+class Result(NamedTuple):
+    kind: str
+    ok: bool
+    ttft: Optional[float]
+    latency: float
+    tokens: int
+    error: Optional[str] = None
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """Parse ``generate=3,chat=1`` into request kinds and weights"""
+    weights = []
+    for part in mix.split(","):
+        kind, _, weight = part.strip().partition("=")
+        if kind not in ("generate", "chat"):
+            raise ValueError(f"Unknown request kind in mix: {kind!r}")
+        weights.append((kind, float(weight) if weight else 1.0))
+    if not weights or sum(w for _, w in weights) <= 0:
+        raise ValueError("The mix needs at least one positive weight")
+    return weights
+
+
+def build_params(kind: str, prompt: str, model: str, max_tokens: int) -> Dict[str, Any]:
+    params: Dict[str, Any] = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+    }
+    if kind == "chat":
+        params["messages"] = [{"role": "user", "content": prompt}]
+    else:
+        params["prompt"] = prompt
+    return params
+
+
+class DirectTarget:
+    """Ollama's own streaming API, hedged if ``host`` lists several"""
+
+    name = "direct"
+
+    def __init__(self, host: str, concurrency: int):
+        self.client = connect(host, hedging_options(), max_connections=concurrency)
+
+    async def open(self) -> None:
+        pass
+
+    async def request(
+        self, kind: str, params: Dict[str, Any], on_token: OnToken
+    ) -> int:
+        if kind == "chat":
+            chunks = self.client.chat_stream(**params)
+        else:
+            chunks = self.client.generate_stream(**params)
+
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                # A chat chunk carries a message, a generate chunk a response
+                message = chunk.get("message") or {}
+                if message.get("content") or chunk.get("response"):
+                    on_token()
+                if chunk.get("done"):
+                    return int(chunk.get("eval_count") or 0)
+        raise RuntimeError("Stream ended before the final chunk")
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class RestTarget:
+    """The REST API's NDJSON streams"""
+
+    name = "rest"
+
+    def __init__(self, url: str, concurrency: int):
+        self.client = httpx.AsyncClient(
+            base_url=url.rstrip("/"),
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+        )
+
+    async def open(self) -> None:
+        pass
+
+    async def request(
+        self, kind: str, params: Dict[str, Any], on_token: OnToken
+    ) -> int:
+        body = {**params, "stream": True}
+        async with self.client.stream("POST", f"/{kind}", json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "token":
+                    on_token()
+                elif event["type"] == "error":
+                    raise RuntimeError(event["error"])
+                elif event["type"] == "done":
+                    return int(event.get("eval_count") or 0)
+        raise RuntimeError("Stream ended before the final chunk")
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class MCPTarget:
+    """The MCP adapter, one websocket per concurrent request"""
+
+    name = "mcp"
+
+    def __init__(self, url: str, concurrency: int):
+        self.url = url
+        self.concurrency = concurrency
+        self.pool: asyncio.Queue = asyncio.Queue()
+        self.connections: List[Any] = []
+        self.next_id = 0
+
+    async def open(self) -> None:
+        for _ in range(self.concurrency):
+            websocket = await websockets.connect(self.url, max_size=None)
+            # The adapter opens with its tool list
+            await websocket.recv()
+            self.connections.append(websocket)
+            self.pool.put_nowait(websocket)
+
+    async def request(
+        self, kind: str, params: Dict[str, Any], on_token: OnToken
+    ) -> int:
+        websocket = await self.pool.get()
+        try:
+            self.next_id += 1
+            request_id = self.next_id
+            await websocket.send(
+                json.dumps({"id": request_id, "action": kind, **params, "stream": True})
+            )
+            while True:
+                message = json.loads(await websocket.recv())
+                if message.get("id") != request_id:
+                    continue
+                if "delta" in message:
+                    on_token()
+                elif "error" in message:
+                    raise RuntimeError(message["error"])
+                elif "result" in message:
+                    result = message["result"]
+                    if result.get("status") != "success":
+                        raise RuntimeError(result.get("error", "Request failed"))
+                    return result.get("eval_count") or 0
+        finally:
+            self.pool.put_nowait(websocket)
+
+    async def close(self) -> None:
+        await asyncio.gather(
+            *(ws.close() for ws in self.connections), return_exceptions=True
+        )
+
+
+Target = Union[DirectTarget, RestTarget, MCPTarget]
+
+
+def create_target(
+    name: str, concurrency: int, ollama_host: str, rest_url: str, mcp_url: str
+) -> Target:
+    if name == "direct":
+        return DirectTarget(ollama_host, concurrency)
+    if name == "rest":
+        return RestTarget(rest_url, concurrency)
+    if name == "mcp":
+        return MCPTarget(mcp_url, concurrency)
+    raise ValueError(f"Unknown target: {name!r}, expected one of {', '.join(TARGETS)}")
+
+
+async def measure(
+    target: Target, kind: str, params: Dict[str, Any], started: Optional[float] = None
+) -> Result:
+    """Run one request; ``started`` is its scheduled arrival, if earlier than now"""
+    started = started or time.perf_counter()
+    first: Optional[float] = None
+
+    def on_token() -> None:
+        nonlocal first
+        if first is None:
+            first = time.perf_counter()
+
+    try:
+        tokens = await target.request(kind, params, on_token)
+    except Exception as e:
+        return Result(
+            kind, False, None, time.perf_counter() - started, 0, error_type(e)
+        )
+
+    ttft = first - started if first is not None else None
+    return Result(kind, True, ttft, time.perf_counter() - started, tokens)
+
+
+async def drive(
+    target: Target,
+    kinds: Sequence[Tuple[str, float]],
+    params: Dict[str, Dict[str, Any]],
+    concurrency: int = 8,
+    rate: Optional[float] = None,
+    duration: float = 30.0,
+    requests: Optional[int] = None,
+    seed: int = 0,
+) -> Tuple[List[Result], float]:
+    """Run the load until ``duration`` seconds or ``requests`` requests
+
+    Returns the results and the elapsed time.
+    """
+    rng = random.Random(seed)
+    names = [kind for kind, _ in kinds]
+    weights = [weight for _, weight in kinds]
+    results: List[Result] = []
+    issued = 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def more() -> bool:
+        if requests is not None:
+            return issued < requests
+        return time.perf_counter() < deadline
+
+    def pick() -> str:
+        nonlocal issued
+        issued += 1
+        return rng.choices(names, weights)[0]
+
+    if rate is None:
+
+        async def user() -> None:
+            while more():
+                kind = pick()
+                results.append(await measure(target, kind, params[kind]))
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    else:
+        slots = asyncio.Semaphore(concurrency)
+        tasks = []
+
+        async def arrival(kind: str, scheduled: float) -> None:
+            async with slots:
+                results.append(await measure(target, kind, params[kind], scheduled))
+
+        scheduled = started
+        while more():
+            scheduled += rng.expovariate(rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(arrival(pick(), scheduled)))
+        await asyncio.gather(*tasks)
+
+    return results, time.perf_counter() - started
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted ``values``"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(name: str, results: List[Result], elapsed: float) -> Dict[str, Any]:
+    """Percentiles (in ms), rates and errors of one target's results"""
+    ok = [r for r in results if r.ok]
+    ttfts = sorted(r.ttft for r in ok if r.ttft is not None)
+    latencies = sorted(r.latency for r in ok)
+    tokens = sum(r.tokens for r in ok)
+    decode_rates = [
+        r.tokens / (r.latency - r.ttft)
+        for r in ok
+        if r.tokens and r.ttft is not None and r.latency > r.ttft
+    ]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r.ok:
+            error = r.error or "unknown"
+            errors[error] = errors.get(error, 0) + 1
+
+    summary: Dict[str, Any] = {
+        "target": name,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "error_types": errors,
+        "requests_per_second": len(results) / elapsed if elapsed else 0.0,
+        "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+        "decode_tokens_per_second": (
+            statistics.median(decode_rates) if decode_rates else None
+        ),
+    }
+    for label, values in (("ttft", ttfts), ("latency", latencies)):
+        for q in (0.5, 0.9, 0.99):
+            value = percentile(values, q)
+            summary[f"{label}_p{int(q * 100)}_ms"] = (
+                value * 1000 if value is not None else None
+            )
+    return summary
+
+
+def overhead(summaries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """What each layer adds over calling Ollama directly, at the median"""
+    direct = next((s for s in summaries if s["target"] == "direct"), None)
+    if direct is None:
+        return []
+
+    rows = []
+    for summary in summaries:
+        if summary is direct:
+            continue
+        row: Dict[str, Any] = {"target": summary["target"]}
+        for key in ("ttft_p50_ms", "latency_p50_ms", "latency_p99_ms"):
+            if summary[key] is not None and direct[key] is not None:
+                row[key.replace("_ms", "_added_ms")] = summary[key] - direct[key]
+            else:
+                row[key.replace("_ms", "_added_ms")] = None
+        if direct["requests_per_second"]:
+            row["throughput_ratio"] = (
+                summary["requests_per_second"] / direct["requests_per_second"]
+            )
+        rows.append(row)
+    return rows
+
+
+async def run_bench(
+    targets: Sequence[str],
+    ollama_host: str,
+    rest_url: str,
+    mcp_url: str,
+    mix: str = "generate=1",
+    prompt: str = "Write a haiku about the sea.",
+    model: str = "llama3",
+    max_tokens: int = 128,
+    concurrency: int = 8,
+    rate: Optional[float] = None,
+    duration: float = 30.0,
+    requests: Optional[int] = None,
+    warmup: int = 1,
+    on_target: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """Benchmark each target in turn with the same load"""
+    kinds = parse_mix(mix)
+    params = {kind: build_params(kind, prompt, model, max_tokens) for kind, _ in kinds}
+
+    summaries = []
+    for name in targets:
+        if on_target is not None:
+            on_target(name)
+        target = create_target(name, concurrency, ollama_host, rest_url, mcp_url)
+        try:
+            await target.open()
+            # Load the model and open connections before measuring
+            for kind, _ in kinds:
+                for _ in range(warmup):
+                    await measure(target, kind, params[kind])
+            results, elapsed = await drive(
+                target, kinds, params, concurrency, rate, duration, requests
+            )
+        finally:
+            await target.close()
+        summaries.append(summarize(name, results, elapsed))
+
+    return {
+        "config": {
+            "mix": mix,
+            "model": model,
+            "max_tokens": max_tokens,
+            "concurrency": concurrency,
+            "rate": rate,
+            "duration": duration if requests is None else None,
+            "requests": requests,
+        },
+        "results": summaries,
+        "overhead": overhead(summaries),
+    }
@@ -1,10 +1,74 @@
-import os
 import json
-from typing import Dict, Any, Optional
-from pathlib import Path
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
 
 DEFAULT_CONFIG_DIR = os.path.expanduser("~/.config/ollama-client")
 DEFAULT_CONFIG_FILE = os.path.join(DEFAULT_CONFIG_DIR, "config.json")
+DEFAULT_SESSIONS_DIR = os.path.join(DEFAULT_CONFIG_DIR, "sessions")
+
+
+def _flag(value: str) -> bool:
+    return str(value).lower() in ("1", "true", "yes")
+
+
+# Options that can be set from the environment
+Options = Dict[str, Tuple[str, Callable[[str], Any]]]
+
+# REST API tuning options: config key -> (environment variable, type)
+API_OPTIONS: Options = {
+    "mode": ("API_MODE", str),
+    "workers": ("API_WORKERS", int),
+    "keep_alive": ("API_KEEP_ALIVE", int),
+    "backlog": ("API_BACKLOG", int),
+    "graceful_timeout": ("API_GRACEFUL_TIMEOUT", int),
+    "warmup_model": ("WARMUP_MODEL", str),
+    "batch_concurrency": ("BATCH_CONCURRENCY", int),
+    "job_workers": ("JOB_WORKERS", int),
+    "job_store": ("JOB_STORE", str),
+    "metrics_dir": ("METRICS_DIR", str),
+    "max_in_flight": ("MAX_IN_FLIGHT", int),
+    "max_queued": ("MAX_QUEUED", int),
+    "queue_timeout": ("QUEUE_TIMEOUT", float),
+    "api_keys": ("API_KEYS", str),
+    "rate_limit_rps": ("RATE_LIMIT_RPS", float),
+    "rate_limit_burst": ("RATE_LIMIT_BURST", float),
+    "token_limit_tps": ("TOKEN_LIMIT_TPS", float),
+    "token_limit_burst": ("TOKEN_LIMIT_BURST", float),
+    "ws_max_sessions": ("WS_MAX_SESSIONS", int),
+    "ws_session_ttl": ("WS_SESSION_TTL", float),
+    "ws_max_history": ("WS_MAX_HISTORY", int),
+    "semantic_cache": ("SEMANTIC_CACHE", _flag),
+    "semantic_cache_model": ("SEMANTIC_CACHE_MODEL", str),
+    "semantic_cache_threshold": ("SEMANTIC_CACHE_THRESHOLD", float),
+    "semantic_cache_thresholds": ("SEMANTIC_CACHE_THRESHOLDS", str),
+    "semantic_cache_size": ("SEMANTIC_CACHE_SIZE", int),
+    "semantic_cache_ttl": ("SEMANTIC_CACHE_TTL", float),
+    "semantic_cache_path": ("SEMANTIC_CACHE_PATH", str),
+}
+
+# MCP adapter tuning options: config key -> (environment variable, type)
+MCP_OPTIONS: Options = {
+    "max_in_flight": ("MCP_MAX_IN_FLIGHT", int),
+    "transport": ("MCP_TRANSPORT", str),
+    "compression": ("MCP_COMPRESSION", str),
+    "compression_level": ("MCP_COMPRESSION_LEVEL", int),
+    "ping_interval": ("MCP_PING_INTERVAL", float),
+    "ping_timeout": ("MCP_PING_TIMEOUT", float),
+    "idle_timeout": ("MCP_IDLE_TIMEOUT", float),
+    "max_connections": ("MCP_MAX_CONNECTIONS", int),
+    "stream_interval": ("MCP_STREAM_INTERVAL", float),
+    "stream_chunk": ("MCP_STREAM_CHUNK", int),
+}
+
+# Hedging across Ollama hosts, used when ollama_host lists several:
+# config key -> (environment variable, type)
+HEDGING_OPTIONS: Options = {
+    "percentile": ("OLLAMA_HEDGE_PERCENTILE", float),
+    "budget": ("OLLAMA_HEDGE_BUDGET", float),
+    "initial_delay": ("OLLAMA_HEDGE_INITIAL_DELAY", float),
+    "min_delay": ("OLLAMA_HEDGE_MIN_DELAY", float),
+    "max_delay": ("OLLAMA_HEDGE_MAX_DELAY", float),
+}
 
 
 def load_config(config_file: Optional[str] = None) -> Dict[str, Any]:
@@ -12,19 +76,66 @@ def load_config(config_file: Optional[str] = None) -> Dict[str, Any]:
     config_file = config_file or DEFAULT_CONFIG_FILE
 
     # Default configuration
-    config = {
+    config: Dict[str, Any] = {
         "ollama_host": "http://localhost:11434",
         "default_model": "llama3",
         "temperature": 0.7,
         "max_tokens": 512,
+        "hedging": {
+            "percentile": 0.95,
+            "budget": 0.1,
+            "initial_delay": 1.0,
+            "min_delay": 0.05,
+            "max_delay": 5.0,
+        },
+        "shell": {"sessions_dir": DEFAULT_SESSIONS_DIR, "session_history": 50},
         "api": {
             "host": "0.0.0.0",
-            "port": 8000
+            "port": 8000,
+            "mode": "dev",
+            "workers": None,
+            "keep_alive": 75,
+            "backlog": 2048,
+            "graceful_timeout": 30,
+            "warmup_model": None,
+            "batch_concurrency": 8,
+            "job_workers": 4,
+            "job_store": None,
+            "metrics_dir": None,
+            "max_in_flight": 32,
+            "max_queued": 128,
+            "queue_timeout": 30.0,
+            "api_keys": None,
+            "rate_limit_rps": 0.0,
+            "rate_limit_burst": None,
+            "token_limit_tps": 0.0,
+            "token_limit_burst": None,
+            "ws_max_sessions": 10000,
+            "ws_session_ttl": 3600.0,
+            "ws_max_history": 50,
+            "semantic_cache": False,
+            "semantic_cache_model": "nomic-embed-text",
+            "semantic_cache_threshold": 0.95,
+            "semantic_cache_thresholds": None,
+            "semantic_cache_size": 10000,
+            "semantic_cache_ttl": None,
+            "semantic_cache_path": None,
         },
         "mcp": {
             "host": "0.0.0.0",
-            "port": 8080
-        }
+            "port": 8080,
+            "metrics_port": 9090,
+            "max_in_flight": 8,
+            "stream_interval": 0.05,
+            "stream_chunk": 64,
+            "transport": "websocket",
+            "compression": "deflate",
+            "compression_level": 6,
+            "ping_interval": 20.0,
+            "ping_timeout": 20.0,
+            "idle_timeout": 0,
+            "max_connections": 0,
+        },
     }
 
     # Load from file if it exists
@@ -43,6 +154,24 @@ def load_config(config_file: Optional[str] = None) -> Dict[str, Any]:
     if "OLLAMA_MODEL" in os.environ:
         config["default_model"] = os.environ["OLLAMA_MODEL"]
 
+    if "SHELL_SESSIONS_DIR" in os.environ:
+        config["shell"]["sessions_dir"] = os.environ["SHELL_SESSIONS_DIR"]
+
+    if "SHELL_SESSION_HISTORY" in os.environ:
+        try:
+            config["shell"]["session_history"] = int(
+                os.environ["SHELL_SESSION_HISTORY"]
+            )
+        except ValueError:
+            pass
+
+    for key, (env_name, cast) in HEDGING_OPTIONS.items():
+        if env_name in os.environ:
+            try:
+                config["hedging"][key] = cast(os.environ[env_name])
+            except ValueError:
+                pass
+
     if "API_HOST" in os.environ:
         config["api"]["host"] = os.environ["API_HOST"]
 
@@ -52,6 +181,13 @@ def load_config(config_file: Optional[str] = None) -> Dict[str, Any]:
         except ValueError:
             pass
 
+    for key, (env_name, cast) in API_OPTIONS.items():
+        if env_name in os.environ:
+            try:
+                config["api"][key] = cast(os.environ[env_name])
+            except ValueError:
+                pass
+
     if "MCP_HOST" in os.environ:
         config["mcp"]["host"] = os.environ["MCP_HOST"]
 
@@ -61,6 +197,19 @@ def load_config(config_file: Optional[str] = None) -> Dict[str, Any]:
         except ValueError:
             pass
 
+    if "MCP_METRICS_PORT" in os.environ:
+        try:
+            config["mcp"]["metrics_port"] = int(os.environ["MCP_METRICS_PORT"])
+        except ValueError:
+            pass
+
+    for key, (env_name, cast) in MCP_OPTIONS.items():
+        if env_name in os.environ:
+            try:
+                config["mcp"][key] = cast(os.environ[env_name])
+            except ValueError:
+                pass
+
     return config
 
 
@@ -73,4 +222,4 @@ def save_config(config: Dict[str, Any], config_file: Optional[str] = None) -> No
 
     # Save config
     with open(config_file, "w") as f:
-        json.dump(config, f, indent=2)
\ No newline at end of file
+        json.dump(config, f, indent=2)
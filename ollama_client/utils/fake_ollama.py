@@ -0,0 +1,661 @@
+"""
+Fake Ollama server for tests and benchmarks
+
+Serves the parts of the Ollama API this package uses (``/api/generate``,
+``/api/chat``, ``/api/tags``, ``/api/embed``, ``/api/show`` and
+``/api/ps``), streaming NDJSON like the real server, without a model.
+Replies are deterministic: the same request always gets the same text
+and the same embeddings.
+
+Settings are attributes of ``FakeOllama`` and are read on every request,
+so a test can change them on a running server:
+
+* ``tokens``: length of every reply, cut short by ``options.num_predict``.
+  With a ``format`` (a JSON schema, or ``"json"``), the reply is instead a
+  JSON value matching it, in tokens of a few characters
+* ``token_rate``: tokens generated per second (None for instant replies)
+* ``load_delay``: seconds taken to load a model that is not in memory;
+  models stay loaded for ``keep_alive`` seconds, as listed by ``/api/ps``
+* ``parallel``: requests generated at once, the rest wait (None for no limit)
+* ``error_rate``: share of requests failing with ``error_status``
+* ``stream_error_rate``: share of streams breaking off halfway with an
+  ``{"error": ...}`` line
+
+Like Ollama, it reads generation settings only from ``options`` and
+records each ``options.temperature`` in ``temperatures``.
+
+In tests, use the ``fake_ollama`` fixture, or start one in a thread::
+
+    with FakeOllama(token_rate=50) as server:
+        client = OllamaClient(host=server.url)
+
+As a process, for benchmarks::
+
+    python -m ollama_client.utils.fake_ollama --port 11500 --token-rate 50 --parallel 4
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import uvicorn
+    from fastapi import FastAPI
+
+OPTIONS_ENV = "FAKE_OLLAMA_OPTIONS"
+
+WORDS = (
+    "the",
+    "quick",
+    "brown",
+    "fox",
+    "jumps",
+    "over",
+    "a",
+    "lazy",
+    "dog",
+    "while",
+    "bright",
+    "stars",
+    "shine",
+    "on",
+    "quiet",
+    "water",
+    "and",
+    "every",
+    "small",
+    "wave",
+)
+
+DETAILS = {
+    "format": "gguf",
+    "family": "llama",
+    "parameter_size": "8B",
+    "quantization_level": "Q4_0",
+}
+
+MODEL_SIZE = 4_661_224_676
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _digest(name: str) -> str:
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def _keep_alive(value: Any, default: float) -> float:
+    """Seconds from an Ollama ``keep_alive``: a number, or ``"30s"``, ``"5m"``..."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    value = str(value).strip()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def reply_words(text: str, count: int) -> List[str]:
+    """The deterministic reply to ``text``, as ``count`` tokens"""
+    start = int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+    words = [WORDS[(start + i * 7) % len(WORDS)] for i in range(count)]
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+def sample_json(schema: Any, text: str, defs: Optional[Dict[str, Any]] = None) -> Any:
+    """A deterministic value for ``text`` matching the JSON schema ``schema``
+
+    Covers the schemas pydantic generates: objects, arrays, scalars,
+    enums, ``$ref`` and ``anyOf``. ``"json"`` gives an object.
+    """
+    if not isinstance(schema, dict):
+        return {"response": "".join(reply_words(text, 3))}
+    defs = schema.get("$defs", defs or {})
+    if "$ref" in schema:
+        return sample_json(defs[schema["$ref"].rsplit("/", 1)[-1]], text, defs)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return schema["enum"][0]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return sample_json(options[0], text, defs)
+
+    kind = schema.get("type", "object")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object":
+        return {
+            name: sample_json(sub, f"{text}:{name}", defs)
+            for name, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        count = schema.get("minItems", 2)
+        return [
+            sample_json(schema.get("items", {}), f"{text}:{i}", defs)
+            for i in range(count)
+        ]
+    if kind == "string":
+        return "".join(reply_words(text, 2))
+    if kind in ("integer", "number"):
+        value = int(hashlib.sha256(text.encode()).hexdigest()[:4], 16) % 100
+        value = max(
+            value,
+            schema.get("minimum", value),
+            schema.get("exclusiveMinimum", value - 1) + 1,
+        )
+        value = min(
+            value,
+            schema.get("maximum", value),
+            schema.get("exclusiveMaximum", value + 1) - 1,
+        )
+        return value if kind == "integer" else value + 0.5
+    if kind == "boolean":
+        return True
+    return None
+
+
+def json_tokens(value: Any, size: int = 4) -> List[str]:
+    """``value`` as JSON text, in tokens of ``size`` characters"""
+    text = json.dumps(value)
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def embedding(text: str, size: int) -> List[float]:
+    """A deterministic unit vector for ``text``"""
+    values: List[float] = []
+    counter = 0
+    while len(values) < size:
+        block = hashlib.sha256(f"{counter}:{text}".encode()).digest()
+        values.extend(byte / 127.5 - 1.0 for byte in block)
+        counter += 1
+    values = values[:size]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class FakeOllama:
+    """A fake Ollama server: its settings, its state and its ASGI app"""
+
+    def __init__(
+        self,
+        models: Sequence[str] = ("llama3", "nomic-embed-text"),
+        tokens: int = 8,
+        token_rate: Optional[float] = None,
+        load_delay: float = 0.0,
+        keep_alive: float = 300.0,
+        parallel: Optional[int] = None,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        stream_error_rate: float = 0.0,
+        embedding_size: int = 16,
+        seed: int = 0,
+    ):
+        self.models = list(models)
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.load_delay = load_delay
+        self.keep_alive = keep_alive
+        self.parallel = parallel
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_error_rate = stream_error_rate
+        self.embedding_size = embedding_size
+        self.random = random.Random(seed)
+
+        # Model name -> time it is unloaded (time.monotonic)
+        self.loaded: Dict[str, float] = {}
+        self.requests = 0
+        # The temperature of each generation, None if not set in ``options``
+        self.temperatures: List[Optional[float]] = []
+        self.active = 0
+        self.peak_active = 0
+        self.loads = 0
+
+        self._app: Optional["FastAPI"] = None
+        self._slots: Optional[asyncio.Condition] = None
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._server: Optional["uvicorn.Server"] = None
+        self._thread: Optional[threading.Thread] = None
+        self.url: Optional[str] = None
+
+    # Running in a thread, for tests
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeOllama":
+        """Serve on a background thread; ``port=0`` picks a free port, see ``url``"""
+        import uvicorn
+
+        # Locks belong to an event loop, and each start runs a new one
+        self._slots = None
+        self._load_locks = {}
+        config = uvicorn.Config(
+            self.app,
+            host=host,
+            port=port,
+            log_level="warning",
+            access_log=False,
+            lifespan="off",
+        )
+        server = self._server = uvicorn.Server(config)
+        thread = self._thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+
+        deadline = time.monotonic() + 10
+        while not server.started:
+            if not thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Fake Ollama server failed to start")
+            time.sleep(0.01)
+        bound_host, bound_port = server.servers[0].sockets[0].getsockname()[:2]
+        self.url = f"http://{bound_host}:{bound_port}"
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            assert self._thread is not None
+            self._thread.join(timeout=10)
+            self._server = None
+            self._thread = None
+
+    def __enter__(self) -> "FakeOllama":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    # Simulated model behaviour
+
+    def failing(self) -> bool:
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def _condition(self) -> asyncio.Condition:
+        """The condition guarding the slots, created on the serving event loop"""
+        if self._slots is None:
+            self._slots = asyncio.Condition()
+        return self._slots
+
+    async def acquire(self) -> None:
+        """Wait for one of the ``parallel`` slots"""
+        slots = self._condition()
+        async with slots:
+            await slots.wait_for(
+                lambda: not self.parallel or self.active < self.parallel
+            )
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    async def release(self) -> None:
+        """Give back a slot taken by ``acquire``; without one, do nothing"""
+        slots = self._condition()
+        async with slots:
+            if self.active > 0:
+                self.active -= 1
+                slots.notify()
+
+    async def load(self, model: str, keep_alive: Any = None) -> int:
+        """Load ``model`` unless it is in memory; return the load time in ns"""
+        lock = self._load_locks.setdefault(model, asyncio.Lock())
+        started = time.monotonic()
+        async with lock:
+            if self.loaded.get(model, 0) <= time.monotonic():
+                self.loads += 1
+                if self.load_delay:
+                    await asyncio.sleep(self.load_delay)
+            seconds = _keep_alive(keep_alive, self.keep_alive)
+            self.loaded[model] = math.inf if seconds < 0 else time.monotonic() + seconds
+        return int((time.monotonic() - started) * 1e9)
+
+    def reply(self, body: Dict[str, Any], text: str) -> Tuple[List[str], str]:
+        """The tokens to generate and the ``done_reason``"""
+        if body.get("format"):
+            tokens = json_tokens(sample_json(body["format"], text))
+        else:
+            tokens = reply_words(text, self.tokens)
+        # As with Ollama, settings at the top level of the body are ignored
+        options = body.get("options") or {}
+        self.temperatures.append(options.get("temperature"))
+        limit = options.get("num_predict")
+        if limit is not None and 0 <= limit < len(tokens):
+            return tokens[:limit], "length"
+        return tokens, "stop"
+
+    async def tokens_of(self, tokens: List[str]) -> AsyncIterator[str]:
+        """Yield the reply's tokens at ``token_rate``"""
+        interval = 1.0 / self.token_rate if self.token_rate else 0.0
+        started = time.monotonic()
+        for i, token in enumerate(tokens):
+            if interval:
+                # Paced from the start, so sleep overshoot does not accumulate
+                delay = started + (i + 1) * interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield token
+
+    # The ASGI app
+
+    @property
+    def app(self) -> "FastAPI":
+        if self._app is None:
+            self._app = self.create_app()
+        return self._app
+
+    def create_app(self) -> "FastAPI":
+        from fastapi import FastAPI, Request
+        from fastapi.responses import (
+            JSONResponse,
+            PlainTextResponse,
+            Response,
+            StreamingResponse,
+        )
+
+        app = FastAPI(title="Fake Ollama")
+
+        def error(status: int, message: str) -> JSONResponse:
+            return JSONResponse({"error": message}, status_code=status)
+
+        def not_found(model: str) -> JSONResponse:
+            return error(404, f'model "{model}" not found, try pulling it first')
+
+        # Handlers return responses, so FastAPI does not validate what they send
+        async def completion(body: Dict[str, Any], chat: bool) -> Response:
+            self.requests += 1
+            model = body.get("model", "")
+            if model not in self.models:
+                return not_found(model)
+            if self.failing():
+                return error(self.error_status, "injected failure")
+
+            if chat:
+                messages = body.get("messages") or []
+                text = "\n".join(str(m.get("content", "")) for m in messages)
+            else:
+                text = body.get("prompt") or ""
+            tokens, done_reason = self.reply(body, text)
+            prompt_tokens = len(text.split())
+
+            def chunk(token: str) -> Dict[str, Any]:
+                data: Dict[str, Any] = {
+                    "model": model,
+                    "created_at": _now(),
+                    "done": False,
+                }
+                if chat:
+                    data["message"] = {"role": "assistant", "content": token}
+                else:
+                    data["response"] = token
+                return data
+
+            def final(
+                load_ns: int, started: float, eval_started: float, generated: int
+            ) -> Dict[str, Any]:
+                ended = time.monotonic()
+                data = chunk("")
+                data.update(
+                    done=True,
+                    done_reason=done_reason,
+                    total_duration=int((ended - started) * 1e9),
+                    load_duration=load_ns,
+                    prompt_eval_count=prompt_tokens,
+                    prompt_eval_duration=0,
+                    eval_count=generated,
+                    eval_duration=int((ended - eval_started) * 1e9),
+                )
+                return data
+
+            # An empty prompt only loads the model, as with Ollama
+            if not chat and not text:
+                started = time.monotonic()
+                load_ns = await self.load(model, body.get("keep_alive"))
+                data = final(load_ns, started, time.monotonic(), 0)
+                data["done_reason"] = "load"
+                return JSONResponse(data)
+
+            if not body.get("stream", True):
+                started = time.monotonic()
+                await self.acquire()
+                try:
+                    load_ns = await self.load(model, body.get("keep_alive"))
+                    eval_started = time.monotonic()
+                    reply = "".join([token async for token in self.tokens_of(tokens)])
+                finally:
+                    await self.release()
+                data = final(load_ns, started, eval_started, len(tokens))
+                if chat:
+                    data["message"]["content"] = reply
+                else:
+                    data["response"] = reply
+                return JSONResponse(data)
+
+            breaks = (
+                self.stream_error_rate > 0
+                and self.random.random() < self.stream_error_rate
+            )
+
+            async def stream() -> AsyncIterator[bytes]:
+                started = time.monotonic()
+                await self.acquire()
+                try:
+                    load_ns = await self.load(model, body.get("keep_alive"))
+                    eval_started = time.monotonic()
+                    generated = 0
+                    async for token in self.tokens_of(tokens):
+                        if breaks and generated >= len(tokens) // 2:
+                            yield json.dumps(
+                                {"error": "injected stream failure"}
+                            ).encode() + b"\n"
+                            return
+                        generated += 1
+                        yield json.dumps(chunk(token)).encode() + b"\n"
+                    yield json.dumps(
+                        final(load_ns, started, eval_started, generated)
+                    ).encode() + b"\n"
+                finally:
+                    await self.release()
+
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        @app.get("/", response_class=PlainTextResponse)
+        async def root() -> Response:
+            return PlainTextResponse("Ollama is running")
+
+        @app.get("/api/health")
+        async def health() -> Response:
+            return JSONResponse({"status": "ok"})
+
+        @app.get("/api/version")
+        async def version() -> Response:
+            return JSONResponse({"version": "0.0.0-fake"})
+
+        @app.post("/api/generate")
+        async def generate(request: Request) -> Response:
+            return await completion(await request.json(), chat=False)
+
+        @app.post("/api/chat")
+        async def chat(request: Request) -> Response:
+            return await completion(await request.json(), chat=True)
+
+        @app.post("/api/embed")
+        async def embed(request: Request) -> Response:
+            body = await request.json()
+            self.requests += 1
+            model = body.get("model", "")
+            if model not in self.models:
+                return not_found(model)
+            if self.failing():
+                return error(self.error_status, "injected failure")
+
+            inputs: Union[str, List[str]] = body.get("input") or []
+            texts = [inputs] if isinstance(inputs, str) else list(inputs)
+            started = time.monotonic()
+            await self.acquire()
+            try:
+                load_ns = await self.load(model, body.get("keep_alive"))
+            finally:
+                await self.release()
+            return JSONResponse(
+                {
+                    "model": model,
+                    "embeddings": [
+                        embedding(text, self.embedding_size) for text in texts
+                    ],
+                    "total_duration": int((time.monotonic() - started) * 1e9),
+                    "load_duration": load_ns,
+                    "prompt_eval_count": sum(len(text.split()) for text in texts),
+                }
+            )
+
+        @app.get("/api/tags")
+        async def tags() -> Response:
+            return JSONResponse(
+                {
+                    "models": [
+                        {
+                            "name": name,
+                            "model": name,
+                            "modified_at": "2024-01-01T00:00:00Z",
+                            "size": MODEL_SIZE,
+                            "digest": _digest(name),
+                            "details": DETAILS,
+                        }
+                        for name in self.models
+                    ]
+                }
+            )
+
+        @app.post("/api/show")
+        async def show(request: Request) -> Response:
+            body = await request.json()
+            model = body.get("model") or body.get("name") or ""
+            if model not in self.models:
+                return not_found(model)
+            return JSONResponse(
+                {
+                    "modelfile": f"FROM {model}\n",
+                    "parameters": "",
+                    "template": "{{ .Prompt }}",
+                    "details": DETAILS,
+                    "model_info": {
+                        "general.architecture": "llama",
+                        "llama.context_length": 8192,
+                        "llama.embedding_length": self.embedding_size,
+                    },
+                    "capabilities": (
+                        ["embedding"] if "embed" in model else ["completion"]
+                    ),
+                    "modified_at": "2024-01-01T00:00:00Z",
+                }
+            )
+
+        @app.get("/api/ps")
+        async def ps() -> Response:
+            now = time.monotonic()
+            running = []
+            for name, until in self.loaded.items():
+                if until <= now:
+                    continue
+                expires = (
+                    datetime.max.replace(tzinfo=timezone.utc)
+                    if until == math.inf
+                    else datetime.now(timezone.utc) + timedelta(seconds=until - now)
+                )
+                running.append(
+                    {
+                        "name": name,
+                        "model": name,
+                        "size": MODEL_SIZE,
+                        "digest": _digest(name),
+                        "details": DETAILS,
+                        "expires_at": expires.isoformat().replace("+00:00", "Z"),
+                        "size_vram": MODEL_SIZE,
+                    }
+                )
+            return JSONResponse({"models": running})
+
+        return app
+
+
+def create_app_from_env() -> "FastAPI":
+    """App factory for uvicorn workers, configured by ``main`` in ``OPTIONS_ENV``"""
+    return FakeOllama(**json.loads(os.environ.get(OPTIONS_ENV, "{}"))).app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="each has its own slots and loaded models",
+    )
+    parser.add_argument("--models", default="llama3,nomic-embed-text")
+    parser.add_argument("--tokens", type=int, default=8, help="tokens per reply")
+    parser.add_argument(
+        "--token-rate", type=float, default=None, help="tokens per second"
+    )
+    parser.add_argument(
+        "--load-delay", type=float, default=0.0, help="seconds to load a model"
+    )
+    parser.add_argument(
+        "--keep-alive", type=float, default=300.0, help="seconds a model stays loaded"
+    )
+    parser.add_argument(
+        "--parallel", type=int, default=None, help="requests generated at once"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    options = {
+        "models": args.models.split(","),
+        "tokens": args.tokens,
+        "token_rate": args.token_rate,
+        "load_delay": args.load_delay,
+        "keep_alive": args.keep_alive,
+        "parallel": args.parallel,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "stream_error_rate": args.stream_error_rate,
+        "seed": args.seed,
+    }
+    os.environ[OPTIONS_ENV] = json.dumps(options)
+    uvicorn.run(
+        "ollama_client.utils.fake_ollama:create_app_from_env",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        access_log=False,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
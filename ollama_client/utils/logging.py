@@ -1,27 +1,16 @@
 """
-Exception classes for Ollama client
+Logging configuration for Ollama client
 """
 
-class OllamaError(Exception):
-    """Base exception for Ollama client errors"""
-    pass
+import logging
+import os
+from typing import Optional
 
-class OllamaConnectionError(OllamaError):
-    """Error connecting to Ollama server"""
-    pass
 
-class OllamaAPIError(OllamaError):
-    """Error in Ollama API response"""
-    def __init__(self, message: str, status_code: int = None):
-        self.status_code = status_code
-        super().__init__(message)
-
-class ModelNotFoundError(OllamaError):
-    """Model not found"""
-    def __init__(self, model_name: str):
-        self.model_name = model_name
-        super().__init__(f"Model '{model_name}' not found")
-
-class InvalidModelError(OllamaError):
-    """Invalid model definition"""
-    pass
\ No newline at end of file
+def setup_logging(level: Optional[str] = None) -> None:
+    """Configure root logging; the level defaults to ``LOG_LEVEL`` or INFO"""
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    logging.basicConfig(
+        level=getattr(logging, level.upper(), logging.INFO),
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
@@ -0,0 +1,520 @@
+"""
+Lightweight Prometheus-style metrics
+
+Metrics are plain Python objects with no locking: every update happens on
+the event loop thread, so an increment is a dict lookup plus an addition.
+``render`` produces the Prometheus text exposition format.
+``MultiProcessMetrics`` sums the metrics of several worker processes.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default latency buckets, in seconds
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Buckets for generation speed, in tokens per second
+RATE_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+# Buckets for cosine similarity of semantic cache lookups
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+# A metric as rendered: name, type, documentation and samples
+Family = Tuple[str, str, str, List[Sample]]
+
+# The value kept per set of labels, and a metric type
+C = TypeVar("C")
+M = TypeVar("M", bound="_Metric[Any]")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(Generic[C]):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames: LabelValues = tuple(labelnames)
+        self._children: Dict[LabelValues, C] = {}
+
+    def labels(self, *values: str) -> C:
+        """Return the child for a set of label values (cached)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self) -> C:
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric[_Value]):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in self._children.items():
+            yield self.name + "_total", dict(
+                zip(self.labelnames, values, strict=True)
+            ), child.value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in self._children.items():
+            yield self.name, dict(
+                zip(self.labelnames, values, strict=True)
+            ), child.value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric[_HistogramValue]):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in self._children.items():
+            labels = dict(zip(self.labelnames, values, strict=True))
+            cumulative = 0
+            for bound, count in zip(
+                self.buckets + (float("inf"),), child.counts, strict=True
+            ):
+                cumulative += count
+                yield self.name + "_bucket", {
+                    **labels,
+                    "le": _format_value(bound),
+                }, cumulative
+            yield self.name + "_sum", labels, child.sum
+            yield self.name + "_count", labels, child.count
+
+
+class Registry:
+    """A set of metrics plus collectors that are read at scrape time"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric[Any]] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: M) -> M:
+        """Add ``metric``, or return the one already registered under its name"""
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric):
+                raise ValueError(
+                    f"{metric.name} is already registered as a {existing.type}"
+                )
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Register a callback that refreshes gauges just before rendering"""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def collect(self) -> List[Family]:
+        """Run the collectors, then return every metric with its samples"""
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+
+        return [
+            (metric.name, metric.type, metric.documentation, list(metric.samples()))
+            for metric in self._metrics.values()
+        ]
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        return _render(self.collect())
+
+
+def _render(families: Iterable[Family]) -> str:
+    lines = []
+    for metric, kind, documentation, samples in families:
+        lines.append(f"# HELP {metric} {documentation}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class MultiProcessMetrics:
+    """Metrics summed over the worker processes that share ``directory``
+
+    Each process saves its samples to a file of its own in ``directory``
+    every ``interval`` seconds while ``run`` runs, and whenever it renders.
+    ``render`` sums the samples of all the files, so any worker answers a
+    scrape with the totals. Counters and histograms of processes that have
+    exited are kept, so totals never go down; their gauges are dropped once
+    their file is ``3 * interval`` seconds old.
+    """
+
+    def __init__(
+        self, directory: str, registry: Optional[Registry] = None, interval: float = 1.0
+    ):
+        self.directory = directory
+        self.registry = registry or REGISTRY
+        self.interval = interval
+        # Unique even when a new worker gets the pid of one that exited
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex}.json")
+
+    def save(self) -> None:
+        """Save this process's samples, replacing the file atomically"""
+        partial = self.path + ".partial"
+        with open(partial, "w") as f:
+            json.dump(self.registry.collect(), f)
+        os.replace(partial, self.path)
+
+    async def run(self) -> None:
+        """Save every ``interval`` seconds until cancelled"""
+        while True:
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning(f"Saving metrics failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def render(self) -> str:
+        self.save()
+        now = time.time()
+        kinds: Dict[str, Tuple[str, str]] = {}
+        totals: Dict[str, Dict[Tuple[str, LabelValues], Sample]] = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            try:
+                live = now - os.path.getmtime(path) < 3 * self.interval
+                with open(path) as f:
+                    families = json.load(f)
+            except (OSError, ValueError):
+                # Being replaced, or removed
+                continue
+            for metric, kind, documentation, samples in families:
+                kinds.setdefault(metric, (kind, documentation))
+                if kind == "gauge" and not live:
+                    continue
+                family = totals.setdefault(metric, {})
+                for name, labels, value in samples:
+                    key = (name, tuple(labels.values()))
+                    previous = family.get(key)
+                    if previous is not None:
+                        value += previous[2]
+                    family[key] = (name, labels, value)
+        return _render(
+            (metric, kind, documentation, list(totals.get(metric, {}).values()))
+            for metric, (kind, documentation) in kinds.items()
+        )
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "ollama_client_request_duration_seconds",
+    "Request latency by interface and route or tool",
+    ("interface", "route", "status"),
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "ollama_client_time_to_first_token_seconds",
+    "Time from sending a streaming request to the first token",
+    ("model",),
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "ollama_client_tokens_per_second",
+    "Generation speed reported by Ollama (eval_count / eval_duration)",
+    ("model",),
+    buckets=RATE_BUCKETS,
+)
+GENERATED_TOKENS = REGISTRY.counter(
+    "ollama_client_generated_tokens",
+    "Tokens generated by Ollama (eval_count)",
+    ("model",),
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "ollama_client_upstream_requests",
+    "Requests sent to Ollama",
+    ("endpoint",),
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "ollama_client_upstream_errors",
+    "Failed requests to Ollama by error type",
+    ("endpoint", "type"),
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "ollama_client_in_flight_requests",
+    "Requests currently being processed",
+    ("interface",),
+)
+QUEUED = REGISTRY.gauge(
+    "ollama_client_queued_requests",
+    "Requests waiting for a slot",
+    ("interface",),
+)
+REJECTED = REGISTRY.counter(
+    "ollama_client_rejected_requests",
+    "Requests rejected by rate limiting or load shedding",
+    ("reason",),
+)
+CANCELLED = REGISTRY.counter(
+    "ollama_client_cancelled_requests",
+    "Requests cancelled before finishing, by client request or disconnect",
+    ("interface", "reason"),
+)
+CANCELLED_SECONDS_SAVED = REGISTRY.counter(
+    "ollama_client_cancelled_generation_seconds_saved",
+    "Estimated generation time avoided by cancelled requests",
+    ("model",),
+)
+HEDGED_REQUESTS = REGISTRY.counter(
+    "ollama_client_hedged_requests",
+    "Hedged requests by outcome: won or lost against the first request, "
+    "or throttled by the budget",
+    ("endpoint", "outcome"),
+)
+WEBSOCKET_CONNECTIONS = REGISTRY.gauge(
+    "ollama_client_websocket_connections",
+    "Open websocket connections",
+    ("interface",),
+)
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "ollama_client_semantic_cache_lookups",
+    "Semantic cache lookups by result (hit or miss)",
+    ("model", "result"),
+)
+CACHE_SIMILARITY = REGISTRY.histogram(
+    "ollama_client_semantic_cache_similarity",
+    "Similarity of the closest cached prompt per lookup",
+    ("model",),
+    buckets=SIMILARITY_BUCKETS,
+)
+CACHE_ENTRIES = REGISTRY.gauge(
+    "ollama_client_semantic_cache_entries",
+    "Responses held in the semantic cache",
+)
+
+
+def observe_usage(model: str, data: Dict) -> None:
+    """Record token count and generation speed from a final Ollama response"""
+    eval_count = data.get("eval_count")
+    if not eval_count:
+        return
+    GENERATED_TOKENS.labels(model).inc(eval_count)
+    eval_duration = data.get("eval_duration")
+    if eval_duration:
+        TOKENS_PER_SECOND.labels(model).observe(eval_count / (eval_duration / 1e9))
+
+
+def observe_cancelled(
+    interface: str,
+    reason: str,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    elapsed: float = 0.0,
+) -> None:
+    """Count a cancelled request and estimate the generation time it saved
+
+    The estimate is how long ``max_tokens`` tokens take at the model's mean
+    observed rate, less the time already spent. It is an upper bound, as
+    the model might have stopped earlier.
+    """
+    CANCELLED.labels(interface, reason).inc()
+    if not model or not max_tokens:
+        return
+    rate = TOKENS_PER_SECOND.labels(model)
+    if rate.count:
+        saved = max_tokens / (rate.sum / rate.count) - elapsed
+        CANCELLED_SECONDS_SAVED.labels(model).inc(max(0.0, saved))
+
+
+def error_type(error: BaseException) -> str:
+    """Classify an upstream failure for the error counter"""
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None):
+        return f"http_{response.status_code}"
+    name = type(error).__name__
+    for kind in ("Timeout", "Connect", "Read", "Write", "Protocol"):
+        if kind in name:
+            return kind.lower()
+    return name
+
+
+async def serve_metrics(
+    host: str = "0.0.0.0", port: int = 9090, registry: Optional[Registry] = None
+) -> asyncio.AbstractServer:
+    """Start a minimal HTTP listener answering ``GET /metrics``
+
+    Used as a sidecar by processes without an HTTP server of their own,
+    such as the MCP adapter.
+    """
+    registry = registry or REGISTRY
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await reader.readline()
+            # Drain the request headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.split()
+            if (
+                len(parts) >= 2
+                and parts[0] == b"GET"
+                and parts[1].split(b"?")[0] == b"/metrics"
+            ):
+                body = registry.render().encode()
+                head = f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE}\r\n"
+            else:
+                body = b"Not Found\n"
+                head = "HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\n"
+
+            head += f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            writer.write(head.encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,132 @@
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+import pytest
+
+from ollama_client.utils.fake_ollama import FakeOllama
+
+# A timed round runs the benchmark enough times to take at least this long
+ROUND_TIME = 0.01
+
+OPTIONAL = ("numpy", "orjson", "msgpack", "uvloop", "httptools")
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("latency")
+    group.addoption(
+        "--latency-json", metavar="PATH", help="write benchmark results to PATH as JSON"
+    )
+    group.addoption(
+        "--latency-time", type=float, default=0.2, metavar="SECONDS",
+        help="minimum time spent measuring each benchmark (default 0.2)"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: performance benchmark (deselect with -m 'not benchmark')"
+    )
+    config.latency_results = {}
+
+
+def pytest_sessionfinish(session):
+    path = session.config.getoption("--latency-json")
+    results = session.config.latency_results
+    if not path or not results:
+        return
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            # Optional speedups change the results
+            "optional": [name for name in OPTIONAL if importlib.util.find_spec(name)],
+        },
+        "benchmarks": dict(sorted(results.items())),
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+class Benchmark:
+    """Times a function over rounds of calls and records per-call statistics
+
+    Each round calls the function enough times to take ``ROUND_TIME``, and
+    rounds repeat for ``min_time`` seconds after a warm-up call. With
+    ``items``, times are per item (e.g. per streamed chunk).
+    """
+
+    def __init__(self, name: str, min_time: float, results: Dict[str, Any]):
+        self.name = name
+        self.min_time = min_time
+        self.results = results
+
+    def run(self, function: Callable[[], Any], items: int = 1) -> Dict[str, Any]:
+        def timed(number: int) -> float:
+            started = time.perf_counter()
+            for _ in range(number):
+                function()
+            return time.perf_counter() - started
+
+        timed(1)
+        number = self._calibrate(timed(1))
+        rounds = []
+        deadline = time.perf_counter() + self.min_time
+        while not rounds or time.perf_counter() < deadline:
+            rounds.append(timed(number))
+        return self._record(rounds, number, items)
+
+    async def run_async(self, function: Callable[[], Any], items: int = 1) -> Dict[str, Any]:
+        """Like ``run``, for a coroutine function"""
+        async def timed(number: int) -> float:
+            started = time.perf_counter()
+            for _ in range(number):
+                await function()
+            return time.perf_counter() - started
+
+        await timed(1)
+        number = self._calibrate(await timed(1))
+        rounds = []
+        deadline = time.perf_counter() + self.min_time
+        while not rounds or time.perf_counter() < deadline:
+            rounds.append(await timed(number))
+        return self._record(rounds, number, items)
+
+    @staticmethod
+    def _calibrate(once: float) -> int:
+        return max(1, int(ROUND_TIME / max(once, 1e-9)))
+
+    def _record(self, rounds: List[float], number: int, items: int) -> Dict[str, Any]:
+        per_call = sorted(elapsed / number / items * 1e6 for elapsed in rounds)
+        result = {
+            "median_us": statistics.median(per_call),
+            "min_us": per_call[0],
+            "mean_us": statistics.fmean(per_call),
+            "rounds": len(rounds),
+            "iterations": number,
+            "items": items,
+        }
+        self.results[self.name] = result
+        return result
+
+
+@pytest.fixture
+def latency_bench(request):
+    """Time a function; results are named after the test, without ``test_``"""
+    name = request.node.name.removeprefix("test_")
+    return Benchmark(
+        name, request.config.getoption("--latency-time"), request.config.latency_results
+    )
+
+
+@pytest.fixture
+def fake_ollama():
+    """A fake Ollama server on a free local port; see ``FakeOllama`` for its settings"""
+    with FakeOllama() as server:
+        yield server
@@ -0,0 +1,199 @@
+import asyncio
+import json
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from ollama_client.core.batch import (
+    Deduplicator,
+    as_completed_bounded,
+    execute_line,
+    run_batch,
+    split_lines,
+)
+from ollama_client.core.client import AsyncOllamaClient, GenerationResponse
+from ollama_client.interfaces.rest.limits import AdmissionController
+from ollama_client.interfaces.shell.batch import load_checkpoint, run_file
+
+
+@pytest.fixture
+def client():
+    return MagicMock(spec=AsyncOllamaClient)
+
+
+async def aiter_list(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_split_lines_across_chunks():
+    """Test that lines split across chunk boundaries are reassembled"""
+    chunks = [b'{"a": 1}\n{"b"', b': 2}\n\n', b'{"c": 3}']
+
+    lines = [line async for line in split_lines(aiter_list(chunks))]
+
+    assert lines == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
+
+
+@pytest.mark.asyncio
+async def test_as_completed_bounded_limits_concurrency():
+    """Test that at most `concurrency` workers run and results arrive as they finish"""
+    running = 0
+    peak = 0
+
+    async def worker(delay):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(delay)
+        running -= 1
+        return delay
+
+    results = [
+        r async for r in as_completed_bounded(
+            aiter_list([0.05, 0.01, 0.03, 0.02]), worker, concurrency=2
+        )
+    ]
+
+    assert peak == 2
+    assert results == [0.01, 0.03, 0.05, 0.02]
+
+
+@pytest.mark.asyncio
+async def test_as_completed_bounded_pulls_input_lazily():
+    """Test that input is only read as slots free up"""
+    consumed = []
+
+    async def items():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    async def worker(item):
+        return item
+
+    results = as_completed_bounded(items(), worker, concurrency=4)
+    first = await results.__anext__()
+    await results.aclose()
+
+    assert first in range(4)
+    assert len(consumed) <= 5
+
+
+@pytest.mark.asyncio
+async def test_run_batch_generate_chat_and_errors(client):
+    """Test that each line produces a tagged result or a per-line error"""
+    client.generate.return_value = GenerationResponse(text="generated", model="llama3", eval_count=4)
+    client.chat.return_value = GenerationResponse(text="chatted", model="mistral")
+
+    lines = [
+        json.dumps({"id": "a", "prompt": "Hello"}),
+        json.dumps({"id": "b", "messages": [{"role": "user", "content": "Hi"}], "model": "mistral"}),
+        "not json",
+        json.dumps({"id": "d", "type": "generate"}),
+        json.dumps({"prompt": "no id"}),
+    ]
+
+    results = {
+        r["id"]: r async for r in run_batch(client, aiter_list(lines), concurrency=3)
+    }
+
+    assert results["a"]["status"] == "success"
+    assert results["a"]["text"] == "generated"
+    assert results["a"]["eval_count"] == 4
+    assert results["b"]["message"] == {"role": "assistant", "content": "chatted"}
+    assert results["b"]["model"] == "mistral"
+    assert results[3]["status"] == "error"
+    assert "Invalid JSON" in results[3]["error"]
+    assert results["d"] == {"id": "d", "status": "error", "error": "Prompt is required"}
+    assert results[5]["status"] == "success"
+
+
+@pytest.mark.asyncio
+async def test_run_batch_takes_a_slot_per_line(client):
+    """Test that each line holds an admission slot and a shed line fails alone"""
+    admission = AdmissionController(max_in_flight=2, max_queued=1, queue_timeout=1.0)
+    peak = 0
+
+    async def generate(**kwargs):
+        nonlocal peak
+        peak = max(peak, admission.in_flight)
+        await asyncio.sleep(0.02)
+        return GenerationResponse(text="ok", model="llama3")
+
+    client.generate.side_effect = generate
+    lines = [json.dumps({"prompt": str(i)}) for i in range(4)]
+
+    results = [
+        r async for r in run_batch(client, aiter_list(lines), concurrency=4, slot=admission.slot)
+    ]
+
+    assert peak == 2
+    assert sorted(r["status"] for r in results) == ["error", "success", "success", "success"]
+    assert admission.snapshot()["shed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_runs_identical_requests_once(client):
+    """Test that duplicates share one upstream call but keep their own ids"""
+    async def generate(prompt, **kwargs):
+        await asyncio.sleep(0.01)
+        return GenerationResponse(text=prompt.upper(), model="llama3")
+
+    client.generate.side_effect = generate
+    dedupe = Deduplicator()
+    lines = [
+        json.dumps({"id": 1, "prompt": "hi"}),
+        json.dumps({"id": 2, "prompt": "hi"}),
+        json.dumps({"id": 3, "prompt": "hi", "temperature": 0.1}),
+    ]
+
+    results = await asyncio.gather(*(execute_line(client, n, line, dedupe) for n, line in enumerate(lines, 1)))
+    again = await execute_line(client, 4, json.dumps({"prompt": "hi"}), dedupe)
+
+    assert [r["id"] for r in results] == [1, 2, 3]
+    assert again["id"] == 4 and again["text"] == "HI"
+    assert client.generate.call_count == 2
+    assert dedupe.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_does_not_keep_failures(client):
+    """Test that a failed request is retried by its next duplicate"""
+    client.generate.side_effect = [ConnectionError("refused"), GenerationResponse(text="ok", model="llama3")]
+    dedupe = Deduplicator()
+    line = json.dumps({"prompt": "hi"})
+
+    assert (await execute_line(client, 1, line, dedupe))["status"] == "error"
+    assert (await execute_line(client, 2, line, dedupe))["text"] == "ok"
+
+
+@pytest.mark.asyncio
+async def test_run_file_resumes_from_output(client, tmp_path):
+    """Test that a second run only executes lines without a result"""
+    client.generate.return_value = GenerationResponse(text="done", model="llama3")
+    client.__aenter__.return_value = client
+    source = tmp_path / "in.jsonl"
+    output = tmp_path / "out.jsonl"
+    source.write_text("".join(json.dumps({"prompt": f"p{i}"}) + "\n" for i in range(5)))
+    # An earlier run finished lines 1 and 3, then died halfway through a line
+    output.write_text('{"line":1,"status":"success"}\n{"line":3,"status":"success"}\n{"line":')
+
+    with patch("ollama_client.interfaces.shell.batch.AsyncOllamaClient", return_value=client):
+        stats = await run_file("http://ollama", str(source), str(output), concurrency=2)
+
+    assert stats["completed"] == 3
+    assert stats["skipped"] == 2
+    assert client.generate.call_count == 3
+    assert sorted(json.loads(line)["line"] for line in output.read_text().splitlines()) == [1, 2, 3, 4, 5]
+    assert load_checkpoint(str(output)) == {1, 2, 3, 4, 5}
+
+
+def test_load_checkpoint_retry_errors(tmp_path):
+    """Test that failed lines count as done unless errors are retried"""
+    output = tmp_path / "out.jsonl"
+    output.write_text('{"line":1,"status":"error"}\n{"line":2,"status":"success"}\n')
+
+    assert load_checkpoint(str(output)) == {1, 2}
+    assert load_checkpoint(str(output), retry_errors=True) == {2}
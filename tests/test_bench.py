@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from ollama_client.utils.bench import (
+    DirectTarget,
+    Result,
+    build_params,
+    drive,
+    measure,
+    overhead,
+    parse_mix,
+    percentile,
+    summarize,
+)
+
+
+class FakeTarget:
+    """Streams `tokens` tokens, `delay` seconds apart"""
+
+    def __init__(self, delay=0.01, tokens=3, fail_every=None):
+        self.delay = delay
+        self.tokens = tokens
+        self.fail_every = fail_every
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+
+    async def request(self, kind, params, on_token):
+        self.calls += 1
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            if self.fail_every and self.calls % self.fail_every == 0:
+                raise ConnectionError("refused")
+            for _ in range(self.tokens):
+                await asyncio.sleep(self.delay)
+                on_token()
+            return self.tokens
+        finally:
+            self.running -= 1
+
+
+def test_parse_mix():
+    """Test parsing request kinds and weights"""
+    assert parse_mix("generate=3, chat=1") == [("generate", 3.0), ("chat", 1.0)]
+    assert parse_mix("chat") == [("chat", 1.0)]
+
+    with pytest.raises(ValueError):
+        parse_mix("embed=1")
+    with pytest.raises(ValueError):
+        parse_mix("generate=0")
+
+
+def test_build_params():
+    """Test that chat requests get messages and generate requests a prompt"""
+    assert build_params("generate", "Hi", "llama3", 16)["prompt"] == "Hi"
+    assert build_params("chat", "Hi", "llama3", 16)["messages"] == [
+        {"role": "user", "content": "Hi"}
+    ]
+
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    values = list(range(1, 101))
+
+    assert percentile(values, 0.5) == 51
+    assert percentile(values, 0.99) == 100
+    assert percentile([], 0.5) is None
+
+
+@pytest.mark.asyncio
+async def test_measure_time_to_first_token():
+    """Test that TTFT is taken at the first token and latency at the end"""
+    result = await measure(FakeTarget(delay=0.02), "generate", {})
+
+    assert result.ok and result.tokens == 3
+    assert 0.015 < result.ttft < result.latency
+    assert result.latency >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_measure_failure():
+    """Test that a failed request is recorded with its error type"""
+    result = await measure(FakeTarget(fail_every=1), "chat", {})
+
+    assert not result.ok
+    assert result.error == "connect"
+
+
+@pytest.mark.asyncio
+async def test_measure_stream_error(fake_ollama):
+    """Test that a stream breaking off with an error chunk counts as a failure"""
+    fake_ollama.stream_error_rate = 1.0
+    target = DirectTarget(fake_ollama.url, 1)
+    try:
+        result = await measure(target, "generate", build_params("generate", "Hi", "llama3", 16))
+    finally:
+        await target.close()
+
+    assert not result.ok
+    assert result.error == "RuntimeError"
+
+
+@pytest.mark.asyncio
+async def test_drive_closed_loop():
+    """Test that a closed loop keeps `concurrency` requests in flight"""
+    target = FakeTarget(delay=0.005)
+
+    results, elapsed = await drive(
+        target, [("generate", 1.0), ("chat", 1.0)], {"generate": {}, "chat": {}},
+        concurrency=4, requests=20
+    )
+
+    assert len(results) == 20
+    assert target.peak == 4
+    assert {r.kind for r in results} == {"generate", "chat"}
+    assert elapsed > 0
+
+
+@pytest.mark.asyncio
+async def test_drive_open_loop():
+    """Test that an open loop issues requests at the given rate"""
+    target = FakeTarget(delay=0.001, tokens=1)
+
+    results, elapsed = await drive(
+        target, [("generate", 1.0)], {"generate": {}}, concurrency=8, rate=200, duration=0.5
+    )
+
+    # Poisson arrivals at 200/s over half a second
+    assert 50 < len(results) < 160
+    assert all(r.ok for r in results)
+
+
+def test_summarize_and_overhead():
+    """Test the summary of results and the overhead over direct calls"""
+    direct = [Result("generate", True, 0.010, 0.020, 5) for _ in range(10)]
+    mcp = [Result("generate", True, 0.015, 0.030, 5) for _ in range(8)]
+    mcp += [Result("generate", False, None, 0.001, 0, "timeout")] * 2
+
+    summaries = [summarize("direct", direct, 1.0), summarize("mcp", mcp, 2.0)]
+
+    assert summaries[0]["requests_per_second"] == 10
+    assert summaries[0]["tokens_per_second"] == 50
+    assert summaries[0]["ttft_p50_ms"] == pytest.approx(10)
+    assert summaries[0]["decode_tokens_per_second"] == pytest.approx(500)
+    assert summaries[1]["error_rate"] == 0.2
+    assert summaries[1]["error_types"] == {"timeout": 2}
+
+    (row,) = overhead(summaries)
+    assert row["target"] == "mcp"
+    assert row["ttft_p50_added_ms"] == pytest.approx(5)
+    assert row["latency_p50_added_ms"] == pytest.approx(10)
+    assert row["throughput_ratio"] == 0.5
+
+    assert overhead(summaries[1:]) == []
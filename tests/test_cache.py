@@ -0,0 +1,187 @@
+import json
+import random
+
+import httpx
+import pytest
+
+from ollama_client.core.cache import LSHIndex, SemanticCache, normalize, parse_thresholds
+from ollama_client.core.client import AsyncOllamaClient, OllamaClient
+from ollama_client.utils.metrics import CACHE_LOOKUPS
+
+
+def response(text):
+    return {"text": text, "model": "llama3"}
+
+
+def test_lookup_respects_threshold():
+    """Only prompts at least as similar as the threshold are hits"""
+    cache = SemanticCache(threshold=0.9)
+    cache.store("generate", "llama3", [1.0, 0.0], response("Paris"))
+
+    assert cache.lookup("generate", "llama3", [0.95, 0.1]) == response("Paris")
+    assert cache.lookup("generate", "llama3", [0.5, 0.5]) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+def test_entries_are_partitioned_by_model_and_kind():
+    """An answer is never reused for another model or call type"""
+    cache = SemanticCache()
+    cache.store("generate", "llama3", [1.0, 0.0], response("Paris"))
+
+    assert cache.lookup("generate", "mistral", [1.0, 0.0]) is None
+    assert cache.lookup("chat", "llama3", [1.0, 0.0]) is None
+
+def test_per_model_threshold():
+    """Per-model thresholds override the default"""
+    cache = SemanticCache(threshold=0.99, thresholds=parse_thresholds("llama3=0.8"))
+    cache.store("generate", "llama3", [1.0, 0.0], response("Paris"))
+    cache.store("generate", "mistral", [1.0, 0.0], response("Paris"))
+
+    assert cache.lookup("generate", "llama3", [0.9, 0.3]) is not None
+    assert cache.lookup("generate", "mistral", [0.9, 0.3]) is None
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    """The least recently used entry is evicted and stale entries are ignored"""
+    cache = SemanticCache(max_entries=2, ttl=60)
+    cache.store("generate", "llama3", [1.0, 0.0, 0.0], response("a"))
+    cache.store("generate", "llama3", [0.0, 1.0, 0.0], response("b"))
+    assert cache.lookup("generate", "llama3", [1.0, 0.0, 0.0]) == response("a")
+
+    cache.store("generate", "llama3", [0.0, 0.0, 1.0], response("c"))
+    assert len(cache) == 2
+    assert cache.lookup("generate", "llama3", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("generate", "llama3", [1.0, 0.0, 0.0]) == response("a")
+
+    real_time = __import__("time").time
+    monkeypatch.setattr("ollama_client.core.cache.time.time", lambda: real_time() + 120)
+    assert cache.lookup("generate", "llama3", [1.0, 0.0, 0.0]) is None
+    assert len(cache) == 1
+
+def test_save_and_load(tmp_path):
+    """Entries survive a restart; a cache built with another embedder is ignored"""
+    path = str(tmp_path / "cache.json")
+    cache = SemanticCache(path=path)
+    cache.store("chat", "llama3", [0.6, 0.8], response("Paris"))
+    cache.save()
+
+    restored = SemanticCache(path=path)
+    assert restored.lookup("chat", "llama3", [0.6, 0.8]) == response("Paris")
+
+    assert len(SemanticCache(embed_model="other", path=path)) == 0
+
+def test_lsh_index_finds_near_neighbours():
+    """The approximate index finds a slightly perturbed stored vector"""
+    pytest.importorskip("numpy")
+    rng = random.Random(0)
+    vectors = [normalize([rng.gauss(0, 1) for _ in range(64)]) for _ in range(2000)]
+
+    index = LSHIndex(64)
+    for key, vector in enumerate(vectors):
+        index.add(key, vector)
+    for key in range(0, 2000, 2):
+        index.remove(key)
+
+    query = normalize([x + rng.gauss(0, 0.01) for x in vectors[1001]])
+    key, similarity = index.search(query)
+    assert key == 1001
+    assert similarity > 0.95
+
+def test_switches_to_approximate_index():
+    """A large partition is rebuilt as an LSH index"""
+    pytest.importorskip("numpy")
+    rng = random.Random(1)
+    cache = SemanticCache(approximate_above=50)
+    for i in range(60):
+        cache.store("generate", "llama3", [rng.gauss(0, 1) for _ in range(16)], response(str(i)))
+
+    assert isinstance(cache._indexes["generate:llama3"], LSHIndex)
+    vector = cache._entries[next(reversed(cache._entries))].vector
+    assert cache.lookup("generate", "llama3", vector) == response("59")
+
+@pytest.mark.asyncio
+async def test_async_client_uses_semantic_cache():
+    """A paraphrased prompt is answered from the cache without generating"""
+    embeddings = {
+        "What is the capital of France?": [1.0, 0.0],
+        "Which city is France's capital?": [0.98, 0.05],
+    }
+    calls = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        calls.append(request.url.path)
+        if request.url.path == "/api/embed":
+            assert body["model"] == "nomic-embed-text"
+            return httpx.Response(200, json={"embeddings": [embeddings[body["input"]]]})
+        return httpx.Response(200, json={"response": "Paris", "done": True, "eval_count": 1})
+
+    hits = CACHE_LOOKUPS.labels("llama3", "hit").value
+    async with AsyncOllamaClient(cache=SemanticCache()) as client:
+        await client._client.aclose()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        first = await client.generate("What is the capital of France?", temperature=0)
+        second = await client.generate("Which city is France's capital?", temperature=0)
+
+    assert first.text == second.text == "Paris"
+    assert calls == ["/api/embed", "/api/generate", "/api/embed"]
+    assert CACHE_LOOKUPS.labels("llama3", "hit").value == hits + 1
+
+@pytest.mark.asyncio
+async def test_cache_only_serves_identical_calls():
+    """Sampled calls, other options and model loads are never answered from the cache"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/api/embed":
+            return httpx.Response(200, json={"embeddings": [[1.0, 0.0]]})
+        return httpx.Response(200, json={"response": "Paris", "done": True})
+
+    async with AsyncOllamaClient(cache=SemanticCache()) as client:
+        await client._client.aclose()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        await client.generate("Capital of France?", temperature=0, max_tokens=1)
+        await client.generate("Capital of France?", temperature=0, max_tokens=512)
+        await client.generate("Capital of France?", temperature=0.7)
+        await client.generate("", temperature=0)
+
+    assert calls == [
+        "/api/embed", "/api/generate",
+        "/api/embed", "/api/generate",
+        "/api/generate",
+        "/api/generate",
+    ]
+    assert len(client.cache) == 2
+
+def test_options_partition_the_cache():
+    """A response is only reused with the generation options it was stored with"""
+    cache = SemanticCache()
+    cache.store("generate", "llama3", [1.0, 0.0], response("Paris"), {"max_tokens": 1})
+
+    assert cache.lookup("generate", "llama3", [1.0, 0.0], {"max_tokens": 1}) is not None
+    assert cache.lookup("generate", "llama3", [1.0, 0.0], {"max_tokens": 512}) is None
+    assert cache.lookup("generate", "llama3", [1.0, 0.0]) is None
+
+def test_sync_client_saves_cache_on_close(tmp_path):
+    """The synchronous client persists its cache when closed"""
+    path = str(tmp_path / "cache.json")
+    with OllamaClient(cache=SemanticCache(path=path)) as client:
+        client.cache.store("generate", "llama3", [1.0, 0.0], response("Paris"))
+
+    assert len(SemanticCache(path=path)) == 1
+
+@pytest.mark.asyncio
+async def test_cache_is_bypassed_when_embedding_fails():
+    """Generation still works if the embedding model is unavailable"""
+    def handler(request):
+        if request.url.path == "/api/embed":
+            return httpx.Response(404, json={"error": "model not found"})
+        return httpx.Response(200, json={"response": "Paris", "done": True})
+
+    async with AsyncOllamaClient(cache=SemanticCache()) as client:
+        await client._client.aclose()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        assert (await client.generate("Hi")).text == "Paris"
+        assert len(client.cache) == 0
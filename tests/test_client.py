@@ -1,8 +1,15 @@
+import json
+
 import pytest
 import httpx
 from unittest.mock import patch, MagicMock
 
-from ollama_client.core.client import OllamaClient, ModelInfo, GenerationResponse
+from ollama_client.core.client import (
+    AsyncOllamaClient,
+    GenerationResponse,
+    ModelInfo,
+    OllamaClient,
+)
 
 @pytest.fixture
 def client():
@@ -67,8 +74,8 @@ def test_generate(mock_client, client):
         json={
             "model": "llama3",
             "prompt": "Hello, how are you?",
-            "temperature": 0.7,
-            "max_tokens": 512
+            "options": {"temperature": 0.7, "num_predict": 512},
+            "stream": False
         },
         headers={"Content-Type": "application/json"}
     )
@@ -166,8 +173,8 @@ def test_chat(mock_client, client):
         json={
             "model": "llama3",
             "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": 512
+            "options": {"temperature": 0.7, "num_predict": 512},
+            "stream": False
         },
         headers={"Content-Type": "application/json"}
     )
@@ -197,4 +204,71 @@ def test_health(mock_client, client):
     health_status = client.health()
 
     # Assertions
-    assert health_status is False
\ No newline at end of file
+    assert health_status is False
+
+@pytest.mark.asyncio
+async def test_async_client_reuses_connection_pool():
+    """Test that AsyncOllamaClient sends every call through one shared pool"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": "llama3", "size": 1}]})
+        return httpx.Response(200, json={
+            "response": "Hi!",
+            "done": True,
+            "eval_count": 3,
+            "eval_duration": 1500
+        })
+
+    async with AsyncOllamaClient(host="http://localhost:11434/") as client:
+        pool = client._client
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await pool.aclose()
+
+        response = await client.generate("Hello", model="llama3")
+        models = await client.list_models()
+
+    assert response.text == "Hi!"
+    assert response.eval_count == 3
+    assert [m.name for m in models] == ["llama3"]
+    assert client._client.is_closed
+
+    assert str(requests[0].url) == "http://localhost:11434/api/generate"
+    assert json.loads(requests[0].content) == {
+        "model": "llama3",
+        "prompt": "Hello",
+        "options": {"temperature": 0.7, "num_predict": 512},
+        "stream": False
+    }
+
+@pytest.mark.asyncio
+async def test_async_client_generate_stream():
+    """Test that generate_stream yields each NDJSON chunk from Ollama"""
+    body = b'{"response": "Hel", "done": false}\n{"response": "lo", "done": false}\n\n' \
+           b'{"response": "", "done": true, "eval_count": 2}\n'
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, content=body)
+
+    async with AsyncOllamaClient() as client:
+        await client._client.aclose()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        chunks = [chunk async for chunk in client.generate_stream("Hello")]
+
+    assert [c["response"] for c in chunks] == ["Hel", "lo", ""]
+    assert chunks[-1]["eval_count"] == 2
+
+def test_generate_stream(client):
+    """Test that the sync generate_stream yields each NDJSON chunk and closes the response"""
+    body = b'{"response": "Hel", "done": false}\n\n{"response": "lo", "done": true}\n'
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    real_client = httpx.Client
+
+    with patch("httpx.Client", lambda **kwargs: real_client(transport=transport, **kwargs)):
+        chunks = list(client.generate_stream("Hello"))
+
+    assert [c["response"] for c in chunks] == ["Hel", "lo"]
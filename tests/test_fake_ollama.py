@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from ollama_client.core.client import AsyncOllamaClient, OllamaClient
+from ollama_client.utils.fake_ollama import FakeOllama
+
+
+def test_generate_and_chat(fake_ollama):
+    """Test non-streaming replies over real HTTP"""
+    client = OllamaClient(host=fake_ollama.url)
+
+    response = client.generate("Hello", max_tokens=5)
+    assert response.eval_count == 5
+    assert len(response.text.split()) == 5
+    # Deterministic: the same prompt gets the same reply
+    assert client.generate("Hello", max_tokens=5).text == response.text
+
+    reply = client.chat([{"role": "user", "content": "Hello"}], temperature=0.2)
+    assert len(reply.text.split()) == fake_ollama.tokens
+    assert reply.done
+    # Settings reach the server in options, where Ollama reads them
+    assert fake_ollama.temperatures[-1] == 0.2
+
+
+def test_stream_ndjson(fake_ollama):
+    """Test that streams send one token per line and a final line with usage"""
+    client = OllamaClient(host=fake_ollama.url)
+
+    chunks = list(client.chat_stream([{"role": "user", "content": "Hi"}], max_tokens=3))
+
+    assert len(chunks) == 4
+    assert all(not chunk["done"] and chunk["message"]["content"] for chunk in chunks[:3])
+    assert chunks[-1]["done"] and chunks[-1]["done_reason"] == "length"
+    assert chunks[-1]["eval_count"] == 3
+
+
+def test_models_show_and_embed(fake_ollama):
+    """Test the model listing, model details and embedding endpoints"""
+    client = OllamaClient(host=fake_ollama.url)
+
+    assert [m.name for m in client.list_models()] == fake_ollama.models
+    vectors = client.embed(["a", "b"])
+    assert len(vectors) == 2 and len(vectors[0]) == fake_ollama.embedding_size
+    assert vectors[0] == client.embed("a")[0]
+
+    show = httpx.post(f"{fake_ollama.url}/api/show", json={"model": "llama3"})
+    assert show.json()["details"]["family"] == "llama"
+    missing = httpx.post(f"{fake_ollama.url}/api/show", json={"model": "nope"})
+    assert missing.status_code == 404
+
+
+def test_load_delay_and_ps(fake_ollama):
+    """Test that only the first request pays the load time and loaded models are listed"""
+    fake_ollama.load_delay = 0.2
+    client = OllamaClient(host=fake_ollama.url)
+
+    assert httpx.get(f"{fake_ollama.url}/api/ps").json() == {"models": []}
+    assert client.generate("Hi").load_duration >= 0.2e9
+    assert client.generate("Hi").load_duration < 0.1e9
+    assert fake_ollama.loads == 1
+
+    (running,) = httpx.get(f"{fake_ollama.url}/api/ps").json()["models"]
+    assert running["name"] == "llama3"
+
+
+@pytest.mark.asyncio
+async def test_parallel_slots_and_token_rate(fake_ollama):
+    """Test that requests beyond the parallel slots wait, and tokens come at the rate"""
+    fake_ollama.parallel = 2
+    fake_ollama.token_rate = 100
+    fake_ollama.tokens = 10
+
+    async with AsyncOllamaClient(host=fake_ollama.url) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client.generate(f"prompt {i}") for i in range(4)))
+        elapsed = time.perf_counter() - started
+
+    assert fake_ollama.peak_active == 2
+    # Two rounds of 10 tokens at 100 per second
+    assert 0.18 < elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_release_without_acquire():
+    """Test that releasing a slot that was never taken does nothing"""
+    fake = FakeOllama(parallel=1)
+    await fake.release()
+    assert fake.active == 0
+
+    await fake.acquire()
+    await fake.release()
+    assert fake.active == 0
+
+
+@pytest.mark.asyncio
+async def test_error_injection(fake_ollama):
+    """Test injected HTTP errors and streams breaking off halfway"""
+    async with AsyncOllamaClient(host=fake_ollama.url) as client:
+        fake_ollama.error_rate = 1.0
+        fake_ollama.error_status = 503
+        with pytest.raises(httpx.HTTPStatusError) as error:
+            await client.generate("Hi")
+        assert error.value.response.status_code == 503
+
+        fake_ollama.error_rate = 0.0
+        fake_ollama.stream_error_rate = 1.0
+        chunks = [chunk async for chunk in client.generate_stream("Hi")]
+
+    assert "error" in chunks[-1]
+    assert len(chunks) == fake_ollama.tokens // 2 + 1
+
+
+def test_empty_prompt_loads_the_model(fake_ollama):
+    """Test that an empty prompt only loads the model, as Ollama does"""
+    response = httpx.post(
+        f"{fake_ollama.url}/api/generate", json={"model": "llama3", "prompt": "", "stream": False}
+    )
+
+    assert json.loads(response.text)["done_reason"] == "load"
+    assert fake_ollama.loads == 1
@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import pytest
+
+from ollama_client.core.cache import SemanticCache
+from ollama_client.core.client import AsyncOllamaClient
+from ollama_client.core.hedging import (
+    HedgeBudget,
+    HedgedOllamaClient,
+    LatencyTracker,
+    connect,
+)
+from ollama_client.utils.fake_ollama import FakeOllama
+
+
+@pytest.fixture
+def hosts():
+    """A slow Ollama, taking a second to its first token, and a fast one"""
+    with FakeOllama(load_delay=1.0) as slow, FakeOllama() as fast:
+        yield slow, fast
+
+
+@pytest.mark.asyncio
+async def test_hedged_stream_wins_against_slow_host(hosts):
+    """Test that a hedge is sent after the delay and the slow stream is cancelled"""
+    slow, fast = hosts
+    async with HedgedOllamaClient([slow.url, fast.url], initial_delay=0.1) as client:
+        started = time.perf_counter()
+        chunks = [chunk async for chunk in client.generate_stream(prompt="Hi")]
+        elapsed = time.perf_counter() - started
+
+    assert chunks[-1]["done"] and len(chunks) == fast.tokens + 1
+    assert elapsed < 0.8
+    assert client.stats == {"requests": 1, "hedged": 1, "won": 1, "throttled": 0}
+    assert slow.requests == fast.requests == 1
+    await asyncio.sleep(0.1)
+    assert slow.active == 0
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_for_fast_host(hosts):
+    """Test that a request answering within the delay is sent once"""
+    slow, fast = hosts
+    async with HedgedOllamaClient([fast.url, slow.url], initial_delay=0.5) as client:
+        response = await client.generate(prompt="Hi")
+
+    assert response.eval_count == fast.tokens
+    assert client.stats["hedged"] == 0
+    assert slow.requests == 0
+
+
+@pytest.mark.asyncio
+async def test_long_generation_is_not_hedged():
+    """Test that a generation streaming its first token in time is sent once, however long"""
+    with FakeOllama(token_rate=40) as fake:
+        async with HedgedOllamaClient([fake.url, fake.url], initial_delay=0.1) as client:
+            started = time.perf_counter()
+            response = await client.generate(prompt="Hi")
+            elapsed = time.perf_counter() - started
+
+    assert elapsed > 0.1
+    assert response.eval_count == fake.tokens and response.done
+    assert client.stats["hedged"] == 0
+    assert fake.requests == 1
+
+
+@pytest.mark.asyncio
+async def test_budget_throttles_hedges(hosts):
+    """Test that no hedge is sent once the budget is spent"""
+    slow, fast = hosts
+    async with HedgedOllamaClient(
+        [slow.url, fast.url], initial_delay=0.05, budget=0.0, burst=0.0
+    ) as client:
+        response = await client.chat(messages=[{"role": "user", "content": "Hi"}])
+
+    assert response.text
+    assert client.stats["throttled"] == 1
+    assert fast.requests == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_hedge_falls_back_to_primary(hosts):
+    """Test that the slow request still answers when its hedge fails"""
+    slow, fast = hosts
+    slow.load_delay = 0.3
+    fast.error_rate = 1.0
+    async with HedgedOllamaClient([slow.url, fast.url], initial_delay=0.05) as client:
+        stream = client.chat_stream(messages=[{"role": "user", "content": "Hi"}])
+        chunks = [chunk async for chunk in stream]
+
+    assert chunks[-1]["done"]
+    assert client.stats["hedged"] == 1 and client.stats["won"] == 0
+
+
+def test_delay_follows_percentile():
+    """Test the hedge delay: initial, then the percentile within its bounds"""
+    client = HedgedOllamaClient(
+        ["http://a", "http://b"], percentile=0.9, initial_delay=1.0, min_delay=0.01, min_samples=10
+    )
+    assert client.delay("generate") == 1.0
+
+    tracker = client._trackers.setdefault("generate", LatencyTracker(min_samples=10))
+    for ms in range(1, 101):
+        tracker.observe(ms / 1000)
+    assert client.delay("generate") == pytest.approx(0.091)
+
+    client.max_delay = 0.05
+    assert client.delay("generate") == 0.05
+
+
+def test_budget():
+    """Test that hedges are limited to the budget's share of requests"""
+    budget = HedgeBudget(ratio=0.25, burst=1.0)
+    hedges = 0
+    for _ in range(100):
+        budget.deposit()
+        hedges += budget.withdraw()
+
+    assert hedges == 25
+
+
+def test_connect():
+    """Test that several comma-separated hosts give a hedging client"""
+    assert isinstance(connect("http://a:11434"), AsyncOllamaClient)
+
+    client = connect("http://a:11434, http://b:11434", {"percentile": 0.5})
+    assert isinstance(client, HedgedOllamaClient)
+    assert [c.host for c in client.clients] == ["http://a:11434", "http://b:11434"]
+    assert client.percentile == 0.5
+
+
+@pytest.mark.asyncio
+async def test_cache_is_saved_once(tmp_path, monkeypatch):
+    """Test that the hosts share the hedging client's cache, saved once on close"""
+    saves = []
+    cache = SemanticCache(path=str(tmp_path / "cache.json"))
+    monkeypatch.setattr(cache, "save", lambda: saves.append(1))
+
+    client = connect("http://a:11434,http://b:11434", cache=cache)
+    assert client.cache is cache
+    assert all(c.cache is None for c in client.clients)
+    await client.aclose()
+    assert saves == [1]
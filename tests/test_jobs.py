@@ -0,0 +1,247 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock
+
+from ollama_client.core.client import AsyncOllamaClient
+from ollama_client.interfaces.rest.jobs import JobQueue, JobQueueFull, SQLiteJobStore
+from ollama_client.interfaces.rest.schemas import JobRequest
+
+
+@pytest.fixture
+def client():
+    client = MagicMock(spec=AsyncOllamaClient)
+
+    async def generate_stream(**kwargs):
+        for token in ("Hello", " ", "world"):
+            await asyncio.sleep(0.01)
+            yield {"response": token, "done": False}
+        yield {"response": "", "done": True, "eval_count": 3, "eval_duration": 1_000_000_000}
+
+    client.generate_stream.side_effect = generate_stream
+    return client
+
+
+async def wait_for(queue, job_id, status, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while (job := await queue.get(job_id)).status != status:
+        assert asyncio.get_running_loop().time() < deadline, job.status
+        await asyncio.sleep(0.01)
+    return job
+
+
+@pytest.mark.asyncio
+async def test_job_runs_to_completion(client):
+    """Test that a submitted job is picked up by a worker and completed"""
+    queue = JobQueue(client, workers=2)
+    await queue.start()
+    try:
+        job = queue.submit(JobRequest(prompt="Hi"))
+        assert job.status == "queued"
+
+        job = await wait_for(queue, job.id, "succeeded")
+        assert job.text == "Hello world"
+        assert job.result["eval_count"] == 3
+        assert job.result["tokens_per_second"] == 3.0
+        assert job.started_at is not None and job.finished_at is not None
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_subscribe_replays_and_follows_live_tokens(client):
+    """Test that a subscriber gets text so far, then live tokens, then done"""
+    queue = JobQueue(client, workers=1)
+    await queue.start()
+    try:
+        job = queue.submit(JobRequest(prompt="Hi"))
+        await asyncio.sleep(0.015)
+
+        events = [event async for event in queue.subscribe(job.id)]
+
+        assert "".join(e["text"] for e in events if e["type"] == "token") == "Hello world"
+        assert events[-1]["type"] == "done"
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_stream_fails_job():
+    """Test that an error chunk or a stream cut off before done fails the job"""
+    client = MagicMock(spec=AsyncOllamaClient)
+
+    async def failing_stream(**kwargs):
+        yield {"response": "Hello", "done": False}
+        yield {"error": "model crashed"}
+
+    async def cut_off_stream(**kwargs):
+        yield {"response": "Hello", "done": False}
+
+    queue = JobQueue(client, workers=1)
+    await queue.start()
+    try:
+        for stream, message in [
+            (failing_stream, "model crashed"),
+            (cut_off_stream, "ended before the final chunk"),
+        ]:
+            client.generate_stream.side_effect = stream
+            job = queue.submit(JobRequest(prompt="Hi"))
+            job = await wait_for(queue, job.id, "failed")
+            assert message in job.error
+            assert job.result is None
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancel_running_job_closes_upstream():
+    """Test that cancelling a running job stops its upstream stream"""
+    closed = asyncio.Event()
+    client = MagicMock(spec=AsyncOllamaClient)
+
+    async def endless_stream(**kwargs):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield {"response": "x", "done": False}
+        finally:
+            closed.set()
+
+    client.generate_stream.side_effect = endless_stream
+
+    queue = JobQueue(client, workers=1)
+    await queue.start()
+    try:
+        job = queue.submit(JobRequest(prompt="Hi"))
+        await wait_for(queue, job.id, "running")
+        await asyncio.sleep(0.05)
+
+        assert (await queue.cancel(job.id)).status == "cancelled"
+        await asyncio.wait_for(closed.wait(), 1)
+
+        # The worker is free for new work
+        await asyncio.sleep(0)
+        assert queue._running == {}
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_limit(client):
+    """Test that submit refuses work beyond max_queued"""
+    queue = JobQueue(client, workers=1, max_queued=1)
+    queue.submit(JobRequest(prompt="one"))
+
+    with pytest.raises(JobQueueFull):
+        queue.submit(JobRequest(prompt="two"))
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_survives_restart(client, tmp_path):
+    """Test that queued jobs in a SQLite store are resumed after a restart"""
+    path = str(tmp_path / "jobs.db")
+
+    # Submit without ever starting workers, then "crash"
+    queue = JobQueue(client, store=SQLiteJobStore(path), workers=1)
+    job = queue.submit(JobRequest(prompt="Hi"))
+    await queue.stop()
+
+    queue = JobQueue(client, store=SQLiteJobStore(path), workers=1)
+    await queue.start()
+    try:
+        assert (await wait_for(queue, job.id, "succeeded")).text == "Hello world"
+    finally:
+        await queue.stop()
+
+    # Finished jobs are read back from the database
+    store = SQLiteJobStore(path)
+    assert store.get(job.id).status == "succeeded"
+    assert store.queued() == 0
+    store.close()
+
+
+@pytest.fixture
+def workers(client, tmp_path):
+    """Two job queues sharing one SQLite store, like two API worker processes"""
+    path = str(tmp_path / "jobs.db")
+    return [
+        JobQueue(client, store=SQLiteJobStore(path), workers=2, poll_interval=0.02)
+        for _ in range(2)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_shared_store_runs_each_job_once(client, workers):
+    """Test that jobs in a shared store are claimed by exactly one worker"""
+    first, second = workers
+    jobs = [first.submit(JobRequest(prompt=str(i))) for i in range(6)]
+    await asyncio.gather(first.start(), second.start())
+    try:
+        for job in jobs:
+            await wait_for(second, job.id, "succeeded")
+        assert client.generate_stream.call_count == 6
+    finally:
+        await asyncio.gather(first.stop(), second.stop())
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_stream_from_another_worker(workers):
+    """Test that a job running in one worker is followed and cancelled from another"""
+    closed = asyncio.Event()
+    first, second = workers
+
+    async def endless_stream(**kwargs):
+        try:
+            while True:
+                await asyncio.sleep(0.005)
+                yield {"response": "x", "done": False}
+        finally:
+            closed.set()
+
+    first.client.generate_stream.side_effect = endless_stream
+    await first.start()
+    try:
+        job = second.submit(JobRequest(prompt="Hi"))
+        await wait_for(second, job.id, "running")
+        events = second.subscribe(job.id)
+        first_event = await events.__anext__()
+        assert first_event["type"] == "token"
+
+        assert (await second.cancel(job.id)).status == "cancelled"
+        await asyncio.wait_for(closed.wait(), 1)
+        rest = [event async for event in events]
+        assert rest[-1] == {"type": "cancelled"}
+
+        # The worker that ran the job does not overwrite the cancellation
+        await asyncio.sleep(0.05)
+        assert (await first.get(job.id)).status == "cancelled"
+        assert first._running == {}
+    finally:
+        await asyncio.gather(first.stop(), second.stop())
+
+
+@pytest.mark.asyncio
+async def test_stopped_worker_hands_jobs_back(workers):
+    """Test that a job running in a stopped worker is resumed by another"""
+    first, second = workers
+    client = first.client
+    generate_stream = client.generate_stream.side_effect
+    started = asyncio.Event()
+
+    async def slow_stream(**kwargs):
+        started.set()
+        await asyncio.sleep(10)
+        yield {"response": "never", "done": False}
+
+    client.generate_stream.side_effect = slow_stream
+    await first.start()
+    job = first.submit(JobRequest(prompt="Hi"))
+    await asyncio.wait_for(started.wait(), 1)
+    await first.stop()
+
+    client.generate_stream.side_effect = generate_stream
+    await second.start()
+    try:
+        assert (await wait_for(second, job.id, "succeeded")).text == "Hello world"
+    finally:
+        await second.stop()
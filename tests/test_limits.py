@@ -0,0 +1,190 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from ollama_client.interfaces.rest.limits import (
+    AdmissionController,
+    AdmissionMiddleware,
+    Overloaded,
+    RateLimiter,
+    TokenBucket,
+    client_key,
+    parse_api_keys,
+    record_usage,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable replacement for time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr("ollama_client.interfaces.rest.limits.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_refills(clock):
+    """Test that the bucket allows a burst, then refills at its rate"""
+    bucket = TokenBucket(rate=2.0, capacity=2.0)
+
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert bucket.try_acquire() == 0.0
+
+
+def test_rate_limiter_charges_tokens_after_the_fact(clock):
+    """Test that eval_count debt blocks the key until it is repaid"""
+    limiter = RateLimiter(tokens_per_second=10.0, token_burst=100.0)
+
+    assert limiter.check("a") == 0.0
+    limiter.record_tokens("a", 150)
+
+    # 50 tokens in debt: one token available again after 5.1 seconds
+    assert limiter.check("a") == pytest.approx(5.1)
+    assert limiter.check("b") == 0.0
+    assert limiter.snapshot()["rejected_tokens"] == 1
+
+    clock[0] += 5.1
+    assert limiter.check("a") == 0.0
+
+
+def test_rate_limiter_tracks_bounded_keys(clock):
+    """Test that only the most recent keys keep buckets"""
+    limiter = RateLimiter(requests_per_second=1.0, max_keys=2)
+
+    for key in ("a", "b", "c"):
+        limiter.check(key)
+
+    assert limiter.snapshot()["tracked_keys"] == 2
+
+
+@pytest.mark.asyncio
+async def test_admission_controller_queues_then_sheds():
+    """Test that excess requests queue up to max_queued, then get shed"""
+    admission = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout=1.0)
+    release = asyncio.Event()
+
+    async def hold():
+        async with admission.slot():
+            await release.wait()
+
+    first = asyncio.ensure_future(hold())
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(hold())
+    await asyncio.sleep(0)
+
+    assert admission.snapshot()["in_flight"] == 1
+    assert admission.snapshot()["queued"] == 1
+
+    with pytest.raises(Overloaded) as excinfo:
+        async with admission.slot():
+            pass
+    assert excinfo.value.retry_after > 0
+    assert admission.shed == 1
+
+    release.set()
+    await asyncio.gather(first, second)
+    assert admission.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_admission_controller_queue_timeout():
+    """Test that a request waiting longer than queue_timeout is shed"""
+    admission = AdmissionController(max_in_flight=1, max_queued=5, queue_timeout=0.01)
+
+    async with admission.slot():
+        with pytest.raises(Overloaded):
+            async with admission.slot():
+                pass
+
+    assert admission.snapshot()["queued"] == 0
+
+
+def limited_app(limiter=None, admission=None):
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware)
+    app.state.rate_limiter = limiter
+    app.state.admission = admission
+    app.state.release = asyncio.Event()
+
+    @app.post("/generate")
+    async def generate(request: Request):
+        await request.app.state.release.wait()
+        record_usage(request, 100)
+        return {"text": "ok"}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_middleware_rate_limits_per_key():
+    """Test that each API key gets its own request bucket and 429s carry Retry-After"""
+    app = limited_app(limiter=RateLimiter(requests_per_second=1.0, request_burst=1.0))
+    app.state.api_keys = parse_api_keys("a, b")
+    app.state.release.set()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        assert (await http.post("/generate", headers={"X-API-Key": "a"})).status_code == 200
+
+        limited = await http.post("/generate", headers={"X-API-Key": "a"})
+        assert limited.status_code == 429
+        assert limited.headers["Retry-After"] == "1"
+
+        assert (await http.post("/generate", headers={"X-API-Key": "b"})).status_code == 200
+        assert (await http.get("/health", headers={"X-API-Key": "a"})).status_code == 200
+
+
+def test_unlisted_api_keys_fall_back_to_address():
+    """Test that only allow-listed keys identify the caller"""
+    scope = {"client": ("10.0.0.1", 1234), "headers": [(b"x-api-key", b"made-up")]}
+    assert client_key(scope, {"a"}) == "ip:10.0.0.1"
+    assert client_key(scope, {"made-up"}) == "key:made-up"
+
+    scope["headers"] = [(b"authorization", b"Bearer a")]
+    assert client_key(scope, {"a"}) == "key:a"
+    assert client_key(scope) == "ip:10.0.0.1"
+
+
+@pytest.mark.asyncio
+async def test_middleware_charges_generated_tokens():
+    """Test that eval_count recorded by a route is charged to the caller"""
+    limiter = RateLimiter(tokens_per_second=10.0, token_burst=50.0)
+    app = limited_app(limiter=limiter)
+    app.state.release.set()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        assert (await http.post("/generate", headers={"X-API-Key": "a"})).status_code == 200
+        limited = await http.post("/generate", headers={"X-API-Key": "a"})
+
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 5
+
+
+@pytest.mark.asyncio
+async def test_middleware_sheds_load_with_503():
+    """Test that requests beyond the in-flight cap and queue get 503"""
+    admission = AdmissionController(max_in_flight=1, max_queued=0)
+    app = limited_app(admission=admission)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        running = asyncio.ensure_future(http.post("/generate"))
+        while admission.in_flight == 0:
+            await asyncio.sleep(0.001)
+
+        shed = await http.post("/generate")
+        assert shed.status_code == 503
+        assert "Retry-After" in shed.headers
+
+        app.state.release.set()
+        assert (await running).status_code == 200
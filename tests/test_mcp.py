@@ -1,15 +1,20 @@
 import pytest
+import pytest_asyncio
 import asyncio
 import websockets
 import json
+import os
 from unittest.mock import patch, MagicMock
 
 from ollama_client.interfaces.mcp.adapter import MCPAdapter
-from ollama_client.core.client import OllamaClient
+from ollama_client.core.client import AsyncOllamaClient, ModelInfo
+from ollama_client.core.streaming import coalesce_tokens
+from ollama_client.interfaces.mcp.protocol import JSONCodec
+from ollama_client.utils.metrics import CANCELLED
 
 @pytest.fixture
 def client():
-    return MagicMock(spec=OllamaClient)
+    return MagicMock(spec=AsyncOllamaClient)
 
 @pytest.fixture
 def adapter(client):
@@ -20,8 +25,8 @@ async def test_handle_list_models(adapter, client):
     """Test the handle_list_models method"""
     # Setup mock
     client.list_models.return_value = [
-        MagicMock(name="llama3", size=4200000000, modified_at="2023-11-09T12:34:56Z"),
-        MagicMock(name="mistral", size=8600000000, modified_at="2023-11-08T10:11:12Z")
+        ModelInfo(name="llama3", size=4200000000, modified_at="2023-11-09T12:34:56Z"),
+        ModelInfo(name="mistral", size=8600000000, modified_at="2023-11-08T10:11:12Z")
     ]
     
     # Call method
@@ -130,4 +135,395 @@ async def test_handle_chat_missing_messages(adapter, client):
     assert "Messages are required" in result["error"]
     
     # Verify mock was not called
-    client.chat.assert_not_called()
\ No newline at end of file
+    client.chat.assert_not_called()
+
+@pytest_asyncio.fixture
+async def server(adapter):
+    async with websockets.serve(
+        adapter.handle_connection, "localhost", 0, **adapter.serve_options()
+    ) as server:
+        port = server.sockets[0].getsockname()[1]
+        yield f"ws://localhost:{port}"
+
+@pytest.mark.asyncio
+async def test_requests_are_handled_concurrently(server, client):
+    """A slow generation does not delay later requests on the same connection"""
+    async def generate(prompt, **kwargs):
+        await asyncio.sleep(0.5 if prompt == "slow" else 0)
+        response = MagicMock()
+        response.text = prompt
+        return response
+
+    client.generate.side_effect = generate
+
+    async with websockets.connect(server) as ws:
+        assert json.loads(await ws.recv())["type"] == "tools"
+
+        await ws.send(json.dumps({"id": 1, "action": "generate", "prompt": "slow"}))
+        await ws.send(json.dumps({"id": 2, "action": "generate", "prompt": "fast"}))
+        await ws.send(json.dumps({"id": 3, "action": "bogus"}))
+
+        replies = [json.loads(await ws.recv()) for _ in range(3)]
+
+    by_id = {r["id"]: r for r in replies}
+    assert replies[-1]["id"] == 1
+    assert by_id[1]["result"]["text"] == "slow"
+    assert by_id[2]["result"]["text"] == "fast"
+    assert by_id[3]["error"] == "Unknown action: bogus"
+
+@pytest.mark.asyncio
+async def test_in_flight_limit_per_connection(adapter, server, client):
+    """No more than max_in_flight requests of one connection run at once"""
+    adapter.max_in_flight = 2
+    running = 0
+    peak = 0
+
+    async def generate(prompt, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        response = MagicMock()
+        response.text = prompt
+        return response
+
+    client.generate.side_effect = generate
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        for i in range(4):
+            await ws.send(json.dumps({"id": i, "action": "generate", "prompt": str(i)}))
+        replies = [json.loads(await ws.recv()) for _ in range(4)]
+
+    assert sorted(r["id"] for r in replies) == list(range(4))
+    assert peak == 2
+
+@pytest.mark.asyncio
+async def test_full_backlog_still_reads_cancels(adapter, server, client):
+    """Requests beyond the backlog are refused as busy, and cancels still get through"""
+    adapter.max_in_flight = 1
+    started = asyncio.Event()
+
+    async def generate(prompt, **kwargs):
+        started.set()
+        await asyncio.Event().wait()
+
+    client.generate.side_effect = generate
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        for i in range(2):
+            await ws.send(json.dumps({"id": i, "action": "generate", "prompt": str(i)}))
+        await started.wait()
+        request = {"jsonrpc": "2.0", "id": 2, "method": "generate", "params": {}}
+        await ws.send(json.dumps(request))
+        busy = json.loads(await ws.recv())
+        assert busy["id"] == 2 and busy["error"]["code"] == -32000
+
+        cancel = {"jsonrpc": "2.0", "id": 3, "method": "cancel", "params": {"id": 0}}
+        await ws.send(json.dumps([cancel]))
+        replies = [json.loads(await ws.recv()) for _ in range(2)]
+
+    assert {"id": 0, "result": {"status": "cancelled"}} in replies
+    assert [{"jsonrpc": "2.0", "id": 3, "result": {"cancelled": True}}] in replies
+
+async def tokens(*items, delay=0.0):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield {"type": "token", "text": item} if isinstance(item, str) else item
+
+@pytest.mark.asyncio
+async def test_coalesce_tokens_by_size():
+    """Buffered text is flushed at max_chars and before non-token events"""
+    events = coalesce_tokens(tokens("ab", "cd", "e", {"type": "done"}), max_delay=10, max_chars=4)
+    assert [e async for e in events] == [
+        {"type": "token", "text": "abcd"},
+        {"type": "token", "text": "e"},
+        {"type": "done"},
+    ]
+
+@pytest.mark.asyncio
+async def test_coalesce_tokens_by_time():
+    """Slow tokens are not held back longer than max_delay"""
+    events = coalesce_tokens(tokens("a", "b", delay=0.05), max_delay=0.01, max_chars=100)
+    assert [e["text"] async for e in events] == ["a", "b"]
+
+@pytest.mark.asyncio
+async def test_coalesce_tokens_reads_ahead_boundedly():
+    """A slow consumer stops the source from being read more than max_queued ahead"""
+    read = 0
+
+    async def source():
+        nonlocal read
+        for _ in range(1000):
+            read += 1
+            yield {"type": "token", "text": "x"}
+        yield {"type": "error", "error": "boom"}
+
+    events = coalesce_tokens(source(), max_delay=10, max_chars=1, max_queued=10)
+    assert (await events.__anext__())["text"] == "x"
+    await asyncio.sleep(0.01)
+    assert read <= 12
+
+    rest = [e async for e in events]
+    assert len(rest) == 1000 and rest[-1]["type"] == "error"
+
+@pytest.mark.asyncio
+async def test_streamed_generate(adapter, server, client):
+    """Streamed requests send coalesced deltas, then a result with usage"""
+    adapter.stream_chunk = 5
+
+    async def generate_stream(prompt, **kwargs):
+        for word in ["Hel", "lo", " wor", "ld"]:
+            yield {"response": word, "done": False}
+        yield {"response": "", "done": True, "eval_count": 4, "eval_duration": 10**9}
+
+    client.generate_stream = generate_stream
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"id": 7, "action": "generate", "prompt": "Hi", "stream": True}))
+        frames = []
+        while not frames or "result" not in frames[-1]:
+            frames.append(json.loads(await ws.recv()))
+
+    assert [f["delta"] for f in frames[:-1]] == ["Hello", " world"]
+    assert all(f["id"] == 7 for f in frames)
+    result = frames[-1]["result"]
+    assert result["status"] == "success"
+    assert result["eval_count"] == 4
+    assert result["tokens_per_second"] == 4
+    assert result["time_to_first_token"] <= result["duration"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failure,error", [
+    (RuntimeError("model crashed"), "model crashed"),
+    ({"error": "model crashed"}, "Ollama stream failed: model crashed"),
+    (None, "Ollama stream ended before the final chunk"),
+])
+async def test_streamed_chat_error(server, client, failure, error):
+    """An upstream failure, error chunk or cut-off ends the stream with an error result"""
+    async def chat_stream(messages, **kwargs):
+        yield {"message": {"content": "Hi"}, "done": False}
+        if isinstance(failure, Exception):
+            raise failure
+        if failure is not None:
+            yield failure
+
+    client.chat_stream = chat_stream
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        messages = [{"role": "user", "content": "Hi"}]
+        await ws.send(json.dumps({"id": 1, "action": "chat", "messages": messages, "stream": True}))
+        frames = [json.loads(await ws.recv()) for _ in range(2)]
+
+    assert frames[0] == {"id": 1, "delta": "Hi"}
+    assert frames[1]["result"] == {"error": error, "status": "error"}
+
+@pytest.mark.asyncio
+async def test_cancel_request(server, client):
+    """A cancel message stops the request and closes its upstream stream"""
+    closed = asyncio.Event()
+
+    async def generate_stream(prompt, **kwargs):
+        try:
+            while True:
+                yield {"response": "token ", "done": False}
+                await asyncio.sleep(0.01)
+        finally:
+            closed.set()
+
+    client.generate_stream = generate_stream
+    cancelled = CANCELLED.labels("mcp", "client").value
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"id": "a", "action": "generate", "prompt": "Hi", "stream": True}))
+        assert "delta" in json.loads(await ws.recv())
+        await ws.send(json.dumps({"id": "a", "action": "cancel"}))
+        await ws.send(json.dumps({"id": "unknown", "action": "cancel"}))
+
+        frame = json.loads(await ws.recv())
+        while "delta" in frame:
+            frame = json.loads(await ws.recv())
+
+    assert frame == {"id": "a", "result": {"status": "cancelled"}}
+    assert closed.is_set()
+    assert CANCELLED.labels("mcp", "client").value == cancelled + 1
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_requests(server, client):
+    """Closing the connection cancels its in-flight requests"""
+    started = asyncio.Event()
+    stopped = asyncio.Event()
+
+    async def generate(prompt, **kwargs):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        finally:
+            stopped.set()
+
+    client.generate.side_effect = generate
+    cancelled = CANCELLED.labels("mcp", "disconnect").value
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"id": 1, "action": "generate", "prompt": "Hi"}))
+        await asyncio.wait_for(started.wait(), 1)
+
+    await asyncio.wait_for(stopped.wait(), 1)
+    assert CANCELLED.labels("mcp", "disconnect").value == cancelled + 1
+
+def rpc(method, request_id=None, **params):
+    request = {"jsonrpc": "2.0", "method": method, "params": params}
+    if request_id is not None:
+        request["id"] = request_id
+    return request
+
+@pytest.mark.asyncio
+async def test_jsonrpc_batch_runs_concurrently(server, client):
+    """A batch runs its calls concurrently and is answered with one array"""
+    async def generate(prompt, **kwargs):
+        await asyncio.sleep(0.2)
+        response = MagicMock()
+        response.text = prompt
+        return response
+
+    client.generate.side_effect = generate
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        batch = [
+            rpc("generate", 1, prompt="a"),
+            rpc("generate", 2, prompt="b"),
+            rpc("generate", prompt="notification"),
+            rpc("bogus", 3),
+            {"jsonrpc": "2.0", "id": 4},
+        ]
+        started = asyncio.get_running_loop().time()
+        await ws.send(json.dumps(batch))
+        replies = json.loads(await ws.recv())
+        elapsed = asyncio.get_running_loop().time() - started
+
+    assert elapsed < 0.4
+    assert [r["id"] for r in replies] == [1, 2, 3, 4]
+    assert all(r["jsonrpc"] == "2.0" for r in replies)
+    assert replies[0]["result"]["text"] == "a"
+    assert replies[1]["result"]["text"] == "b"
+    assert replies[2]["error"]["code"] == -32601
+    assert replies[3]["error"]["code"] == -32600
+    assert client.generate.call_count == 3
+
+@pytest.mark.asyncio
+async def test_jsonrpc_errors_and_cancel(server, client):
+    """Parse errors use JSON-RPC framing once the client speaks it"""
+    async def generate(prompt, **kwargs):
+        await asyncio.sleep(10)
+
+    client.generate.side_effect = generate
+
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        await ws.send(json.dumps(rpc("list_tools", "t")))
+        assert "generate" in json.loads(await ws.recv())["result"]["tools"]
+
+        await ws.send("{not json")
+        assert json.loads(await ws.recv())["error"]["code"] == -32700
+
+        await ws.send(json.dumps(rpc("generate", "slow", prompt="Hi")))
+        await ws.send(json.dumps(rpc("cancel", "c", id="slow")))
+        replies = {r["id"]: r for r in [json.loads(await ws.recv()) for _ in range(2)]}
+
+    assert replies["c"]["result"] == {"cancelled": True}
+    assert replies["slow"]["result"] == {"status": "cancelled"}
+
+@pytest.mark.asyncio
+async def test_stdio_transport(adapter, client):
+    """Requests and replies are exchanged as lines over a pair of pipes"""
+    client.list_models.return_value = [ModelInfo(name="llama3", size=1, modified_at="now")]
+    server_in, client_out = os.pipe()
+    client_in, server_out = os.pipe()
+    server = asyncio.ensure_future(
+        adapter.serve_stdio(os.fdopen(server_in, "rb"), os.fdopen(server_out, "wb"))
+    )
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(client_in, "rb"))
+    with os.fdopen(client_out, "wb", buffering=0) as requests:
+        requests.write(json.dumps([rpc("list_models", 1), rpc("list_tools", 2)]).encode() + b"\n")
+        replies = json.loads(await asyncio.wait_for(reader.readline(), 1))
+
+    await asyncio.wait_for(server, 1)
+    assert replies[0]["result"]["models"][0]["name"] == "llama3"
+    assert replies[1]["id"] == 2
+    assert await reader.read() == b""
+
+@pytest.mark.asyncio
+async def test_permessage_deflate(adapter, server):
+    """Deflate is negotiated by default and can be turned off"""
+    async with websockets.connect(server) as ws:
+        assert json.loads(await ws.recv())["type"] == "tools"
+        assert [e.name for e in ws.protocol.extensions] == ["permessage-deflate"]
+    # Serialized once, not per connection
+    assert adapter.handshake(JSONCodec) is adapter.handshake(JSONCodec)
+
+    adapter.compression = None
+    async with websockets.serve(adapter.handle_connection, "localhost", 0, **adapter.serve_options()) as plain:
+        port = plain.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://localhost:{port}") as ws:
+            await ws.recv()
+            assert ws.protocol.extensions == []
+
+@pytest.mark.asyncio
+async def test_msgpack_subprotocol(adapter, server, client):
+    """Clients offering mcp.msgpack get binary MessagePack frames"""
+    msgpack = pytest.importorskip("msgpack")
+    client.list_models.return_value = [ModelInfo(name="llama3", size=1, modified_at="now")]
+
+    async with websockets.connect(server, subprotocols=["mcp.msgpack"]) as ws:
+        assert ws.subprotocol == "mcp.msgpack"
+        assert msgpack.unpackb(await ws.recv())["type"] == "tools"
+
+        await ws.send(msgpack.packb({"id": 1, "action": "list_models"}))
+        reply = msgpack.unpackb(await ws.recv())
+
+    assert reply["result"]["models"][0]["name"] == "llama3"
+
+@pytest.mark.asyncio
+async def test_connection_limit(adapter, server):
+    """Handshakes beyond max_connections are refused with 503"""
+    adapter.max_connections = 1
+    async with websockets.connect(server) as ws:
+        await ws.recv()
+        with pytest.raises(websockets.InvalidStatus) as refused:
+            await websockets.connect(server)
+        assert refused.value.response.status_code == 503
+
+@pytest.mark.asyncio
+async def test_idle_connections_are_closed(adapter, server, client):
+    """Quiet connections are closed; one with a request in flight is kept"""
+    async def generate(prompt, **kwargs):
+        await asyncio.sleep(0.5)
+        response = MagicMock()
+        response.text = prompt
+        return response
+
+    client.generate.side_effect = generate
+    adapter.idle_timeout = 0.2
+    reaper = asyncio.ensure_future(adapter.close_idle())
+    try:
+        async with websockets.connect(server) as quiet, websockets.connect(server) as busy:
+            await quiet.recv()
+            await busy.recv()
+            await busy.send(json.dumps({"id": 1, "action": "generate", "prompt": "Hi"}))
+
+            with pytest.raises(websockets.ConnectionClosedOK):
+                await asyncio.wait_for(quiet.recv(), 1)
+            assert quiet.close_reason == "Idle timeout"
+            assert json.loads(await busy.recv())["result"]["text"] == "Hi"
+    finally:
+        reaper.cancel()
@@ -0,0 +1,182 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+
+from ollama_client.core.client import AsyncOllamaClient
+from ollama_client.interfaces.mcp.adapter import MCPAdapter
+from ollama_client.interfaces.rest.app import app
+from ollama_client.utils.metrics import (
+    CANCELLED_SECONDS_SAVED,
+    REGISTRY,
+    TOKENS_PER_SECOND,
+    MultiProcessMetrics,
+    Registry,
+    error_type,
+    observe_cancelled,
+    serve_metrics
+)
+
+
+def test_register_returns_existing_metric():
+    """Test that a name maps to one metric, of one type"""
+    registry = Registry()
+    requests = registry.counter("requests", "Requests served")
+
+    assert registry.counter("requests", "Requests served") is requests
+    with pytest.raises(ValueError, match="already registered as a counter"):
+        registry.gauge("requests", "Requests served")
+
+
+def test_render_exposition_format():
+    """Test counters, gauges and histograms in the text exposition format"""
+    registry = Registry()
+    requests = registry.counter("requests", "Requests served", ("route",))
+    connections = registry.gauge("connections", "Open connections")
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+
+    requests.labels("/generate").inc()
+    requests.labels("/generate").inc(2)
+    connections.inc()
+    latency.labels('/a"b').observe(0.05)
+    latency.labels('/a"b').observe(0.5)
+    latency.labels('/a"b').observe(5)
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE requests counter" in lines
+    assert 'requests_total{route="/generate"} 3' in lines
+    assert "connections 1" in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{route="/a\\"b"} 5.55' in lines
+    assert 'latency_seconds_count{route="/a\\"b"} 3' in lines
+
+
+def test_collectors_run_at_render_time():
+    """Test that collectors refresh gauges before rendering"""
+    registry = Registry()
+    queued = registry.gauge("queued", "Queued")
+    registry.add_collector(lambda: queued.set(7))
+
+    assert "queued 7" in registry.render()
+
+
+def test_multiprocess_metrics_are_summed(tmp_path):
+    """Test that any worker renders the totals, without the gauges of exited workers"""
+    workers = []
+    for served in (1, 2, 3):
+        registry = Registry()
+        registry.counter("requests", "Requests served", ("route",)).labels("/a").inc(served)
+        registry.gauge("connections", "Open connections").inc()
+        registry.histogram("latency_seconds", "Latency", buckets=(1.0,)).observe(0.5)
+        workers.append(MultiProcessMetrics(str(tmp_path), registry))
+
+    workers[0].save()
+    # The last worker has exited
+    workers[2].save()
+    os.utime(workers[2].path, (0, 0))
+    lines = workers[1].render().splitlines()
+
+    assert 'requests_total{route="/a"} 6' in lines
+    assert "connections 2" in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert "latency_seconds_count 3" in lines
+    assert lines.count("# TYPE requests counter") == 1
+
+
+def test_error_type():
+    """Test upstream error classification"""
+    response = httpx.Response(503, request=httpx.Request("POST", "http://x"))
+    assert error_type(httpx.HTTPStatusError("boom", request=response.request, response=response)) == "http_503"
+    assert error_type(httpx.ConnectError("refused")) == "connect"
+    assert error_type(httpx.ReadTimeout("slow")) == "timeout"
+    assert error_type(ValueError("bad")) == "ValueError"
+
+
+def test_cancelled_time_saved():
+    """Saved time is estimated from max_tokens and the mean token rate"""
+    observe_cancelled("mcp", "client", "saved-test", 100, elapsed=1.0)
+    assert CANCELLED_SECONDS_SAVED.labels("saved-test").value == 0
+
+    TOKENS_PER_SECOND.labels("saved-test").observe(20)
+    observe_cancelled("mcp", "client", "saved-test", 100, elapsed=1.0)
+    observe_cancelled("mcp", "client", "saved-test", 100, elapsed=10.0)
+    assert CANCELLED_SECONDS_SAVED.labels("saved-test").value == 4.0
+
+
+@pytest.mark.asyncio
+async def test_metrics_sidecar():
+    """Test the standalone /metrics listener used by the MCP adapter"""
+    registry = Registry()
+    registry.counter("pings", "Pings").inc()
+
+    server = await serve_metrics("127.0.0.1", 0, registry)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with httpx.AsyncClient() as http:
+            response = await http.get(f"http://127.0.0.1:{port}/metrics")
+            missing = await http.get(f"http://127.0.0.1:{port}/other")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "pings_total 1" in response.text
+    assert missing.status_code == 404
+
+
+def test_rest_metrics_endpoint():
+    """Test that REST requests show up per route template on /metrics"""
+    client = MagicMock(spec=AsyncOllamaClient)
+    client.health.return_value = True
+
+    with TestClient(app) as test_client:
+        with patch("ollama_client.interfaces.rest.routes.get_client", return_value=client):
+            test_client.get("/health")
+            test_client.get("/jobs/abc")
+
+        text = test_client.get("/metrics").text
+
+    assert 'ollama_client_request_duration_seconds_count{interface="rest",route="/health",status="200"}' in text
+    assert 'route="/jobs/{job_id}",status="404"' in text
+    assert 'ollama_client_queued_requests{interface="rest"} 0' in text
+    assert 'ollama_client_rejected_requests_total{reason="shed"} 0' in text
+
+
+@pytest.mark.asyncio
+async def test_client_records_ttft_and_tokens_per_second():
+    """Test that streaming calls record TTFT, token counts and speed per model"""
+    body = b'{"response": "a", "done": false}\n' \
+           b'{"response": "", "done": true, "eval_count": 40, "eval_duration": 2000000000}\n'
+
+    async with AsyncOllamaClient() as client:
+        await client._client.aclose()
+        client._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+        )
+        [chunk async for chunk in client.generate_stream("Hi", model="metrics-test")]
+
+    text = REGISTRY.render()
+    assert 'ollama_client_time_to_first_token_seconds_count{model="metrics-test"} 1' in text
+    assert 'ollama_client_generated_tokens_total{model="metrics-test"} 40' in text
+    assert 'ollama_client_tokens_per_second_bucket{model="metrics-test",le="20"} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_mcp_tool_latency():
+    """Test that MCP tool calls are timed per tool"""
+    adapter = MCPAdapter(client=MagicMock(), host="localhost", port=8080)
+    adapter.handlers["metrics_probe"] = lambda data: asyncio.sleep(0, {"status": "success"})
+
+    await adapter.call_handler("metrics_probe", {})
+
+    assert (
+        'ollama_client_request_duration_seconds_count{interface="mcp",route="metrics_probe",status="success"} 1'
+        in REGISTRY.render()
+    )
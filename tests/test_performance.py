@@ -0,0 +1,123 @@
+"""
+Performance benchmarks of the hot paths, against the fake Ollama server
+
+Each test times one operation with the ``latency_bench`` fixture. To check
+for regressions against the stored baseline::
+
+    pytest tests/test_performance.py --latency-json .benchmarks.json
+    python benchmarks/compare.py benchmarks/baseline.json .benchmarks.json
+"""
+import itertools
+import json
+import random
+from unittest.mock import patch
+
+import httpx
+import pytest
+import pytest_asyncio
+import websockets
+
+from ollama_client.core.cache import SemanticCache
+from ollama_client.core.client import AsyncOllamaClient
+from ollama_client.interfaces.mcp.adapter import MCPAdapter
+from ollama_client.interfaces.rest.app import app
+from ollama_client.utils.fake_ollama import reply_words
+from ollama_client.utils.metrics import Registry
+
+pytestmark = pytest.mark.benchmark
+
+STREAM_TOKENS = 256
+
+
+@pytest_asyncio.fixture
+async def client(fake_ollama):
+    async with AsyncOllamaClient(host=fake_ollama.url) as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_client_generate(latency_bench, client):
+    """One generate call through the shared connection pool"""
+    result = await latency_bench.run_async(lambda: client.generate("Hi", max_tokens=4))
+
+    assert result["median_us"] > 0
+
+
+@pytest.mark.asyncio
+async def test_stream_chunk_parsing(latency_bench):
+    """Parsing a streamed NDJSON reply, per chunk"""
+    lines = [
+        json.dumps({"model": "llama3", "response": token, "done": False})
+        for token in reply_words("Hi", STREAM_TOKENS)
+    ]
+    lines.append(json.dumps({"model": "llama3", "response": "", "done": True, "eval_count": STREAM_TOKENS}))
+    body = ("\n".join(lines) + "\n").encode()
+
+    async with AsyncOllamaClient() as client:
+        await client._client.aclose()
+        client._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+        )
+
+        async def consume():
+            chunks = 0
+            async for _ in client.generate_stream("Hi"):
+                chunks += 1
+            assert chunks == STREAM_TOKENS + 1
+
+        await latency_bench.run_async(consume, items=STREAM_TOKENS + 1)
+
+
+@pytest.mark.asyncio
+async def test_rest_generate(latency_bench, client):
+    """``POST /generate`` through the REST app, in process"""
+    transport = httpx.ASGITransport(app=app)
+    with patch("ollama_client.interfaces.rest.routes.get_client", return_value=client):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            async def generate():
+                response = await http.post("/generate", json={"prompt": "Hi", "max_tokens": 4})
+                assert response.status_code == 200
+
+            await latency_bench.run_async(generate)
+
+
+@pytest.mark.asyncio
+async def test_mcp_round_trip(latency_bench, client):
+    """A generate request and its reply over one MCP websocket"""
+    adapter = MCPAdapter(client=client, host="localhost", port=0)
+    ids = itertools.count()
+    async with websockets.serve(
+        adapter.handle_connection, "localhost", 0, **adapter.serve_options()
+    ) as server:
+        port = server.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://localhost:{port}") as ws:
+            await ws.recv()
+
+            async def round_trip():
+                request_id = next(ids)
+                await ws.send(json.dumps({
+                    "id": request_id, "action": "generate", "prompt": "Hi", "max_tokens": 4
+                }))
+                assert json.loads(await ws.recv())["id"] == request_id
+
+            await latency_bench.run_async(round_trip)
+
+
+def test_cache_lookup(latency_bench):
+    """A semantic cache lookup among 500 prompts of 32 dimensions"""
+    rng = random.Random(0)
+    cache = SemanticCache(threshold=0.99)
+    vectors = [[rng.gauss(0, 1) for _ in range(32)] for _ in range(500)]
+    for i, vector in enumerate(vectors):
+        cache.store("generate", "llama3", vector, {"text": str(i)})
+
+    latency_bench.run(lambda: cache.lookup("generate", "llama3", vectors[250]))
+
+    assert cache.lookup("generate", "llama3", vectors[250]) == {"text": "250"}
+
+
+def test_metrics_labels(latency_bench):
+    """Looking up a labelled metric and incrementing it"""
+    counter = Registry().counter("requests_total", "Requests", ("endpoint", "status"))
+
+    latency_bench.run(lambda: counter.labels("generate", "200").inc())
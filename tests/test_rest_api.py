@@ -1,14 +1,23 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
 from unittest.mock import patch, MagicMock
 
-from ollama_client.core.client import OllamaClient
+from ollama_client.core.client import AsyncOllamaClient, ModelInfo
 from ollama_client.interfaces.rest.app import app, get_client
+from ollama_client.interfaces.rest.serving import server_options, share_metrics, warm_up
+from ollama_client.interfaces.rest.streaming import NDJSON_MEDIA_TYPE, stream_response
 
 # Mock the get_client function to return our mock client
 @pytest.fixture
 def client():
-    return MagicMock(spec=OllamaClient)
+    return MagicMock(spec=AsyncOllamaClient)
 
 @pytest.fixture
 def test_client(client):
@@ -51,26 +60,9 @@ def test_health_endpoint_ollama_down(test_client, client):
 def test_list_models_endpoint(test_client, client):
     """Test the list models endpoint"""
     # Setup mock
-    model1 = MagicMock()
-    model1.name = "llama3"
-    model1.size = 4200000000
-    model1.modified_at = "2023-11-09T12:34:56Z"
-    model1.dict.return_value = {
-        "name": "llama3",
-        "size": 4200000000,
-        "modified_at": "2023-11-09T12:34:56Z"
-    }
-    
-    model2 = MagicMock()
-    model2.name = "mistral"
-    model2.size = 8600000000
-    model2.modified_at = "2023-11-08T10:11:12Z"
-    model2.dict.return_value = {
-        "name": "mistral",
-        "size": 8600000000,
-        "modified_at": "2023-11-08T10:11:12Z"
-    }
-    
+    model1 = ModelInfo(name="llama3", size=4200000000, modified_at="2023-11-09T12:34:56Z")
+    model2 = ModelInfo(name="mistral", size=8600000000, modified_at="2023-11-08T10:11:12Z")
+
     client.list_models.return_value = [model1, model2]
     
     # Make request
@@ -154,4 +146,429 @@ def test_chat_endpoint(test_client, client):
     assert kwargs["max_tokens"] == 512
     assert len(kwargs["messages"]) == 1
     assert kwargs["messages"][0]["role"] == "user"
-    assert kwargs["messages"][0]["content"] == "Hello, how are you?"
\ No newline at end of file
+    assert kwargs["messages"][0]["content"] == "Hello, how are you?"
+
+def test_lifespan_manages_shared_client():
+    """The app lifespan creates one shared client and closes it on shutdown"""
+    with TestClient(app) as test_client:
+        shared = app.state.ollama_client
+        assert isinstance(shared, AsyncOllamaClient)
+        assert not shared._client.is_closed
+
+    assert shared._client.is_closed
+
+@pytest.mark.asyncio
+async def test_generate_requests_run_concurrently(client):
+    """Slow generations must not serialize requests on the event loop"""
+    delay = 0.2
+    concurrency = 20
+
+    async def slow_generate(**kwargs):
+        await asyncio.sleep(delay)
+        response = MagicMock()
+        response.text = kwargs["prompt"]
+        return response
+
+    client.generate.side_effect = slow_generate
+
+    transport = httpx.ASGITransport(app=app)
+    with patch("ollama_client.interfaces.rest.routes.get_client", return_value=client):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                http.post("/generate", json={"prompt": f"prompt {i}"})
+                for i in range(concurrency)
+            ))
+            elapsed = time.perf_counter() - start
+
+    assert [r.status_code for r in responses] == [200] * concurrency
+    assert [r.json()["text"] for r in responses] == [
+        f"prompt {i}" for i in range(concurrency)
+    ]
+    # Serialized handling would take delay * concurrency (4s)
+    assert elapsed < delay * concurrency / 4
+
+def fake_generate_stream(*tokens, final=None):
+    """Build a generate_stream replacement yielding Ollama-style chunks"""
+    async def generate_stream(**kwargs):
+        for token in tokens:
+            yield {"response": token, "done": False}
+        yield {"response": "", "done": True, **(final or {})}
+    return generate_stream
+
+def test_generate_stream_sse(test_client, client):
+    """The generate endpoint streams SSE events when asked via Accept"""
+    client.generate_stream.side_effect = fake_generate_stream(
+        "Hello", " world", final={"eval_count": 2, "eval_duration": 1_000_000_000}
+    )
+
+    response = test_client.post(
+        "/generate",
+        json={"prompt": "Hi"},
+        headers={"Accept": "text/event-stream"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = [f for f in response.text.split("\n\n") if f]
+    assert frames[0] == 'event: token\ndata: {"type": "token", "text": "Hello"}'
+    assert frames[1].startswith("event: token\n")
+    assert frames[2].startswith("event: done\n")
+
+    done = json.loads(frames[2].split("data: ", 1)[1])
+    assert done["eval_count"] == 2
+    assert done["tokens_per_second"] == 2.0
+    client.generate.assert_not_called()
+
+def test_chat_stream_ndjson(test_client, client):
+    """The chat endpoint streams NDJSON when the body sets stream: true"""
+    async def chat_stream(**kwargs):
+        yield {"message": {"role": "assistant", "content": "Hi"}, "done": False}
+        yield {"message": {"role": "assistant", "content": ""}, "done": True, "eval_count": 1}
+
+    client.chat_stream.side_effect = chat_stream
+
+    response = test_client.post(
+        "/chat",
+        json={"messages": [{"role": "user", "content": "Hello"}], "stream": True}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events == [
+        {"type": "token", "text": "Hi"},
+        {"type": "done", "model": "llama3", "eval_count": 1},
+    ]
+
+def test_generate_stream_upstream_error(test_client, client):
+    """Errors before the first token are reported as a regular HTTP error"""
+    async def failing_stream(**kwargs):
+        raise httpx.ConnectError("connection refused")
+        yield
+
+    client.generate_stream.side_effect = failing_stream
+
+    response = test_client.post("/generate", json={"prompt": "Hi", "stream": True})
+
+    assert response.status_code == 500
+    assert "connection refused" in response.json()["detail"]
+
+def test_generate_stream_error_after_tokens(test_client, client):
+    """Errors after the first token, or a cut-off stream, end with an error event"""
+    async def failing_stream(**kwargs):
+        yield {"response": "Hello", "done": False}
+        yield {"error": "model crashed"}
+
+    async def cut_off_stream(**kwargs):
+        yield {"response": "Hello", "done": False}
+
+    for stream, message in [
+        (failing_stream, "model crashed"),
+        (cut_off_stream, "ended before the final chunk"),
+    ]:
+        client.generate_stream.side_effect = stream
+        response = test_client.post("/generate", json={"prompt": "Hi", "stream": True})
+
+        assert response.status_code == 200
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[0] == {"type": "token", "text": "Hello"}
+        assert events[-1]["type"] == "error"
+        assert message in events[-1]["error"]
+
+@pytest.mark.asyncio
+async def test_stream_closes_upstream_on_disconnect():
+    """A client disconnect closes the upstream Ollama stream"""
+    closed = asyncio.Event()
+
+    async def endless_stream():
+        try:
+            while True:
+                yield {"response": "token", "done": False}
+        finally:
+            closed.set()
+
+    response = await stream_response(
+        endless_stream(), lambda chunk: chunk["response"], "llama3", NDJSON_MEDIA_TYPE
+    )
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if len(sent) > 3:
+            raise OSError("client went away")
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(ClientDisconnect):
+        await response(scope, receive, send)
+
+    assert closed.is_set()
+
+def test_batch_endpoint(test_client, client):
+    """The batch endpoint streams one JSONL result per input line"""
+    async def generate(**kwargs):
+        # Finish in reverse order of submission
+        await asyncio.sleep(0.01 * (3 - int(kwargs["prompt"])))
+        response = MagicMock()
+        response.text = f"answer {kwargs['prompt']}"
+        response.eval_count = 1
+        response.eval_duration = 10
+        return response
+
+    client.generate.side_effect = generate
+    app.state.batch_concurrency = 4
+
+    body = "\n".join(
+        [json.dumps({"id": f"req-{i}", "prompt": str(i)}) for i in range(3)] + ["{broken"]
+    )
+    response = test_client.post(
+        "/batch", content=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["id"] for r in results] == [4, "req-2", "req-1", "req-0"]
+    assert results[0]["status"] == "error"
+    assert results[1]["text"] == "answer 2"
+
+def test_job_endpoints(client):
+    """Jobs can be enqueued, polled, streamed and cancelled over HTTP"""
+    async def generate_stream(**kwargs):
+        yield {"response": "Hello", "done": False}
+        yield {"response": "", "done": True, "eval_count": 1}
+
+    client.generate_stream.side_effect = generate_stream
+
+    with TestClient(app) as test_client:
+        app.state.job_queue.client = client
+
+        response = test_client.post("/jobs", json={"prompt": "Hi"})
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        events = [
+            json.loads(line)
+            for line in test_client.get(f"/jobs/{job_id}/stream").text.splitlines()
+        ]
+        assert events == [
+            {"type": "token", "text": "Hello"},
+            {"type": "done", "model": "llama3", "eval_count": 1},
+        ]
+
+        job = test_client.get(f"/jobs/{job_id}").json()
+        assert job["status"] == "succeeded"
+        assert job["text"] == "Hello"
+
+        assert test_client.delete(f"/jobs/{job_id}").status_code == 409
+        assert test_client.get("/jobs/missing").status_code == 404
+        assert test_client.post("/jobs", json={"type": "chat"}).status_code == 400
+
+def test_jobs_need_shared_store_with_several_workers(monkeypatch):
+    """Jobs are refused rather than split across workers' memory"""
+    monkeypatch.setenv("API_MODE", "prod")
+    monkeypatch.setenv("API_WORKERS", "4")
+    monkeypatch.delenv("JOB_STORE", raising=False)
+
+    with TestClient(app) as test_client:
+        response = test_client.post("/jobs", json={"prompt": "Hi"})
+
+    assert response.status_code == 503
+    assert "JOB_STORE" in response.json()["detail"]
+
+def test_ready_after_warm_up(client):
+    """/ready reports 503 until the upstream has answered once"""
+    with TestClient(app) as test_client:
+        app.state.ready = False
+        response = test_client.get("/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "starting"}
+
+        client.list_models.side_effect = [httpx.ConnectError("refused"), []]
+        asyncio.run(warm_up(app, client, model="llama3", max_delay=0))
+        assert client.list_models.call_count == 2
+        client.generate.assert_called_once_with(prompt="", model="llama3", max_tokens=1)
+
+        assert test_client.get("/ready").json() == {"status": "ready"}
+
+def test_server_options(monkeypatch):
+    """Dev mode reloads; prod mode runs tuned workers without reload"""
+    monkeypatch.delenv("API_MODE", raising=False)
+    assert server_options()["reload"] is True
+
+    monkeypatch.setenv("API_MODE", "prod")
+    monkeypatch.setenv("API_WORKERS", "3")
+    options = server_options()
+    assert "reload" not in options
+    assert options["workers"] == 3
+    assert options["timeout_keep_alive"] == 75
+    assert options["timeout_graceful_shutdown"] == 30
+    assert options["loop"] in ("uvloop", "asyncio")
+    assert options["http"] in ("httptools", "h11")
+
+def test_share_metrics(monkeypatch, tmp_path):
+    """Several workers get a metrics directory, emptied of a previous run"""
+    monkeypatch.setenv("API_MODE", "prod")
+    monkeypatch.setenv("API_WORKERS", "2")
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    (tmp_path / "old.json").write_text("[]")
+    share_metrics()
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.delenv("METRICS_DIR")
+    share_metrics()
+    assert os.path.isdir(os.environ["METRICS_DIR"])
+    os.rmdir(os.environ["METRICS_DIR"])
+
+def test_models_etag(test_client, client):
+    """/models carries an ETag and answers 304 when it still matches"""
+    client.list_models.return_value = [
+        ModelInfo(name="llama3", size=1, modified_at="2023-11-09T12:34:56Z")
+    ]
+
+    response = test_client.get("/models")
+    etag = response.headers["etag"]
+
+    cached = test_client.get("/models", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+
+    client.list_models.return_value = []
+    changed = test_client.get("/models", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json() == {"models": []}
+
+def test_large_responses_are_compressed(test_client, client):
+    """Buffered responses over the size threshold are gzip-compressed"""
+    client.list_models.return_value = [
+        ModelInfo(name=f"model-{i}", size=i, modified_at="2023-11-09T12:34:56Z")
+        for i in range(100)
+    ]
+
+    response = test_client.get("/models", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()["models"]) == 100
+
+    response = test_client.get("/models", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in response.headers
+
+def test_streams_are_not_compressed(test_client, client):
+    """Token streams bypass compression so each event is sent immediately"""
+    client.generate_stream.side_effect = fake_generate_stream(
+        "x" * 4096, final={"eval_count": 1}
+    )
+
+    response = test_client.post(
+        "/generate",
+        json={"prompt": "Hi", "stream": True},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+def fake_chat_stream(*tokens, block=None):
+    async def chat_stream(**kwargs):
+        for token in tokens:
+            yield {"message": {"role": "assistant", "content": token}, "done": False}
+        if block is not None:
+            await block.wait()
+        yield {"message": {"role": "assistant", "content": ""}, "done": True, "eval_count": 2}
+    return chat_stream
+
+def test_websocket_chat_keeps_history(client):
+    """Each turn sends only the new message; the server keeps the history"""
+    client.chat_stream.side_effect = fake_chat_stream("Hi", " there")
+
+    with patch("ollama_client.interfaces.rest.routes.get_client", return_value=client):
+        with TestClient(app) as test_client:
+            with test_client.websocket_connect("/ws/chat?model=mistral") as ws:
+                session = ws.receive_json()
+                assert session["type"] == "session"
+                assert session["model"] == "mistral"
+
+                ws.send_json({"type": "message", "content": "Hello"})
+                assert ws.receive_json() == {"type": "token", "text": "Hi"}
+                assert ws.receive_json() == {"type": "token", "text": " there"}
+                assert ws.receive_json()["type"] == "done"
+
+                ws.send_json({"type": "message", "content": "And again"})
+                while ws.receive_json()["type"] != "done":
+                    pass
+
+            assert client.chat_stream.call_args.kwargs["model"] == "mistral"
+            assert client.chat_stream.call_args.kwargs["messages"] == [
+                {"role": "user", "content": "Hello"},
+                {"role": "assistant", "content": "Hi there"},
+                {"role": "user", "content": "And again"},
+            ]
+
+            # Reconnecting with the session id resumes the conversation
+            url = f"/ws/chat?session_id={session['session_id']}"
+            with test_client.websocket_connect(url) as ws:
+                resumed = ws.receive_json()
+                assert resumed["session_id"] == session["session_id"]
+                assert resumed["messages"] == 4
+
+def test_websocket_chat_cut_off_reply(client):
+    """A reply cut off before its final chunk is an error and is not kept"""
+    async def cut_off_stream(**kwargs):
+        yield {"message": {"role": "assistant", "content": "Part"}, "done": False}
+
+    client.chat_stream.side_effect = cut_off_stream
+
+    with patch("ollama_client.interfaces.rest.routes.get_client", return_value=client):
+        with TestClient(app) as test_client:
+            with test_client.websocket_connect("/ws/chat") as ws:
+                ws.receive_json()
+                ws.send_json({"type": "message", "content": "Hello"})
+                assert ws.receive_json() == {"type": "token", "text": "Part"}
+                assert ws.receive_json()["type"] == "error"
+
+                client.chat_stream.side_effect = fake_chat_stream("Hi")
+                ws.send_json({"type": "message", "content": "Again"})
+                while ws.receive_json()["type"] != "done":
+                    pass
+
+            assert client.chat_stream.call_args.kwargs["messages"] == [
+                {"role": "user", "content": "Again"},
+            ]
+
+def test_websocket_chat_cancel(client):
+    """A cancel message stops the running generation"""
+    calls = []
+
+    async def chat_stream(**kwargs):
+        calls.append(kwargs["messages"])
+        try:
+            async for chunk in fake_chat_stream("Partial", block=asyncio.Event())():
+                yield chunk
+        finally:
+            calls.append("closed")
+
+    client.chat_stream.side_effect = chat_stream
+
+    with patch("ollama_client.interfaces.rest.routes.get_client", return_value=client):
+        with TestClient(app) as test_client:
+            with test_client.websocket_connect("/ws/chat") as ws:
+                ws.receive_json()
+                ws.send_json({"type": "message", "content": "Tell me a story"})
+                assert ws.receive_json() == {"type": "token", "text": "Partial"}
+
+                ws.send_json({"type": "message", "content": "Too early"})
+                assert ws.receive_json()["error"] == "A generation is already running"
+
+                ws.send_json({"type": "cancel"})
+                assert ws.receive_json() == {"type": "cancelled"}
+                assert calls[-1] == "closed"
+
+                ws.send_json({"type": "bogus"})
+                assert ws.receive_json()["type"] == "error"
+
+                ws.send_json({"type": "reset"})
+                assert ws.receive_json() == {"type": "reset"}
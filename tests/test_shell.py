@@ -1,4 +1,176 @@
 """
 test_shell.py
 """
+from io import StringIO
+from unittest.mock import MagicMock, patch
 
+import pytest
+from rich.console import Console
+
+from ollama_client.core.client import ModelInfo, OllamaClient
+from ollama_client.interfaces.shell import interactive
+from ollama_client.interfaces.shell.interactive import OllamaShell
+from ollama_client.interfaces.shell.render import LiveMarkdown, finished_blocks
+from ollama_client.interfaces.shell.sessions import SessionStore
+
+
+@pytest.fixture
+def output(monkeypatch):
+    buffer = StringIO()
+    monkeypatch.setattr(interactive, "console", Console(file=buffer, width=80))
+    return buffer
+
+
+@pytest.fixture
+def shell(output, tmp_path):
+    client = MagicMock(spec=OllamaClient)
+    client.health.return_value = True
+    client.list_models.return_value = [ModelInfo(name="llama3", size=1, modified_at="")]
+    return OllamaShell(client, sessions=SessionStore(str(tmp_path)), session_history=3)
+
+
+def stream(*chunks):
+    yield from chunks
+
+
+def turn(n):
+    return [{"role": "user", "content": f"q{n}"}, {"role": "assistant", "content": f"a{n}"}]
+
+
+def test_finished_blocks():
+    """Blocks end at blank lines outside code fences, once the next line arrives"""
+    assert finished_blocks("Intro\n\nSecond") == 0
+    assert finished_blocks("Intro\n\nSecond\n") == len("Intro\n\n")
+    assert finished_blocks("```\ncode\n\nmore\n") == 0
+    assert finished_blocks("```\ncode\n\nmore\n```\n\nAfter\n") == len("```\ncode\n\nmore\n```\n\n")
+    # An indented line may continue a list item
+    assert finished_blocks("- item\n\n  continued\n") == 0
+
+
+def test_live_markdown_prints_each_block_once():
+    """Finished blocks are printed above the live region, the rest on exit"""
+    buffer = StringIO()
+    console = Console(file=buffer, width=80)
+    with LiveMarkdown(console, fps=1000) as reply:
+        for token in ["# Title", "\n\n", "Some ", "**bold**", " text\n\n", "Last line"]:
+            reply.append(token)
+
+    assert reply.text == "# Title\n\nSome **bold** text\n\nLast line"
+    rendered = buffer.getvalue()
+    assert rendered.count("Title") == 1
+    assert "Some bold text" in rendered
+    assert "Last line" in rendered
+
+
+def test_query_streams_response(shell, output):
+    """do_query renders the streamed chunks"""
+    shell.client.generate_stream.return_value = stream(
+        {"response": "Hello"}, {"response": " there"}, {"response": "", "done": True}
+    )
+    shell.do_query("Hi")
+
+    shell.client.generate_stream.assert_called_once_with("Hi", model="llama3")
+    assert "Hello there" in output.getvalue()
+    assert "Error" not in output.getvalue()
+
+
+def test_chat_ctrl_c_stops_generation(shell, output):
+    """Ctrl-C closes the upstream stream and keeps the partial reply"""
+    closed = []
+
+    def chunks():
+        try:
+            yield {"message": {"content": "Partial"}}
+            raise KeyboardInterrupt
+        finally:
+            closed.append(True)
+
+    shell.client.chat_stream.return_value = chunks()
+    shell.do_chat("Hi")
+
+    assert closed == [True]
+    assert "Generation stopped" in output.getvalue()
+    assert shell.conversation == [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Partial"},
+    ]
+
+
+def test_chat_error_drops_message(shell, output):
+    """A failed turn leaves the history unchanged"""
+    shell.client.chat_stream.side_effect = ConnectionError("refused")
+    shell.do_chat("Hi")
+
+    assert shell.conversation == []
+    assert "refused" in output.getvalue()
+
+
+def test_chat_stream_error_drops_message(shell, output):
+    """An error chunk in the middle of the reply fails the turn too"""
+    shell.client.chat_stream.return_value = stream(
+        {"message": {"content": "Partial"}}, {"error": "model crashed"}
+    )
+    shell.do_chat("Hi")
+
+    assert shell.conversation == []
+    assert "model crashed" in output.getvalue()
+
+
+def test_session_log_tail(tmp_path):
+    """tail returns the last messages since the last reset"""
+    log = SessionStore(str(tmp_path)).open("work")
+    log.append(turn(1))
+    log.append(turn(2), reset=True)
+    log.append(turn(3))
+
+    assert log.tail(10) == turn(2) + turn(3)
+    assert log.tail(3) == turn(2)[1:] + turn(3)
+    assert log.tail(0) == []
+
+
+def test_session_log_repairs_torn_record(tmp_path):
+    """A half-written last record is dropped when the session is opened again"""
+    store = SessionStore(str(tmp_path))
+    store.open("work").append(turn(1))
+    with open(store.path("work"), "ab") as f:
+        f.write(b"\x00\x00\x00\x40{\"role\": \"us")
+
+    log = store.open("work")
+    assert log.tail(10) == turn(1)
+    log.append(turn(2))
+    assert log.tail(10) == turn(1) + turn(2)
+
+
+def test_session_names_are_checked(tmp_path):
+    with pytest.raises(ValueError):
+        SessionStore(str(tmp_path)).path("../escape")
+
+
+def test_save_and_load_session(shell, output):
+    """Saved sessions record each turn and resume with their recent messages"""
+    shell.client.chat_stream.side_effect = lambda messages, model: stream(
+        {"message": {"content": f"re: {messages[-1]['content']}"}}
+    )
+    shell.do_chat("one")
+    shell.do_save("work")
+    shell.do_chat("two")
+    shell.do_chat("three")
+
+    shell.conversation = []
+    shell.do_load("work")
+    assert shell.conversation == [
+        {"role": "assistant", "content": "re: two"},
+        {"role": "user", "content": "three"},
+        {"role": "assistant", "content": "re: three"},
+    ]
+
+    shell.do_reset("")
+    shell.do_chat("four")
+    shell.do_load("work")
+    assert shell.conversation == [
+        {"role": "user", "content": "four"},
+        {"role": "assistant", "content": "re: four"},
+    ]
+
+    shell.do_sessions("")
+    assert "work (current)" in output.getvalue()
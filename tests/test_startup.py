@@ -0,0 +1,50 @@
+"""
+Startup cost of the command-line entry points
+
+Each entry point is imported in a fresh interpreter. Heavy dependencies
+must not be imported until a command needs them, and the import must fit
+the time budget (generous, as CI machines are slow and noisy; measured
+locally at 35-60 ms).
+"""
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+ENTRY_POINTS = [
+    "ollama_client.main",
+    "ollama_client.interfaces.shell.cli",
+    "ollama_client.interfaces.shell.interactive",
+]
+
+# Imported by commands on first use, never at startup
+DEFERRED = ["httpx", "pydantic", "rich.markdown", "fastapi", "websockets", "ollama_client.core.client"]
+
+IMPORT_BUDGET_MS = 250
+
+
+def import_times(module: str) -> Dict[str, float]:
+    """Cumulative import time in ms of every module loaded by ``import module``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_entry_point_import_is_light(module):
+    """Entry points import no heavy dependencies and fit the startup budget"""
+    times = import_times(module)
+
+    assert [name for name in DEFERRED if name in times] == []
+    assert times[module] < IMPORT_BUDGET_MS
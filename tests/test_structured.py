@@ -0,0 +1,195 @@
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional
+from unittest.mock import patch
+
+import pytest
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+from ollama_client.core.client import AsyncOllamaClient, OllamaClient
+from ollama_client.core.exceptions import StructuredOutputError
+from ollama_client.core.hedging import HedgedOllamaClient
+from ollama_client.core.structured import JSONStreamParser, StructuredParser
+from ollama_client.utils.fake_ollama import sample_json
+
+
+class Address(BaseModel):
+    city: str
+    zip: Optional[str] = None
+
+
+class Person(BaseModel):
+    name: str
+    age: int = Field(ge=0, le=150)
+    tags: List[str]
+    address: Address
+
+
+class Strict(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    name: str = Field(pattern="^x+$")
+    notes: List[str] = Field(min_length=20)
+
+
+def feed_in_pieces(parser, text: str, seed: int = 0) -> bool:
+    rng = random.Random(seed)
+    done = False
+    i = 0
+    while i < len(text) and not done:
+        step = rng.randint(1, 6)
+        done = parser.feed(text[i:i + step])
+        i += step
+    return done
+
+
+@pytest.mark.parametrize("value", [
+    {"a": [1, -2.5e3, 0.25, True, False, None], "b": {}, "c": [], "d": {"e": [[]]}},
+    {"text": 'quote " backslash \\ slash / tab \t newline \n', "unicode": "é€😀"},
+    [1, "two", {"three": 3}],
+])
+def test_parser_builds_value_from_any_split(value):
+    """Test that the value is the same as json.loads, however the text is split"""
+    for ensure_ascii in (True, False):
+        text = json.dumps(value, ensure_ascii=ensure_ascii)
+        for seed in range(20):
+            parser = JSONStreamParser()
+            assert feed_in_pieces(parser, text, seed)
+            assert parser.value == json.loads(text)
+
+
+@pytest.mark.parametrize("text,offset", [
+    ('{"a" 1}', 5),
+    ('{"a": tru', None),
+    ('{"a": trux', 9),
+    ('[1, ]', 4),
+    ('{"a": 1,}', 8),
+    ('{1: 2}', 1),
+    ('{"a": "\x01"}', 7),
+    ('{"a": 01}', 8),
+    ('{"a": "\\x"}', 8),
+    ('[1 2]', 3),
+])
+def test_parser_fails_at_first_invalid_character(text, offset):
+    """Test that invalid text is rejected at the character that makes it invalid"""
+    parser = JSONStreamParser()
+    if offset is None:
+        assert parser.feed(text) is False
+        return
+    with pytest.raises(ValueError, match=f"offset {offset}:"):
+        parser.feed(text)
+
+
+def test_parser_reports_top_level_members_and_stops():
+    """Test the member callbacks and that text after the value is ignored"""
+    keys, members = [], []
+    parser = JSONStreamParser(on_key=keys.append, on_member=lambda k, v: members.append((k, v)))
+
+    assert parser.feed('{"a": {"b": 1}, "c"') is False
+    assert keys == ["a", "c"] and members == [("a", {"b": 1})]
+    assert parser.feed(': [2]} and then some text') is True
+    assert members[-1] == ("c", [2])
+    assert parser.value == {"a": {"b": 1}, "c": [2]}
+
+
+def test_structured_parser_returns_model():
+    """Test that the parsed value is returned as the model"""
+    value = {"name": "Ada", "age": 36, "tags": ["math"], "address": {"city": "London"}}
+    parser = StructuredParser(Person)
+    assert feed_in_pieces(parser, json.dumps(value))
+    assert parser.result() == Person.model_validate(value)
+
+
+def test_structured_parser_validates_once():
+    """Test that fields validated while parsing are not validated again"""
+    class Checked(BaseModel):
+        name: str
+
+        @field_validator("name")
+        @classmethod
+        def upper(cls, value: str) -> str:
+            return value.upper()
+
+    value = {"name": "Ada", "age": 36, "tags": ["math"], "address": {"city": "London"}}
+    with patch.object(Person, "model_validate", side_effect=AssertionError):
+        parser = StructuredParser(Person)
+        parser.feed(json.dumps(value))
+        assert isinstance(parser.result().address, Address)
+
+    # A model's own validators only run when the whole model is validated
+    parser = StructuredParser(Checked)
+    parser.feed('{"name": "ada"}')
+    assert parser.result().name == "ADA"
+
+
+def test_structured_parser_fails_early():
+    """Test that invalid fields, unknown fields and truncated output are rejected"""
+    parser = StructuredParser(Person)
+    with pytest.raises(StructuredOutputError, match="'age'"):
+        parser.feed('{"name": "Ada", "age": 200, "tags": [')
+    assert parser.text.endswith('"age": 200, "tags": [')
+
+    with pytest.raises(StructuredOutputError, match="Unexpected field 'other'"):
+        StructuredParser(Strict).feed('{"other"')
+
+    with pytest.raises(StructuredOutputError, match="Invalid JSON"):
+        StructuredParser(Person).feed('{"name": Ada')
+
+    parser = StructuredParser(Person)
+    parser.feed('{"name": "Ada"')
+    with pytest.raises(StructuredOutputError, match="ended before"):
+        parser.result()
+
+    parser = StructuredParser(Person)
+    parser.feed('{"name": "Ada"}')
+    with pytest.raises(StructuredOutputError, match="does not match Person"):
+        parser.result()
+
+
+@pytest.mark.asyncio
+async def test_generate_structured(fake_ollama):
+    """Test that the schema is sent as the format and the reply returned as the model"""
+    async with AsyncOllamaClient(host=fake_ollama.url) as client:
+        person = await client.generate_structured("Who?", Person)
+
+    expected = sample_json(Person.model_json_schema(), "Who?")
+    assert person == Person.model_validate(expected)
+
+
+def test_chat_structured_sync(fake_ollama):
+    """Test the synchronous client, and that a truncated reply raises"""
+    client = OllamaClient(host=fake_ollama.url)
+    messages = [{"role": "user", "content": "Who?"}]
+    assert isinstance(client.chat_structured(messages, Person), Person)
+
+    with pytest.raises(StructuredOutputError, match="ended before"):
+        client.chat_structured(messages, Person, max_tokens=3)
+
+
+@pytest.mark.asyncio
+async def test_invalid_output_stops_generation(fake_ollama):
+    """Test that generation is aborted as soon as a field fails validation"""
+    # The fake ignores the pattern, so the first field is already invalid
+    fake_ollama.token_rate = 50
+    async with AsyncOllamaClient(host=fake_ollama.url) as client:
+        started = time.perf_counter()
+        with pytest.raises(StructuredOutputError, match="'name'") as error:
+            await client.generate_structured("Who?", Strict)
+        elapsed = time.perf_counter() - started
+
+    full = json.dumps(sample_json(Strict.model_json_schema(), "Who?"))
+    assert len(error.value.text) < len(full)
+    assert elapsed < len(full) / 4 / 50
+    await asyncio.sleep(0.1)
+    assert fake_ollama.active == 0
+
+
+@pytest.mark.asyncio
+async def test_hedged_structured(fake_ollama):
+    """Test that the hedging client offers structured output too"""
+    async with HedgedOllamaClient([fake_ollama.url, fake_ollama.url]) as client:
+        person = await client.chat_structured([{"role": "user", "content": "Who?"}], Person)
+
+    assert isinstance(person, Person)